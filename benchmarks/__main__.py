@@ -0,0 +1,206 @@
+"""
+Benchmarks for taggregator, run from the repository root:
+
+    python3 -m benchmarks run --output before.json
+    python3 -m benchmarks run --output after.json
+    python3 -m benchmarks compare before.json after.json --threshold 0.1
+
+    python3 -m benchmarks jobs    # serial vs threads vs processes
+    python3 -m benchmarks iosched --directory /mnt/disk   # Cold reads in walk vs inode order
+    python3 -m benchmarks match   # Match memory use and de-duplication
+    python3 -m benchmarks prefilter --tags 1 10 100   # Prefilter time against tag count
+"""
+from benchmarks import corpus
+from benchmarks import iosched
+from benchmarks import jobs
+from benchmarks import match
+from benchmarks import prefilter
+from benchmarks import stages
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_corpus_arguments(parser):
+    defaults = corpus.CorpusSpec()
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--files", type=int, default=defaults.file_count)
+    parser.add_argument("--lines", type=int, default=defaults.lines_per_file)
+    parser.add_argument(
+        "--tag-density",
+        type=float,
+        default=defaults.tag_density,
+        help="Chance of each line holding a tag")
+    parser.add_argument("--depth", type=int, default=defaults.max_depth)
+    parser.add_argument(
+        "--binary",
+        type=float,
+        default=defaults.binary_fraction,
+        help="Fraction of files which are binary")
+    parser.add_argument(
+        "--non-utf8",
+        type=float,
+        default=defaults.non_utf8_fraction,
+        help="Fraction of files which aren't valid UTF-8")
+    parser.add_argument(
+        "--excluded",
+        type=float,
+        default=defaults.excluded_fraction,
+        help="Fraction of files inside excluded directories")
+
+
+def get_corpus_spec(args):
+    return corpus.CorpusSpec(
+        seed=args.seed,
+        file_count=args.files,
+        lines_per_file=args.lines,
+        tag_density=args.tag_density,
+        max_depth=args.depth,
+        binary_fraction=args.binary,
+        non_utf8_fraction=args.non_utf8,
+        excluded_fraction=args.excluded)
+
+
+def run(args):
+    spec = get_corpus_spec(args)
+    directory = tempfile.mkdtemp()
+
+    try:
+        corpus.generate(directory, spec)
+        stage_times, counts = stages.run_stages(directory, spec, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    result = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "corpus": spec.to_dict(),
+        "counts": counts,
+        "stages": stage_times,
+    }
+
+    for stage, seconds in stage_times.items():
+        print("%-10s%10.4f" % (stage, seconds))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+
+
+def get_regressions(base, new, threshold, min_seconds):
+    """
+    Stages which got slower by more than threshold (a fraction of the base time),
+    ignoring differences smaller than min_seconds which are just timer noise.
+    """
+    regressions = []
+
+    for stage, base_seconds in base["stages"].items():
+        new_seconds = new["stages"].get(stage)
+
+        if new_seconds is None:
+            continue
+
+        if new_seconds > base_seconds * \
+                (1 + threshold) and new_seconds - base_seconds > min_seconds:
+            regressions.append((stage, base_seconds, new_seconds))
+
+    return regressions
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+
+    with open(args.new) as f:
+        new = json.load(f)
+
+    if base.get("corpus") != new.get("corpus"):
+        print("Warning: the two runs used different corpora", file=sys.stderr)
+
+    for stage, base_seconds in base["stages"].items():
+        new_seconds = new["stages"].get(stage, float("nan"))
+        print("%-10s%10.4f%10.4f%+9.1f%%" % (stage, base_seconds,
+                                             new_seconds, (new_seconds / base_seconds - 1) * 100 if base_seconds else 0))
+
+    regressions = get_regressions(
+        base, new, args.threshold, args.min_seconds)
+
+    for stage, base_seconds, new_seconds in regressions:
+        print("REGRESSION: %s went from %.4fs to %.4fs" %
+              (stage, base_seconds, new_seconds), file=sys.stderr)
+
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="taggregator benchmarks")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser(
+        "run", help="Time each pipeline stage on a generated tree")
+    add_corpus_arguments(run_parser)
+    run_parser.add_argument("--repeat", type=int, default=3,
+                            help="Keep the fastest of this many runs of each stage")
+    run_parser.add_argument("--output", help="Write the results as JSON to this file")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Fail if any stage got slower between two runs")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Allowed slowdown as a fraction of the base time")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.002,
+                                help="Ignore slowdowns smaller than this")
+    compare_parser.set_defaults(function=compare)
+
+    jobs_parser = subparsers.add_parser(
+        "jobs", help="Compare serial, threaded and multiprocess scanning")
+    add_corpus_arguments(jobs_parser)
+    jobs_parser.set_defaults(
+        function=lambda args: jobs.run(get_corpus_spec(args)))
+
+    iosched_parser = subparsers.add_parser(
+        "iosched", help="Compare cold-cache reads in walk and inode order, with and without readahead")
+    add_corpus_arguments(iosched_parser)
+    iosched_parser.add_argument(
+        "--directory", help="Generate the tree in here, on the disk to measure")
+    iosched_parser.add_argument("--repeat", type=int, default=3)
+    iosched_parser.add_argument("--readahead", type=int, help="Files to hint ahead")
+    iosched_parser.add_argument("-j", "--jobs", type=int, default=1)
+    iosched_parser.set_defaults(
+        function=lambda args: iosched.run(
+            get_corpus_spec(args), args.directory, args.repeat, args.readahead, args.jobs))
+
+    match_parser = subparsers.add_parser(
+        "match", help="Measure Match memory use and de-duplication time")
+    match_parser.add_argument("--count", type=int, default=100000)
+    match_parser.set_defaults(function=lambda args: match.run(args.count))
+
+    prefilter_parser = subparsers.add_parser(
+        "prefilter", help="Time the prefilter against the number of tags")
+    prefilter_parser.add_argument(
+        "--tags", type=int, nargs="+", default=[1, 5, 10, 30, 100])
+    prefilter_parser.add_argument("--lines", type=int, default=20000)
+    prefilter_parser.set_defaults(
+        function=lambda args: prefilter.run(args.tags, args.lines))
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
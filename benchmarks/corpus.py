@@ -0,0 +1,110 @@
+"""
+Repeatable synthetic source trees for benchmarking.
+"""
+from taggregator import config
+import os
+import random
+
+TAGS = ["FEATURE", "HACK", "SPEED", "BUG", "CLEANUP", "REFACTOR"]
+PRIORITIES = ["LOW", "MEDIUM", "HIGH"]
+EXCLUDED_DIRS = ["vendor", "build"]
+
+
+class CorpusSpec:
+    def __init__(
+            self,
+            seed=0,
+            file_count=2000,
+            lines_per_file=200,
+            tag_density=0.01,
+            max_depth=4,
+            binary_fraction=0.02,
+            non_utf8_fraction=0.02,
+            excluded_fraction=0.2):
+        self.seed = seed
+        self.file_count = file_count
+        self.lines_per_file = lines_per_file
+        self.tag_density = tag_density  # Chance of any given line holding a tag
+        self.max_depth = max_depth
+        self.binary_fraction = binary_fraction
+        self.non_utf8_fraction = non_utf8_fraction
+        self.excluded_fraction = excluded_fraction  # Files put under EXCLUDED_DIRS
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def get_exclude(self):
+        return [d + "/" for d in EXCLUDED_DIRS]
+
+
+def get_config_map(root, spec):
+    """
+    The config_map tagg.run would get from config.UserConfig for a search of a tree
+    generated from spec in root, with the default config file rather than the user's.
+    """
+    config_map = config.get_default_config_json()
+    config_map.update(config.RUNTIME_OPTION_DEFAULTS)
+    config_map.update({
+        "root": root,
+        "roots": [root],
+        "exclude": spec.get_exclude(),
+        "tags": set(TAGS),
+        "priorities": PRIORITIES,
+        "stats": None,
+        "stats_json": False,
+    })
+
+    return config_map
+
+
+def get_line(rng, number, tag_density):
+    if rng.random() < tag_density:
+        return "    # @%s(%s) generated tag on line %d" % (
+            rng.choice(TAGS), rng.choice(PRIORITIES), number)
+
+    return "    value_%d = compute(value_%d, %d)  # nothing to see" % (
+        number, number - 1, rng.randrange(1000))
+
+
+def get_directory(rng, root, max_depth, excluded):
+    parts = [rng.choice(EXCLUDED_DIRS)] if excluded else []
+    parts += ["dir_%d" % rng.randrange(8)
+              for _ in range(rng.randrange(max_depth + 1))]
+
+    return os.path.join(root, *parts)
+
+
+def generate(root, spec):
+    """
+    Write the tree described by spec under root. The same spec always
+    produces the same tree. Returns the paths of every file written.
+    """
+    rng = random.Random(spec.seed)
+    files = []
+
+    for i in range(spec.file_count):
+        excluded = rng.random() < spec.excluded_fraction
+        directory = get_directory(rng, root, spec.max_depth, excluded)
+        os.makedirs(directory, exist_ok=True)
+        kind = rng.random()
+
+        if kind < spec.binary_fraction:
+            path = os.path.join(directory, "blob_%d.bin" % i)
+            contents = bytes(rng.randrange(256)
+                             for _ in range(spec.lines_per_file * 40))
+        else:
+            path = os.path.join(directory, "module_%d.py" % i)
+            lines = [get_line(rng, n, spec.tag_density)
+                     for n in range(spec.lines_per_file)]
+            contents = "\n".join(lines).encode("utf-8")
+
+            if kind < spec.binary_fraction + spec.non_utf8_fraction:
+                # Latin-1 text somewhere in the middle of the file
+                contents += "\n# caf\xe9\n".encode("latin-1")
+
+        with open(path, "wb") as f:
+            f.write(contents)
+
+        files.append(path)
+
+    return files
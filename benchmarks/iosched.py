@@ -0,0 +1,95 @@
+"""
+Time reading a generated tree from a cold page cache in walk order and in on-disk
+(inode) order, with and without readahead hints (see taggregator.iosched).
+
+The cache is dropped before every run by writing to /proc/sys/vm/drop_caches, which
+needs root. Otherwise each file is evicted with posix_fadvise(DONTNEED) instead,
+which only drops the files' own pages and not their inodes or directories, so the
+walk order numbers come out kinder than on a really cold machine. Generate the tree
+on the disk being measured (--directory): on a tmpfs nothing is ever cold.
+"""
+from benchmarks import corpus
+from taggregator import iosched
+from taggregator import tagg
+from taggregator import walker
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+class WalkOrderScheduler(iosched.IoScheduler):
+    """
+    Readahead hints without the reordering, to tell the two apart.
+    """
+
+    def get_read_order(self, files):
+        return list(files)
+
+
+def drop_caches(files):
+    """
+    Empty the page cache as far as we're allowed, returning how it was done.
+    """
+    os.sync()
+
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return "drop_caches"
+    except OSError:
+        pass
+
+    if not iosched.CAN_ADVISE:
+        return "none (warm cache)"
+
+    for file_name in files:
+        fd = os.open(file_name, os.O_RDONLY)
+
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    return "posix_fadvise(DONTNEED)"
+
+
+def time_scan(scanner, files, io_scheduler, jobs):
+    drop_caches(files)
+    start = time.perf_counter()
+    match_count = sum(len(matches) for _, matches in tagg.scan_files(
+        scanner, files, jobs=jobs, executor="thread", io_scheduler=io_scheduler))
+    return time.perf_counter() - start, match_count
+
+
+def run(spec, directory=None, repeat=3, window=None, jobs=1):
+    root = tempfile.mkdtemp(dir=directory)
+
+    try:
+        corpus.generate(root, spec)
+        files = list(walker.walk(root, walker.PathMatcher(
+            root, spec.get_exclude(), ["*"])))
+        tag_regex = tagg.get_tag_regex(
+            "@", corpus.TAGS, tagg.get_priority_regex(corpus.PRIORITIES))
+        scanner = tagg.FileScanner(
+            tag_regex, corpus.TAGS, tagg.get_priority_value_map(corpus.PRIORITIES),
+            opener=iosched.open_noatime)
+        window = iosched.READAHEAD_WINDOW if window is None else window
+
+        print("%d files x %d lines in %s, %d jobs, cache dropped with %s" %
+              (len(files), spec.lines_per_file, root, jobs, drop_caches(files)))
+        print("%-12s%-10s%10s%10s" % ("order", "readahead", "seconds", "matches"))
+
+        for order, io_scheduler in [
+                ("walk", None),
+                ("walk", WalkOrderScheduler(window)),
+                ("inode", iosched.IoScheduler(0)),
+                ("inode", iosched.IoScheduler(window))]:
+            # Median rather than fastest, since cold runs are noisy in both directions
+            runs = [time_scan(scanner, files, io_scheduler, jobs) for _ in range(repeat)]
+            readahead = io_scheduler.window if io_scheduler is not None else 0
+            print("%-12s%-10d%10.3f%10d" % (
+                order, readahead, statistics.median(seconds for seconds, _ in runs), runs[0][1]))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,51 @@
+"""
+Time the serial, threaded and multiprocess scan paths against a generated tree.
+
+Small trees of small files favour the serial path (no pool start-up or pickling),
+big warm-cache trees of tag-dense files favour processes, and threads only win
+when the files have to come off a slow disk.
+"""
+from benchmarks import corpus
+from taggregator import tagg
+import os
+import shutil
+import tempfile
+import time
+
+
+def time_scan(scanner, files, jobs, executor):
+    start = time.perf_counter()
+    match_count = sum(len(matches) for _, matches in tagg.scan_files(
+        scanner, files, jobs=jobs, executor=executor))
+    return time.perf_counter() - start, match_count
+
+
+def run(spec):
+    directory = tempfile.mkdtemp()
+
+    try:
+        corpus.generate(directory, spec)
+        config_map = corpus.get_config_map(directory, spec)
+        # Exclude rules are relative to the current directory, as when tagg is run in it
+        cwd = os.getcwd()
+        os.chdir(directory)
+
+        try:
+            files = tagg.get_all_files(config_map)
+        finally:
+            os.chdir(cwd)
+
+        scanner = tagg.get_file_scanner(config_map)
+
+        print("%d files x %d lines, %d CPUs" %
+              (len(files), spec.lines_per_file, os.cpu_count()))
+        print("%-10s%-6s%10s%10s" % ("executor", "jobs", "seconds", "matches"))
+
+        for executor, jobs in [("serial", 1), ("thread", 2), ("thread", 4),
+                               ("process", 2), ("process", 4), ("process", 0)]:
+            seconds, match_count = time_scan(
+                scanner, files, jobs, "process" if executor == "serial" else executor)
+            print("%-10s%-6d%10.3f%10d" %
+                  (executor, jobs, seconds, match_count))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,53 @@
+"""
+Measure the memory used by, and the time taken to de-duplicate, a large number of Match records.
+
+The pairwise de-duplication that Match replaced is O(n^2), so it is only timed
+on a sample and extrapolated to the full count.
+"""
+from taggregator import tagg
+import time
+import tracemalloc
+
+
+def make_matches(count):
+    # Roughly 20 matches per file, with every 10th match a duplicate of its neighbour
+    return [tagg.Match("src/module_%d/file_%d.py" % (i // 2000, i // 20),
+                       i - (i % 10 == 9),
+                       "# @BUG(HIGH) something is wrong here %d" % i,
+                       "BUG",
+                       2) for i in range(count)]
+
+
+def dedup_pairwise(matches):
+    unique = []
+
+    for match in matches:
+        if not any(match == m for m in unique):
+            unique.append(match)
+
+    return unique
+
+
+def dedup_hashed(matches):
+    return list(dict.fromkeys(matches))
+
+
+def run(count):
+    sample_count = min(count, 3000)
+
+    tracemalloc.start()
+    matches = make_matches(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%d matches: %.1f MB (%.0f bytes per match)" % (count, size / 1e6, size / count))
+
+    start = time.perf_counter()
+    unique = dedup_hashed(matches)
+    print("hashed de-dup of %d: %.3fs (%d unique)" % (count, time.perf_counter() - start, len(unique)))
+
+    start = time.perf_counter()
+    dedup_pairwise(matches[:sample_count])
+    seconds = time.perf_counter() - start
+    print("pairwise de-dup of %d: %.3fs (~%.0fs extrapolated to %d)" % (
+        sample_count, seconds, seconds * (count / sample_count) ** 2, count))
+
@@ -0,0 +1,57 @@
+"""
+Time the prefilter which decides whether a file could hold any tags, against the number
+of tags configured. The single regex pass should stay flat as tags are added, where
+searching for each tag in turn grows linearly.
+"""
+from taggregator import tagg
+import random
+import re
+import time
+
+
+def make_text(line_count, seed=0):
+    rng = random.Random(seed)
+    words = ["def", "return", "self", "value", "if", "else", "for", "in",
+             "print", "import", "class", "data", "x", "y", "@property"]
+    return "\n".join(" ".join(rng.choice(words) for _ in range(8))
+                     for _ in range(line_count))
+
+
+def prefilter_each_tag(text, tags):
+    lower_text = text.lower()
+    return any(t.lower() in lower_text for t in tags)
+
+
+def prefilter_single_pass(text, prefilter_regex):
+    return len(tagg.get_candidate_lines(text, prefilter_regex)) > 0
+
+
+def time_best(function, repeat):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run(tag_counts=(1, 5, 10, 30, 100), line_count=20000, repeat=5):
+    """
+    Print the time per file taken by each prefilter on a file with no tags in it,
+    which is the case the prefilter exists for.
+    """
+    text = make_text(line_count)
+    print("%-6s%16s%16s" % ("tags", "each tag (ms)", "one pass (ms)"))
+
+    for tag_count in tag_counts:
+        tags = ["TAG%03d" % i for i in range(tag_count)]
+        prefilter_regex = tagg.get_prefilter_regex(re.escape("@"), tags)
+        each_tag_seconds = time_best(
+            lambda: prefilter_each_tag(text, tags), repeat)
+        single_pass_seconds = time_best(
+            lambda: prefilter_single_pass(text, prefilter_regex), repeat)
+
+        print("%-6d%16.3f%16.3f" % (tag_count, each_tag_seconds * 1000, single_pass_seconds * 1000))
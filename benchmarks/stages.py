@@ -0,0 +1,120 @@
+"""
+Time each stage of the tagg.run pipeline on its own, through the same functions and
+with the same kind of config_map that tagg.run uses, so that a regression anywhere in
+them shows up here.
+"""
+from benchmarks import corpus
+from taggregator import metrics
+from taggregator import printer
+from taggregator import tagg
+import contextlib
+import io
+import os
+import re
+import time
+
+
+def time_best(function, repeat):
+    """
+    Run function repeat times and return (fastest time, last result).
+    """
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def time_best_stages(function, stages, repeat):
+    """
+    Run function (which is given a ScanStats to keep) repeat times and return the
+    fastest time it recorded for each of stages, and its last result.
+    """
+    best = dict((stage, None) for stage in stages)
+    result = None
+
+    for _ in range(repeat):
+        stats = metrics.ScanStats()
+        result = function(stats)
+
+        for stage in stages:
+            seconds = stats.timings[stage]
+            best[stage] = seconds if best[stage] is None else min(best[stage], seconds)
+
+    return best, result
+
+
+def read_files(scanner, files):
+    """
+    What FileScanner.read gives back for each file: its contents, None if it isn't
+    searched (binary, too big, not UTF-8...), or its matches if it was streamed.
+    """
+    return [(file_name, scanner.read(file_name)) for file_name in files]
+
+
+def match(scanner, contents, stats):
+    file_matches = []
+
+    for file_name, file_contents in contents:
+        if isinstance(file_contents, list):
+            file_matches.append(file_contents)
+        elif file_contents is not None:
+            file_matches.append(scanner.match(file_name, file_contents, stats))
+
+    return file_matches
+
+
+def scan(scanner, files):
+    return [matches for _, matches in tagg.scan_files(scanner, files)]
+
+
+def render(matches, tag_marker, priority_value_map):
+    with contextlib.redirect_stdout(io.StringIO()):
+        printer.print_matches(list(matches), tag_marker, priority_value_map)
+
+
+def run_stages(root, spec, repeat=3):
+    """
+    Returns a dict of stage name -> fastest time in seconds, plus counts
+    of what each stage produced so runs on different trees aren't confused.
+
+    The prefilter and match stages are timed by get_contents_matches itself, since it
+    runs them interleaved, and scan is the whole of reading and matching as run does it.
+    """
+    config_map = corpus.get_config_map(root, spec)
+    scanner = tagg.get_file_scanner(config_map)
+    tag_marker = re.escape(config_map["tag_marker"])
+    stages = {}
+    # Exclude rules are relative to the current directory, as when tagg is run in root
+    cwd = os.getcwd()
+    os.chdir(root)
+
+    try:
+        stages["walk"], files = time_best(
+            lambda: tagg.get_all_files(config_map), repeat)
+    finally:
+        os.chdir(cwd)
+
+    stages["read"], contents = time_best(lambda: read_files(scanner, files), repeat)
+    match_stages, file_matches = time_best_stages(
+        lambda stats: match(scanner, contents, stats), ["prefilter", "match"], repeat)
+    stages.update(match_stages)
+    stages["scan"], _ = time_best(lambda: scan(scanner, files), repeat)
+    stages["dedup"], matches = time_best(
+        lambda: tagg.get_unique_matches(file_matches), repeat)
+    stages["render"], _ = time_best(
+        lambda: render(matches, tag_marker, scanner.priority_value_map), repeat)
+
+    counts = {
+        "files": len(files),
+        "decoded_files": sum(1 for _, file_contents in contents if file_contents is not None),
+        "matched_files": sum(1 for matches in file_matches if matches),
+        "matches": len(matches),
+    }
+
+    return stages, counts
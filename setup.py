@@ -17,7 +17,7 @@ setuptools.setup(
     url="https://github.com/jamtartley/taggregator",
     python_requires=">=3",
     include_package_data=True,
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["benchmarks", "benchmarks.*"]),
     entry_points={
         "console_scripts": [
             "tagg = taggregator.__main__:main"
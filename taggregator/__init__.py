@@ -0,0 +1,8 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+# The library API, for programs which want matches without running tagg and parsing its output
+from taggregator.api import CancellationToken
+from taggregator.api import Session
+from taggregator.api import scan
+from taggregator.tagg import Match
@@ -2,14 +2,18 @@
 #! -*- coding: utf-8 -*-
 
 from taggregator import config
+from taggregator import formats
+from taggregator import iosched
+from taggregator import parallel
 from taggregator import printer
 from taggregator import tagg
 import argparse
 import os
+import re
 import sys
-import cProfile
-import pstats
-import io
+
+# Modules only some commands need are imported by those commands, so that
+# they don't add to the start-up time of every other command
 
 
 class ProfileData:
@@ -27,37 +31,167 @@ class CommandHandler:
             description="Search files in a directory for areas with specific tags")
         parser.add_argument("command", help="Command to run")
 
-        allowed_commands = ["run", "create"]
+        allowed_commands = ["run", "create", "watch", "check", "diff", "serve", "index", "query", "scan", "merge", "stats"]
         self.was_run_by_default = len(
             sys.argv) <= 1 or sys.argv[1] not in allowed_commands
         command = "run" if self.was_run_by_default else sys.argv[1]
 
         getattr(self, command)()
 
+    def get_search_parser(self, description, multiple_roots=False):
+        """
+        Parser for the arguments shared by every command which searches for tags.
+        """
+        parser = argparse.ArgumentParser(description=description)
+
+        if multiple_roots:
+            parser.add_argument(
+                "root",
+                default=[],
+                nargs="*",
+                help="Paths from which to start search")
+            parser.add_argument(
+                "--roots-file",
+                help="File listing more paths to search, one per line")
+            parser.add_argument(
+                "--merged",
+                action="store_true",
+                help="Print the matches from every root as one list instead of grouped by root")
+        else:
+            parser.add_argument(
+                "root",
+                default="",
+                nargs="?",
+                help="Path from which to start search")
+
+        parser.add_argument(
+            "-t",
+            "--tags",
+            help="Comma-separated list of tags to search for (temporarily overrides config file)")
+        parser.add_argument(
+            "--matcher",
+            choices=["text", "mmap"],
+            default="text",
+            help="Decode and search every line of each file (text) or search the raw, memory-mapped bytes and only decode matching lines (mmap)")
+
+        return parser
+
+    def add_parallel_arguments(self, parser):
+        """
+        Arguments for commands which scan files, to spread the scanning over several CPUs.
+        """
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of files to scan in parallel (0 uses every CPU)")
+        parser.add_argument(
+            "--executor",
+            choices=sorted(parallel.EXECUTORS),
+            default="process",
+            help="Run parallel scans in worker processes (CPU bound) or threads (IO bound)")
+
+    def add_paging_arguments(self, parser):
+        """
+        Arguments for commands which print the todo list, to keep it readable when it's long.
+        """
+        parser.add_argument(
+            "--limit",
+            type=get_positive_int,
+            help="Only print this many tags, highest priority first")
+        parser.add_argument(
+            "--page",
+            type=get_positive_int,
+            help="Print this page (from 1) of --limit tags (50 by default)")
+        parser.add_argument(
+            "--summary-first",
+            action="store_true",
+            help="Print how many of each tag there are before the tags themselves")
+
+    def parse_args(self, parser):
+        return parser.parse_args(
+            sys.argv[1:]) if self.was_run_by_default else parser.parse_args(sys.argv[2:])
+
     def run(self):
         if self.profile_data.should_do_profiling:
+            import cProfile
             pr = cProfile.Profile()
             pr.enable()
 
-        parser = argparse.ArgumentParser(
-            description="Run the taggregator main program")
+        parser = self.get_search_parser(
+            "Run the taggregator main program", multiple_roots=True)
         parser.add_argument(
-            "root",
-            default="",
-            nargs="?",
-            help="Path from which to start search")
+            "--no-cache",
+            dest="use_cache",
+            action="store_false",
+            help="Scan every file without reading or writing the scan cache")
         parser.add_argument(
-            "-t",
-            "--tags",
-            help="Comma-separated list of tags to search for (temporarily overrides config file)")
+            "--clear-cache",
+            action="store_true",
+            help="Throw away the scan cache for this root before searching")
+        self.add_parallel_arguments(parser)
+        parser.add_argument(
+            "--pipeline",
+            action="store_true",
+            help="Read and search files while the directory is still being walked (instead of -j)")
+        parser.add_argument(
+            "--io-schedule",
+            action="store_true",
+            help="Read files in on-disk (inode) order with readahead hints, for cold caches and spinning disks (not with --pipeline)")
+        parser.add_argument(
+            "--readahead",
+            type=int,
+            metavar="FILES",
+            help="Number of files ahead of the one being read to give readahead hints for with --io-schedule (0 for none, default %d)" %
+            iosched.READAHEAD_WINDOW)
+        parser.add_argument(
+            "--walk-report",
+            action="store_true",
+            help="Report how many directories and files were walked, pruned and skipped")
+        parser.add_argument(
+            "--format",
+            choices=["table"] + sorted(formats.WRITERS),
+            default="table",
+            help="Print the coloured todo list (table) or stream machine-readable matches as they are found")
+        parser.add_argument(
+            "--git",
+            action="store_true",
+            help="Search the files tracked by git instead of walking the directory, caching matches by blob hash")
+        parser.add_argument(
+            "--client",
+            action="store_true",
+            help="Ask the daemon started by 'tagg serve' for the matches instead of searching")
+        parser.add_argument(
+            "--priority",
+            help="Only show tags of at least this priority (with --client)")
+        parser.add_argument(
+            "--path",
+            help="Only show tags in files under this path (with --client)")
+        self.add_paging_arguments(parser)
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Print counters and per-stage timings for the run to stderr")
+        parser.add_argument(
+            "--stats-json",
+            action="store_true",
+            help="Like --stats, but as JSON")
+
+        raw_args = self.parse_args(parser)
+        set_machine_readable_logging(raw_args.format)
+
+        # Skip loading any config so that answering from the daemon is as quick as possible
+        if raw_args.client and self.run_client(raw_args):
+            return
 
-        raw_args = parser.parse_args(
-            sys.argv[1:]) if self.was_run_by_default else parser.parse_args(sys.argv[2:])
         user_config = config.UserConfig(raw_args)
 
         tagg.run(user_config.config_map)
 
         if self.profile_data.should_do_profiling:
+            import io
+            import pstats
             pr.disable()
             s = io.StringIO()
             ps = pstats.Stats(
@@ -69,6 +203,411 @@ class CommandHandler:
                 if (i < self.profile_data.line_count):
                     print(line)
 
+    def run_client(self, raw_args):
+        """
+        Print the daemon's answer to the query in raw_args, or return False if no daemon
+        is serving the root so that the caller can search for itself instead.
+        """
+        from taggregator import serve
+
+        root = os.path.abspath(raw_args.root[0] if raw_args.root else "")
+        request = {
+            "tags": [t.strip() for t in raw_args.tags.split(",")] if raw_args.tags else None,
+            "min_priority": raw_args.priority,
+            "path_prefix": os.path.abspath(raw_args.path) if raw_args.path else None,
+        }
+
+        try:
+            reply = serve.query(serve.get_socket_path(root), request)
+        except (OSError, ValueError):
+            printer.log(
+                "No daemon is serving %s, searching without it (start one with 'tagg serve')" %
+                root, "warning", file=sys.stderr)
+            return False
+
+        if "error" in reply:
+            printer.log(reply["error"], "fatal error")
+            sys.exit(2)
+
+        matches = serve.get_reply_matches(reply)
+        priority_value_map = tagg.get_priority_value_map(reply["priorities"])
+
+        # The daemon sends back every match, so they're paged or formatted as run would
+        if raw_args.format == "table":
+            printer.print_matches(
+                matches,
+                re.escape(reply["tag_marker"]),
+                priority_value_map,
+                None,
+                None,
+                raw_args.limit,
+                raw_args.page,
+                raw_args.summary_first)
+        else:
+            with formats.open_output() as stream:
+                tagg.write_matches(
+                    formats.get_writer(raw_args.format, stream, priority_value_map, root),
+                    [matches])
+
+        return True
+
+    def serve(self):
+        parser = self.get_search_parser(
+            "Keep the matches under root in memory and answer 'tagg --client' queries about them")
+        from taggregator import serve
+        raw_args = self.parse_args(parser)
+        user_config = config.UserConfig(raw_args)
+        config_map = user_config.config_map
+        server = serve.TagServer(
+            config_map, serve.get_socket_path(config_map["root"]))
+
+        try:
+            server.serve_forever()
+        except OSError as e:
+            printer.log(str(e), "fatal error")
+            sys.exit(2)
+
+    def watch(self):
+        parser = self.get_search_parser(
+            "Keep the taggregator todo list on screen, updating it whenever files change")
+        from taggregator import watch
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Shortest time in seconds between checks for changes where inotify isn't available")
+        raw_args = self.parse_args(parser)
+        user_config = config.UserConfig(raw_args)
+
+        watch.watch(
+            user_config.config_map,
+            min_interval=raw_args.interval)
+
+    def check(self):
+        parser = self.get_search_parser(
+            "Exit with a non-zero status if any matching tags are found (for CI)")
+        from taggregator import check
+        parser.add_argument(
+            "--fail-on",
+            action="append",
+            default=[],
+            metavar="TAG[:PRIORITY]",
+            help="Fail if this tag is found (at or above PRIORITY if given), can be repeated. Without it any tag fails")
+        parser.add_argument(
+            "--max",
+            type=int,
+            default=0,
+            help="Only fail if more than this many failing tags are found")
+        self.add_parallel_arguments(parser)
+        raw_args = self.parse_args(parser)
+        user_config = config.UserConfig(raw_args)
+        config_map = user_config.config_map
+        priority_value_map = tagg.get_priority_value_map(
+            config_map["priorities"])
+
+        try:
+            fail_rules = [check.get_fail_rule(spec, priority_value_map)
+                          for spec in raw_args.fail_on]
+        except ValueError as e:
+            printer.log(str(e), "fatal error")
+            sys.exit(2)
+
+        # Only search for the tags which can fail the check
+        if fail_rules and raw_args.tags is None:
+            config_map["tags"] = check.get_fail_rule_tags(fail_rules)
+
+        failing_matches = check.check(config_map, fail_rules, raw_args.max)
+        has_failed = len(failing_matches) > raw_args.max
+        # Tags allowed by --max are still worth seeing, but they don't fail the check
+        level = "failed" if has_failed else "warning"
+
+        for match in failing_matches:
+            printer.log("%s:%d %s" % (match.file_name, match.line_number, match.line), level)
+
+        sys.exit(1 if has_failed else 0)
+
+    def diff(self):
+        parser = self.get_search_parser(
+            "Search only the lines added by a diff, such as the changes staged for a commit")
+        from taggregator import diff
+        import subprocess
+        parser.add_argument(
+            "--stdin",
+            action="store_true",
+            help="Read a unified diff from stdin instead of running git diff --cached in root")
+        parser.add_argument(
+            "--format",
+            choices=["table"] + sorted(formats.WRITERS),
+            default="table",
+            help="Print the coloured todo list (table) or machine-readable matches")
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with a non-zero status if any tags were added (for pre-commit hooks)")
+        raw_args = self.parse_args(parser)
+        set_machine_readable_logging(raw_args.format)
+        user_config = config.UserConfig(raw_args)
+        config_map = user_config.config_map
+
+        if raw_args.stdin:
+            diff_lines = sys.stdin
+        else:
+            try:
+                diff_lines = diff.get_staged_diff(config_map["root"])
+            except (OSError, subprocess.CalledProcessError) as e:
+                printer.log("Could not get the staged diff: " + str(e), "fatal error")
+                sys.exit(2)
+
+        matches = diff.find_diff_matches(config_map, diff_lines)
+        priority_value_map = tagg.get_priority_value_map(
+            config_map["priorities"])
+
+        if raw_args.format == "table":
+            printer.print_matches(
+                matches,
+                re.escape(config_map["tag_marker"]),
+                priority_value_map)
+        else:
+            with formats.open_output() as stream:
+                tagg.write_matches(
+                    formats.get_writer(
+                        raw_args.format,
+                        stream,
+                        priority_value_map,
+                        config_map["root"]),
+                    [matches])
+
+        sys.exit(1 if raw_args.fail and matches else 0)
+
+    def index(self):
+        parser = self.get_search_parser(
+            "Index the matches under root into a SQLite database for 'tagg query'",
+            multiple_roots=True)
+        from taggregator import database
+        parser.add_argument(
+            "--db",
+            help="Database to update instead of the one kept for root in the cache directory")
+        self.add_parallel_arguments(parser)
+        raw_args = self.parse_args(parser)
+        user_config = config.UserConfig(raw_args)
+        config_map = user_config.config_map
+        database_path = raw_args.db or database.get_database_path(
+            config_map.get("roots", config_map["root"]))
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+
+        with database.TagDatabase(database_path) as tag_database:
+            file_count, scanned_count = tag_database.update(config_map)
+
+        printer.log("Indexed %d files (%d rescanned) into %s" %
+                    (file_count, scanned_count, database_path), "information")
+
+    def query(self):
+        parser = argparse.ArgumentParser(
+            description="Print the matches indexed by 'tagg index' without searching anything")
+        from taggregator import database
+        parser.add_argument(
+            "root",
+            default=[],
+            nargs="*",
+            help="Roots which were indexed (together)")
+        parser.add_argument(
+            "--roots-file",
+            help="File listing more roots which were indexed, one per line")
+        parser.add_argument(
+            "--db",
+            help="Database to query instead of the one kept for the roots in the cache directory")
+        parser.add_argument(
+            "--tag",
+            help="Comma-separated list of tags to show")
+        parser.add_argument(
+            "--priority",
+            help="Only show tags of at least this priority")
+        parser.add_argument(
+            "--path",
+            help="Only show tags in this file or in files under this directory")
+        parser.add_argument(
+            "--diff",
+            metavar="OLD_DB",
+            help="Show the tags added and removed since the snapshot in OLD_DB instead")
+        self.add_paging_arguments(parser)
+        raw_args = self.parse_args(parser)
+        database_path = raw_args.db or database.get_database_path(config.get_roots(raw_args))
+
+        # Don't leave an empty database behind for a typo
+        for path in [database_path, raw_args.diff]:
+            if path is not None and not os.path.isfile(path):
+                printer.log("No index at %s, create one with 'tagg index'" % path, "fatal error")
+                sys.exit(2)
+
+        with database.TagDatabase(database_path) as tag_database:
+            priority_value_map = tagg.get_priority_value_map(
+                tag_database.get_priorities())
+            min_priority = None
+
+            if raw_args.priority:
+                min_priority = priority_value_map.get(raw_args.priority.upper())
+
+                if min_priority is None:
+                    printer.log("Unknown priority '%s'" % raw_args.priority, "fatal error")
+                    sys.exit(2)
+
+            filters = {
+                "tags": [t.strip() for t in raw_args.tag.split(",")] if raw_args.tag else None,
+                "min_priority": min_priority,
+                "path_prefix": os.path.relpath(
+                    os.path.abspath(raw_args.path),
+                    tag_database.get_root()) if raw_args.path else None,
+            }
+            tag_marker = re.escape(tag_database.get_tag_marker())
+
+            if raw_args.diff is None:
+                printer.print_matches(
+                    tag_database.query(**filters),
+                    tag_marker,
+                    priority_value_map,
+                    limit=raw_args.limit,
+                    page=raw_args.page,
+                    summary_first=raw_args.summary_first)
+                return
+
+            with database.TagDatabase(raw_args.diff) as old_database:
+                added, removed = database.get_snapshot_diff(
+                    old_database, tag_database, **filters)
+
+            for matches, change in [(added, "added"), (removed, "removed")]:
+                printer.log("%d tags %s since %s" %
+                            (len(matches), change, raw_args.diff), "information")
+
+                if matches:
+                    printer.print_matches(
+                        matches,
+                        tag_marker,
+                        priority_value_map,
+                        limit=raw_args.limit,
+                        page=raw_args.page,
+                        summary_first=raw_args.summary_first)
+
+    def scan(self):
+        parser = self.get_search_parser(
+            "Scan one shard of the files under root and write its matches to a partial result for 'tagg merge'",
+            multiple_roots=True)
+        from taggregator import shard
+        parser.add_argument(
+            "--shard",
+            required=True,
+            metavar="K/N",
+            help="Scan the Kth of N shards, picked by a hash of each file's path")
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="Partial result file to write (tagg-shard-K-of-N.json.gz by default)")
+        self.add_parallel_arguments(parser)
+        raw_args = self.parse_args(parser)
+
+        try:
+            shard_number, shard_count = shard.parse_shard(raw_args.shard)
+        except ValueError as e:
+            printer.log(str(e), "fatal error")
+            sys.exit(2)
+
+        user_config = config.UserConfig(raw_args)
+        output_path = raw_args.output or "tagg-shard-%d-of-%d.json.gz" % (
+            shard_number, shard_count)
+        partial = shard.scan_shard(user_config.config_map, shard_number, shard_count)
+        shard.write_partial(output_path, partial)
+
+        printer.log("Wrote the matches in %d files to %s" %
+                    (len(partial["files"]), output_path), "information")
+
+    def merge(self):
+        parser = argparse.ArgumentParser(
+            description="Combine the partial results written by 'tagg scan --shard' into one todo list")
+        from taggregator import shard
+        parser.add_argument(
+            "partials",
+            nargs="+",
+            help="Partial result files, one for each shard")
+        parser.add_argument(
+            "--merged",
+            action="store_true",
+            help="Print the matches from every root as one list instead of grouped by root")
+        self.add_paging_arguments(parser)
+        raw_args = self.parse_args(parser)
+
+        try:
+            partials = [shard.read_partial(path) for path in raw_args.partials]
+            matches = shard.merge_partials(partials)
+        except (OSError, ValueError) as e:
+            printer.log(str(e), "fatal error")
+            sys.exit(2)
+
+        roots = partials[0]["roots"]
+        printer.print_matches(
+            matches,
+            re.escape(partials[0]["tag_marker"]),
+            tagg.get_priority_value_map(partials[0]["priorities"]),
+            None,
+            None if raw_args.merged or len(roots) == 1 else roots,
+            raw_args.limit,
+            raw_args.page,
+            raw_args.summary_first)
+
+    def stats(self):
+        parser = self.get_search_parser(
+            "Count the tags under root by tag, priority, extension or directory without listing them",
+            multiple_roots=True)
+        from taggregator import aggregate
+        parser.add_argument(
+            "--group-by",
+            default="tag,priority",
+            help="Comma-separated fields to count tags by, from %s (default tag,priority)" %
+            ", ".join(aggregate.GROUP_FIELDS))
+        parser.add_argument(
+            "--depth",
+            type=get_positive_int,
+            default=1,
+            help="How many levels of directory to group by with --group-by directory")
+        parser.add_argument(
+            "--priority",
+            help="Only count tags of at least this priority")
+        parser.add_argument(
+            "--top",
+            type=get_positive_int,
+            help="Only print the groups with the most tags")
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the counts as JSON")
+        self.add_parallel_arguments(parser)
+        raw_args = self.parse_args(parser)
+        user_config = config.UserConfig(raw_args)
+        config_map = user_config.config_map
+        priority_value_map = tagg.get_priority_value_map(
+            config_map["priorities"])
+        min_priority = None
+
+        try:
+            group_by = aggregate.parse_group_by(raw_args.group_by)
+
+            if raw_args.priority:
+                min_priority = priority_value_map.get(raw_args.priority.upper())
+
+                if min_priority is None:
+                    raise ValueError("Unknown priority '%s'" % raw_args.priority)
+        except ValueError as e:
+            printer.log(str(e), "fatal error")
+            sys.exit(2)
+
+        tag_aggregate = aggregate.aggregate(
+            config_map, group_by, raw_args.depth, min_priority)
+        value_priority_map = dict((value, priority)
+                                  for priority, value in priority_value_map.items())
+        print_counts = aggregate.print_json if raw_args.json else aggregate.print_rows
+        print_counts(
+            tag_aggregate.get_rows(value_priority_map, raw_args.top),
+            tag_aggregate.get_totals(),
+            group_by)
+
     def create(self):
         parser = argparse.ArgumentParser(
             description="Run the taggregator config file creator")
@@ -77,12 +616,29 @@ class CommandHandler:
             default="",
             nargs="?",
             help="Directory in which to create config folder")
-        raw_args = parser.parse_args(
-            sys.argv[1:]) if self.was_run_by_default else parser.parse_args(sys.argv[2:])
+        raw_args = self.parse_args(parser)
 
         config.create_default_config_file(raw_args.root)
 
 
+def get_positive_int(text):
+    value = int(text)
+
+    if value < 1:
+        raise argparse.ArgumentTypeError("%s is not 1 or more" % text)
+
+    return value
+
+
+def set_machine_readable_logging(output_format):
+    """
+    Keep stdout for the matches alone when they're printed in a machine-readable
+    format, including warnings from loading the config before the search starts.
+    """
+    if output_format != "table":
+        printer.set_log_file(sys.stderr)
+
+
 def main():
     CommandHandler(profile_data)
 
@@ -0,0 +1,226 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import metrics
+from taggregator import parallel
+from taggregator import tagg
+from collections import defaultdict
+import json
+import os
+
+
+class TagCounter:
+    """
+    Counts the tags in files without building a Match for any of them, so that nothing
+    but the counts themselves (and no line text) is ever sent back from a worker.
+    Picklable like FileScanner, which it wraps.
+    """
+
+    def __init__(self, scanner):
+        self.scanner = scanner
+
+    def count(self, file_name, stats=None):
+        """
+        (number of lines, list of (tag, priority value) for every tag) in file_name.
+        A line with the same tag on it twice counts once, as it does in a normal run.
+        """
+        scanner = self.scanner
+        contents = scanner.read(file_name, stats)
+
+        if contents is None:
+            return 0, []
+
+        if isinstance(contents, list):
+            # Searched while it was read (see FileScanner.read), so the lines weren't kept
+            return get_line_count(file_name), [(m.tag, m.priority) for m in dict.fromkeys(contents)]
+
+        if scanner.prefilter_regex is not None:
+            lines = tagg.get_candidate_lines(contents, scanner.prefilter_regex)
+        else:
+            lines = enumerate(contents.split("\n"), 1)
+
+        tags = []
+
+        for _, line in lines:
+            priorities_by_tag = {}
+
+            for tag, priority in scanner.tag_regex.findall(line):
+                priorities_by_tag.setdefault(tag.upper(), scanner.priority_value_map.get(
+                    priority.upper(), tagg.Match.NO_PRIORITY))
+
+            tags.extend(priorities_by_tag.items())
+
+        line_count = contents.count("\n") + (1 if contents and not contents.endswith("\n") else 0)
+        return line_count, tags
+
+    def scan_batch(self, file_names):
+        batch_stats = metrics.ScanStats() if self.scanner.keep_stats else None
+
+        return [self.count(file_name, batch_stats)
+                for file_name in file_names], batch_stats
+
+
+class TagAggregate:
+    """
+    Tag counts grouped by any of GROUP_FIELDS, along with the number of lines searched
+    for each group so that counts can be turned into tags per 1000 lines. Only ever holds
+    one counter per group, however many tags are added.
+
+    Tags are grouped by the file fields (extension, depth, directory) of the file they
+    are in and the match fields (tag, priority) of the tag itself. Lines only belong to
+    a file, so a group's density is its tags over the lines of every file with the same
+    file fields: for 'tag' alone that's every line searched.
+    """
+
+    def __init__(self, group_by, directory_depth=1, min_priority=None):
+        self.group_by = group_by
+        self.directory_depth = directory_depth
+        self.min_priority = min_priority
+        self.tag_counts = defaultdict(int)
+        self.file_counts = defaultdict(int)
+        self.line_counts = defaultdict(int)
+        self.file_count = 0
+        self.line_count = 0
+        self.tag_count = 0
+
+    def get_file_fields(self, rel_path):
+        directory = os.path.dirname(rel_path)
+        parts = directory.split(os.sep) if directory else []
+        extension = os.path.splitext(rel_path)[1][1:]
+
+        return {
+            "extension": extension or None,
+            "depth": len(parts),
+            "directory": os.path.join(*parts[:self.directory_depth]) if parts else os.curdir,
+        }
+
+    def add_file(self, rel_path, line_count, tags):
+        file_fields = self.get_file_fields(rel_path)
+        file_key = tuple(file_fields[field] for field in self.group_by
+                         if field in file_fields)
+        self.file_count += 1
+        self.line_count += line_count
+        self.line_counts[file_key] += line_count
+        keys_in_file = set()
+
+        for tag, priority in tags:
+            if self.min_priority is not None and priority < self.min_priority:
+                continue
+
+            fields = dict(file_fields, tag=tag, priority=priority)
+            key = tuple(fields[field] for field in self.group_by)
+            self.tag_counts[key] += 1
+            self.tag_count += 1
+            keys_in_file.add(key)
+
+        for key in keys_in_file:
+            self.file_counts[key] += 1
+
+    def get_rows(self, value_priority_map, top=None):
+        """
+        A dict for each group, most tags first.
+        """
+        rows = []
+
+        for key, count in self.tag_counts.items():
+            row = dict(zip(self.group_by, key))
+
+            if "priority" in row:
+                row["priority"] = value_priority_map.get(row["priority"])
+
+            file_key = tuple(value for field, value in zip(self.group_by, key)
+                             if field not in MATCH_FIELDS)
+            lines = self.line_counts[file_key]
+            row["tags"] = count
+            row["files"] = self.file_counts[key]
+            row["lines"] = lines
+            row["tags_per_1k_lines"] = round(count * 1000 / lines, 3) if lines else None
+            rows.append(row)
+
+        rows.sort(key=lambda row: (-row["tags"], [str(row[field]) for field in self.group_by]))
+        return rows[:top] if top is not None else rows
+
+    def get_totals(self):
+        return {
+            "files": self.file_count,
+            "lines": self.line_count,
+            "tags": self.tag_count,
+            "tags_per_1k_lines": round(
+                self.tag_count * 1000 / self.line_count, 3) if self.line_count else None,
+        }
+
+
+def parse_group_by(spec):
+    """
+    The fields in a comma-separated --group-by spec, raising ValueError for unknown ones.
+    """
+    fields = [field.strip().lower() for field in spec.split(",") if field.strip()]
+    unknown_fields = [field for field in fields if field not in GROUP_FIELDS]
+
+    if unknown_fields or not fields:
+        raise ValueError("Can't group by '%s', choose from %s" %
+                         (spec, ", ".join(GROUP_FIELDS)))
+
+    return fields
+
+
+def aggregate(config_map, group_by, directory_depth=1, min_priority=None):
+    """
+    Walk and scan config_map's roots like tagg.run does, adding up the tags
+    found in each file as it goes instead of keeping any of them.
+    """
+    counter = TagCounter(tagg.get_file_scanner(config_map))
+    tag_aggregate = TagAggregate(group_by, directory_depth, min_priority)
+    root = config_map["root"]
+    files = tagg.get_all_files(config_map)
+    counts = parallel.map_files(
+        counter.scan_batch,
+        files,
+        config_map.get("jobs", 1),
+        config_map.get("executor", "process"))
+
+    for file_name, (line_count, tags) in zip(files, counts):
+        tag_aggregate.add_file(os.path.relpath(file_name, root), line_count, tags)
+
+    return tag_aggregate
+
+
+def get_line_count(file_name):
+    line_count = 0
+    last_chunk = b""
+
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(tagg.STREAM_CHUNK_SIZE), b""):
+            line_count += chunk.count(b"\n")
+            last_chunk = chunk
+
+    return line_count + (1 if last_chunk and not last_chunk.endswith(b"\n") else 0)
+
+
+def print_rows(rows, totals, group_by):
+    columns = group_by + ["tags", "files", "lines", "tags_per_1k_lines"]
+    headings = [column.replace("_", " ") for column in columns]
+    cells = [[get_cell_text(row[column]) for column in columns] for row in rows]
+    widths = [max([len(heading)] + [len(row[i]) for row in cells])
+              for i, heading in enumerate(headings)]
+
+    print("  ".join(heading.ljust(width) for heading, width in zip(headings, widths)).rstrip())
+
+    for row in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+    print("Total: %d tags in %d files, %d lines (%s tags per 1k lines)" % (
+        totals["tags"], totals["files"], totals["lines"], get_cell_text(totals["tags_per_1k_lines"])))
+
+
+def get_cell_text(value):
+    return "-" if value is None else str(value)
+
+
+def print_json(rows, totals, group_by):
+    print(json.dumps({"group_by": group_by, "groups": rows, "totals": totals}, indent=4))
+
+
+FILE_FIELDS = ["extension", "depth", "directory"]
+MATCH_FIELDS = ["tag", "priority"]
+GROUP_FIELDS = MATCH_FIELDS + FILE_FIELDS
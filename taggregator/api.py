@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import config
+from taggregator import tagg
+from taggregator import walker
+import os
+import re
+import threading
+
+
+class CancellationToken:
+    """
+    Passed to a scan so that another thread (an editor's UI thread, say) can stop it.
+    The scan's iterator just ends, at the latest once the file being searched is done.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+
+class Session:
+    """
+    Settings and compiled regexes kept between scans, for programs which search again and
+    again (an editor plugin on every save, a build tool on every target). Anything not
+    given to scan() comes from the default config the package ships with, which is read
+    once per session. A Session never prints, never writes a config or cache file and never
+    reads the user's config, so results only depend on what it's given.
+    Keyword arguments to Session() are defaults for the same arguments of scan().
+
+    Safe to use from several threads at once.
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self.base_config = None
+        self.scanners = {}
+        self.lock = threading.Lock()
+
+    def get_config_map(self, root, options):
+        with self.lock:
+            if self.base_config is None:
+                self.base_config = config.get_default_config_json()
+
+        config_map = dict(self.base_config)
+        config_map.update((key, value) for key, value in self.defaults.items() if value is not None)
+        config_map.update((key, value) for key, value in options.items() if value is not None)
+
+        for key in ["tags", "priorities", "extensions", "exclude"]:
+            # Allow "TODO,BUG" as well as ["TODO", "BUG"]
+            if isinstance(config_map[key], str):
+                config_map[key] = config_map[key].split(",")
+
+        # The same normalisation as tags from the config file or the command line get
+        config_map["tags"] = set(re.escape(tag.strip().upper()) for tag in config_map["tags"])
+        config_map["priorities"] = [priority.upper() for priority in config_map["priorities"]]
+        config_map["root"] = root
+
+        return config_map
+
+    def get_scanner(self, config_map):
+        """
+        The FileScanner for config_map's settings, compiled the first time they're used.
+        """
+        key = (config_map["tag_marker"], tuple(sorted(config_map["tags"])),
+               tuple(config_map["priorities"]), config_map.get("matcher"),
+               config_map.get("max_file_size"))
+
+        with self.lock:
+            scanner = self.scanners.get(key)
+
+            if scanner is None:
+                if len(self.scanners) >= MAX_SESSION_SCANNERS:
+                    self.scanners.clear()
+
+                scanner = tagg.get_file_scanner(config_map)
+                self.scanners[key] = scanner
+
+        return scanner
+
+    def scan(
+            self,
+            root,
+            tags=None,
+            priorities=None,
+            tag_marker=None,
+            extensions=None,
+            exclude=None,
+            max_file_size=None,
+            matcher=None,
+            cancellation_token=None):
+        """
+        Lazily yield a Match for every tag under root (a directory or a single file), file by
+        file in the order the directory is walked. Nothing is searched until the first match
+        is asked for, and stopping early (or cancelling) leaves the rest of the tree alone.
+
+        exclude rules are relative to root rather than the current directory. matcher is
+        "text" or "mmap" (see tagg.find_matches_mmap).
+        """
+        root = os.path.abspath(os.fspath(root))
+        config_map = self.get_config_map(root, {
+            "tags": tags,
+            "priorities": priorities,
+            "tag_marker": tag_marker,
+            "extensions": extensions,
+            "exclude": exclude,
+            "max_file_size": max_file_size,
+            "matcher": matcher,
+        })
+        scanner = self.get_scanner(config_map)
+
+        if os.path.isfile(root):
+            files = [root]
+        else:
+            files = walker.walk(
+                root,
+                walker.PathMatcher(
+                    root,
+                    config_map["exclude"],
+                    config_map["extensions"]))
+
+        return iter_matches(scanner, files, cancellation_token)
+
+
+def iter_matches(scanner, files, cancellation_token=None):
+    for file_name in files:
+        if cancellation_token is not None and cancellation_token.is_cancelled():
+            return
+
+        # Duplicates within a file are dropped as in a normal run
+        yield from dict.fromkeys(scanner.scan(file_name))
+
+
+def scan(root, session=None, **options):
+    """
+    Session.scan with a session shared by every call which doesn't pass one, e.g.
+
+        for match in taggregator.scan("src", tags=["TODO", "BUG"]):
+            print(match.file_name, match.line_number, match.tag)
+
+    Match.priority is the priority's index in priorities (lowest first), or
+    Match.NO_PRIORITY.
+    """
+    return (session or get_default_session()).scan(root, **options)
+
+
+def get_default_session():
+    global default_session
+
+    with default_session_lock:
+        if default_session is None:
+            default_session = Session()
+
+    return default_session
+
+
+# Scanners compiled for more settings than this are thrown away
+MAX_SESSION_SCANNERS = 32
+default_session = None
+default_session_lock = threading.Lock()
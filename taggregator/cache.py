@@ -0,0 +1,260 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import printer
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+
+
+class ScanCache:
+    """
+    On-disk cache of the matches found in every file scanned under a root, so that
+    files which haven't changed since the last run don't need to be opened at all.
+
+    Each entry is keyed by file path and only reused if the file's size, mtime and
+    inode are the same as when it was scanned. The whole cache is thrown away if the
+    tag marker, tags, priorities or max file size it was built with differ from the
+    ones in use now, because every stored match would then potentially be wrong.
+
+    Matches are stored as plain (line_number, line, tag, priority) records, it is up
+    to the caller to turn them back into Match objects.
+    """
+
+    def __init__(self, root, tag_marker, tags, priorities, max_file_size=None):
+        self.path = get_cache_path(root)
+        self.fingerprint = get_fingerprint(tag_marker, tags, priorities, max_file_size)
+        self.started_at_ns = time.time_ns()
+        self.entries = {}
+        self.seen = {}
+        self.pending_keys = {}
+        self.is_dirty = False
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+
+        if data.get("version") == CACHE_VERSION and data.get(
+                "fingerprint") == self.fingerprint:
+            self.entries = data.get("files", {})
+
+    def clear(self):
+        self.entries = {}
+        self.is_dirty = True
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, file_name):
+        """
+        Return the cached match records for file_name if the file is unchanged
+        since it was cached, otherwise None.
+        """
+        key = get_file_key(file_name)
+
+        if key is None:
+            return None
+
+        entry = self.entries.get(file_name)
+
+        if entry is not None and entry[0] == key:
+            self.seen[file_name] = entry
+            return entry[1]
+
+        self.pending_keys[file_name] = key
+        return None
+
+    def put(self, file_name, records):
+        key = self.pending_keys.pop(file_name, None)
+
+        # A file modified this close to the start of the scan could be modified
+        # again without its mtime changing (coarse filesystem timestamps), so we
+        # don't trust it until a later run sees it settled.
+        if key is None or key[1] >= self.started_at_ns - RACY_WINDOW_NS:
+            self.is_dirty = True
+            return
+
+        self.seen[file_name] = [key, records]
+        self.is_dirty = True
+
+    def save(self):
+        # Only files seen during this run are written back, which also drops
+        # entries for files that have since been deleted or excluded.
+        if not self.is_dirty and len(self.seen) == len(self.entries):
+            return
+
+        data = {
+            "version": CACHE_VERSION,
+            "fingerprint": self.fingerprint,
+            "files": self.seen}
+        temp_path = self.path + ".tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(data, cache_file, separators=(",", ":"))
+
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            printer.log("Could not write scan cache: " + str(e), "warning")
+
+
+class BlobCache:
+    """
+    On-disk cache of the matches found in git blobs, with the same get/put/save
+    interface as ScanCache so that it can be used in its place.
+
+    Entries are keyed by blob hash rather than by path, so a file's matches are still
+    valid after it is renamed and after switching branches back and forth, and only
+    content which has never been scanned before needs to be opened. Blobs are content
+    addressed, so one cache is shared by every repository with the same tag config.
+
+    blobs_by_file maps each file which may be asked for to its blob hash, or None if
+    the file has to be scanned because its working copy differs from every blob.
+    started_at_ns is when blobs_by_file was taken from git (default now). Since a file
+    could be edited after that and before it's read, matches are only stored if the file
+    is unchanged since it was asked for and was last modified well before started_at_ns,
+    otherwise they could end up stored under a blob they weren't found in.
+    """
+
+    def __init__(self, blobs_by_file, tag_marker, tags, priorities, max_file_size=None,
+                 started_at_ns=None):
+        self.blobs_by_file = blobs_by_file
+        self.fingerprint = get_fingerprint(tag_marker, tags, priorities, max_file_size)
+        self.path = os.path.join(
+            get_cache_dir(), "blobs-" + self.fingerprint + ".json")
+        self.started_at_ns = time.time_ns() if started_at_ns is None else started_at_ns
+        self.entries = {}
+        self.pending_keys = {}
+        self.is_dirty = False
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+
+        if data.get("version") == CACHE_VERSION:
+            self.entries = data.get("blobs", {})
+
+    def clear(self):
+        self.entries = {}
+        self.is_dirty = True
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, file_name):
+        blob = self.blobs_by_file.get(file_name)
+
+        if blob is None:
+            return None
+
+        records = self.entries.pop(blob, None)
+
+        if records is not None:
+            # Move to the end so that the blobs used most recently are kept on save
+            self.entries[blob] = records
+            self.is_dirty = True
+        else:
+            self.pending_keys[file_name] = get_file_key(file_name)
+
+        return records
+
+    def put(self, file_name, records):
+        blob = self.blobs_by_file.get(file_name)
+        key = self.pending_keys.pop(file_name, None)
+
+        # The file's content is only known to be the blob's if it hasn't changed since
+        # git compared them, which as with ScanCache can't be told from an mtime this
+        # close to the comparison, nor if it changed while it was being read.
+        if blob is None or key is None or key[1] >= self.started_at_ns - RACY_WINDOW_NS:
+            return
+
+        if get_file_key(file_name) != key:
+            return
+
+        self.entries[blob] = records
+        self.is_dirty = True
+
+    def save(self):
+        if not self.is_dirty:
+            return
+
+        # Blobs from other branches are kept so that switching back is free,
+        # up to a limit which drops the ones used least recently
+        blobs = dict(list(self.entries.items())[-MAX_BLOB_ENTRIES:])
+        data = {"version": CACHE_VERSION, "blobs": blobs}
+        temp_path = self.path + ".tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(data, cache_file, separators=(",", ":"))
+
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            printer.log("Could not write blob cache: " + str(e), "warning")
+
+
+def get_file_key(file_name):
+    """
+    The (size, mtime_ns, inode) triple used to decide if a file has changed,
+    or None if the file can't be stat'ed.
+    """
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def get_fingerprint(tag_marker, tags, priorities, max_file_size=None):
+    """
+    Summarise every piece of config which affects what find_matches returns
+    for a given file. Priorities keep their order because it defines their values.
+    """
+    fingerprint_source = json.dumps(
+        [tag_marker, sorted(tags), list(priorities), max_file_size])
+    return hashlib.sha1(fingerprint_source.encode("utf-8")).hexdigest()
+
+
+def get_cache_dir():
+    cache_home = os.environ.get(
+        "XDG_CACHE_HOME") or os.path.join(str(Path.home()), ".cache")
+    return os.path.join(cache_home, "taggregator")
+
+
+def get_cache_path(root):
+    return os.path.join(get_cache_dir(), get_root_hash(root) + ".json")
+
+
+def get_root_hash(root):
+    """
+    root may also be a list of roots searched together, which get a hash of their own.
+    """
+    roots = [root] if isinstance(root, str) else root
+    return hashlib.sha1("\n".join(
+        os.path.abspath(r) for r in roots).encode("utf-8")).hexdigest()
+
+
+CACHE_VERSION = 2
+MAX_BLOB_ENTRIES = 100000
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import parallel
+from taggregator import tagg
+from taggregator import walker
+import re
+
+
+class FailRule:
+    """
+    A tag which fails the check, optionally only at or above a minimum priority.
+    """
+
+    def __init__(self, tag, min_priority=None):
+        self.tag = tag
+        self.min_priority = min_priority
+
+    def is_failed_by(self, match):
+        return match.tag == self.tag and (
+            self.min_priority is None or match.priority >= self.min_priority)
+
+
+def get_fail_rule(spec, priority_value_map):
+    """
+    Parse a 'TAG' or 'TAG:PRIORITY' spec, raising ValueError for unknown priorities.
+    """
+    tag, _, priority = spec.partition(":")
+    tag = tag.strip().upper()
+    priority = priority.strip().upper()
+
+    if not tag:
+        raise ValueError("No tag given in '%s'" % spec)
+
+    if not priority:
+        return FailRule(tag)
+
+    if priority not in priority_value_map:
+        raise ValueError("Unknown priority '%s' in '%s'" % (priority, spec))
+
+    return FailRule(tag, priority_value_map[priority])
+
+
+def is_failing(match, fail_rules):
+    # No rules means any tag at all fails the check
+    return not fail_rules or any(rule.is_failed_by(match)
+                                 for rule in fail_rules)
+
+
+def check(config_map, fail_rules, max_count=0):
+    """
+    Search for matches which fail any of fail_rules, stopping as soon as more than
+    max_count have been found. Returns the failing matches found (so the check
+    failed if there are more than max_count of them).
+
+    Nothing is sorted or printed, and with a single job files are scanned as they are
+    walked so that a failing tag near the start of the tree ends the search straight away.
+    With several jobs, stopping cancels every batch of files not yet being scanned.
+    """
+    scanner = tagg.get_file_scanner(config_map)
+    jobs = config_map.get("jobs", 1)
+
+    if parallel.get_job_count(jobs) == 1:
+        file_matches = (scanner.scan(f) for f in walker.walk(
+            config_map["root"], tagg.get_path_matcher(config_map)))
+    else:
+        file_matches = parallel.map_files(
+            scanner.scan_batch,
+            tagg.get_files(config_map),
+            jobs,
+            config_map.get("executor", "process"))
+
+    failing_matches = {}
+
+    try:
+        for matches in file_matches:
+            for match in matches:
+                if not is_failing(match, fail_rules):
+                    continue
+
+                failing_matches[match] = None
+
+                if len(failing_matches) > max_count:
+                    return list(failing_matches)
+    finally:
+        file_matches.close()
+
+    return list(failing_matches)
+
+
+def get_fail_rule_tags(fail_rules):
+    """
+    The tags to search for when only fail_rules matter, in the same
+    (escaped, upper case) form as UserConfig's tags.
+    """
+    return set(re.escape(rule.tag) for rule in fail_rules)
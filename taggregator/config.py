@@ -1,10 +1,13 @@
 #! /usr/bin/env python3
 #! -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import os
-import pkg_resources
 import re
+import time
+from taggregator import cache
+from taggregator import metrics
 from taggregator import printer
 from pathlib import Path
 from json.decoder import JSONDecodeError
@@ -23,19 +26,32 @@ class UserConfig:
     """
 
     def __init__(self, raw_runtime_args):
-        # First we grab everything we can from the config file we find (or
-        # create if it doesn't exist)
-        self.config_map = get_config_map()
+        stats_json = getattr(raw_runtime_args, "stats_json", False)
+        stats = metrics.ScanStats() if getattr(
+            raw_runtime_args, "stats", False) or stats_json else None
 
-        default_config = get_default_config_json()
+        with metrics.timer(stats, "config"):
+            self.load(raw_runtime_args)
 
-        for key in default_config:
-            if key not in self.config_map:
-                set_config_property(self.config_map, key, default_config[key])
+        self.config_map["stats"] = stats
+        self.config_map["stats_json"] = stats_json
+
+    def load(self, raw_runtime_args):
+        # First we grab everything we can from the config file we find (or
+        # create if it doesn't exist), with defaults for any keys it's missing
+        self.config_map = get_config_map()
 
         # We then go on to grab the data from command line arguments that
         # wouldn't have made sense to go in a config file
-        self.config_map["root"] = os.path.abspath(raw_runtime_args.root)
+        roots = get_roots(raw_runtime_args)
+        self.config_map["roots"] = roots
+        # With several roots, root is the directory containing all of them
+        self.config_map["root"] = roots[0] if len(
+            roots) == 1 else os.path.commonpath(roots)
+
+        # Options which only some commands take on the command line
+        for key, default in RUNTIME_OPTION_DEFAULTS.items():
+            self.config_map[key] = getattr(raw_runtime_args, key, default)
 
         # If we were passed in a set of tags at runtime they take
         # priority and we use them, falling back to tags in config file.
@@ -47,6 +63,47 @@ class UserConfig:
             [re.escape(tag.strip().upper()) for tag in tags_to_use])
 
 
+def get_roots(raw_runtime_args):
+    """
+    Every root given on the command line or listed (one per line) in a roots file,
+    as absolute paths with duplicates and roots inside other roots removed.
+    Defaults to the current directory.
+    """
+    roots = raw_runtime_args.root
+
+    if isinstance(roots, str):
+        roots = [roots]
+
+    roots_file = getattr(raw_runtime_args, "roots_file", None)
+
+    if roots_file is not None:
+        with open(roots_file, encoding="utf-8") as f:
+            roots = roots + [line.strip() for line in f
+                             if line.strip() and not line.lstrip().startswith("#")]
+
+    return get_outermost_roots([os.path.abspath(root) for root in roots or [""]])
+
+
+def get_outermost_roots(roots):
+    """
+    Drop every root which is the same directory as, or inside, another root,
+    so that no file is searched twice. Order is otherwise kept.
+    """
+    real_roots = [os.path.realpath(root) for root in roots]
+    outermost_roots = []
+
+    for i, real_root in enumerate(real_roots):
+        is_covered = any(
+            j != i and (other == real_root and j < i or
+                        real_root.startswith(other.rstrip(os.sep) + os.sep))
+            for j, other in enumerate(real_roots))
+
+        if not is_covered:
+            outermost_roots.append(roots[i])
+
+    return outermost_roots
+
+
 def get_existing_config_path():
     """
     Look for existing config in first {current dir} and then ~
@@ -71,7 +128,7 @@ def copy_default_config_to_path(path):
 
 
 def get_default_config_json():
-    with open(pkg_resources.resource_filename(__name__, "default_config.json"), encoding="utf-8") as default_config_file:
+    with open(DEFAULT_CONFIG_PATH, encoding="utf-8") as default_config_file:
         return json.loads(default_config_file.read())
 
 # @CLEANUP(LOW) get_config_map is a misleading name
@@ -81,8 +138,8 @@ def get_default_config_json():
 
 def get_config_map():
     """
-    Return the content of a tagg.json if one is found.
-    If not, one is created.
+    Return the content of a tagg.json if one is found, with any keys it is missing
+    filled in from the default config. If not, one is created.
     """
     # If neither ~/.taggregator or {current dir}/.tagg.json exists,
     # create ~/.tagg.json and copy in the default config file from bundle
@@ -93,28 +150,105 @@ def get_config_map():
         printer.log("No config file found!", "warning")
         config_path = create_default_config_file(Path.home())
 
+    config_cache_path = get_config_cache_path(config_path)
+    config_key = get_config_key(config_path)
+    config_map = read_config_cache(config_cache_path, config_key)
+
+    if config_map is not None:
+        return config_map
+
     try:
         with open(config_path) as config_json:
-            return json.load(config_json)
+            config_map = json.load(config_json)
     except JSONDecodeError as je:
         error_string = "Error in your taggregator config file at line %d, column %d, exiting..." % (
             je.lineno, je.colno)
         printer.log(error_string, "fatal error")
         raise SystemExit()
 
+    default_config = get_default_config_json()
+    missing_properties = dict((key, value) for key, value in default_config.items()
+                              if key not in config_map)
 
-def set_config_property(config, key, value):
-    config[key] = value
-    config_path = get_existing_config_path()
+    if missing_properties:
+        set_config_properties(config_map, missing_properties, config_path)
+        config_key = get_config_key(config_path)
+
+    write_config_cache(config_cache_path, config_key, config_map)
+    return config_map
 
-    printer.log(
-        "Found unset config property: '%s', setting it to '%s'" %
-        (key, value), "warning")
+
+def set_config_properties(config, properties, config_path):
+    """
+    Set every one of properties in config and write it back to config_path in one go.
+    """
+    for key, value in properties.items():
+        config[key] = value
+        printer.log(
+            "Found unset config property: '%s', setting it to '%s'" %
+            (key, value), "warning")
 
     with open(config_path, "w") as config_file:
         json.dump(config, config_file, indent=4)
 
 
+def get_config_key(config_path):
+    """
+    Decides whether a cached config is still valid: the config file's path, size,
+    mtime and inode, and the same for the default config (which changes on upgrade).
+    """
+    return [config_path, cache.get_file_key(
+        config_path), cache.get_file_key(DEFAULT_CONFIG_PATH)]
+
+
+def get_config_cache_path(config_path):
+    path_hash = hashlib.sha1(config_path.encode("utf-8")).hexdigest()
+    return os.path.join(cache.get_cache_dir(), "config-" + path_hash + ".json")
+
+
+def read_config_cache(config_cache_path, config_key):
+    """
+    The config map stored by write_config_cache, if it was stored with config_key.
+    """
+    try:
+        with open(config_cache_path, encoding="utf-8") as cache_file:
+            data = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if data.get("version") != CONFIG_CACHE_VERSION or data.get(
+            "key") != config_key:
+        return None
+
+    return data.get("config")
+
+
+def write_config_cache(config_cache_path, config_key, config_map):
+    """
+    Store the config file's contents once they've been parsed and merged with the
+    defaults. Not done if the file was modified so recently that it could change again
+    without its mtime changing (see cache.ScanCache).
+    """
+    file_key = config_key[1]
+
+    if file_key is None or file_key[1] >= time.time_ns() - cache.RACY_WINDOW_NS:
+        return
+
+    data = {"version": CONFIG_CACHE_VERSION, "key": config_key, "config": config_map}
+    temp_path = config_cache_path + ".tmp"
+
+    try:
+        os.makedirs(os.path.dirname(config_cache_path), exist_ok=True)
+
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(data, cache_file, separators=(",", ":"))
+
+        os.replace(temp_path, config_cache_path)
+    except OSError:
+        # Only ever an optimisation
+        pass
+
+
 def create_default_config_file(directory):
     path = os.path.join(directory, CONFIG_FILE_NAME)
 
@@ -132,5 +266,25 @@ def create_default_config_file(directory):
     return path
 
 
+CONFIG_CACHE_VERSION = 1
 CONFIG_FILE_NAME = ".tagg.json"
+DEFAULT_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "default_config.json")
+RUNTIME_OPTION_DEFAULTS = {
+    "use_cache": False,
+    "clear_cache": False,
+    "jobs": 1,
+    "executor": "process",
+    "matcher": "text",
+    "walk_report": False,
+    "format": "table",
+    "git": False,
+    "merged": False,
+    "pipeline": False,
+    "io_schedule": False,
+    "readahead": None,
+    "limit": None,
+    "page": None,
+    "summary_first": False,
+}
 HOME_DIR_CONFIG_PATH = os.path.join(str(Path.home()), CONFIG_FILE_NAME)
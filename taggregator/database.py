@@ -0,0 +1,219 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import cache
+from taggregator import tagg
+from collections import Counter
+import json
+import os
+import sqlite3
+import time
+
+
+class TagDatabase:
+    """
+    SQLite index of every match under a root, which 'tagg query' answers from without
+    searching anything. update() only rescans files whose size, mtime or inode changed
+    since they were indexed, and drops files which have gone.
+
+    Paths are stored relative to the root, so snapshots of two checkouts of the
+    same project in different places can be compared (see get_snapshot_diff).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def is_empty(self):
+        return "fingerprint" not in self.meta
+
+    def get_root(self):
+        return self.meta["root"]
+
+    def get_tag_marker(self):
+        return self.meta["tag_marker"]
+
+    def get_priorities(self):
+        return json.loads(self.meta["priorities"])
+
+    def set_meta(self, **values):
+        self.meta.update(values)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values.items())
+
+    def update(self, config_map):
+        """
+        Bring the index up to date with the files under config_map's roots.
+        Returns (number of files indexed, number of them which had to be rescanned).
+        """
+        root = config_map["root"]
+        fingerprint = cache.get_fingerprint(
+            config_map["tag_marker"], config_map["tags"], config_map["priorities"],
+            config_map.get("max_file_size"))
+        started_at_ns = time.time_ns()
+
+        with self.connection:
+            # Every stored match could be wrong if the tags (or the files searched) changed
+            if self.meta.get("fingerprint") != fingerprint or self.meta.get("root") != root:
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("DELETE FROM matches")
+                self.set_meta(
+                    version=str(DATABASE_VERSION),
+                    fingerprint=fingerprint,
+                    root=root,
+                    tag_marker=config_map["tag_marker"],
+                    priorities=json.dumps(list(config_map["priorities"])))
+
+            stored_keys = dict((path, (size, mtime_ns, inode)) for path, size, mtime_ns, inode in
+                               self.connection.execute("SELECT path, size, mtime_ns, inode FROM files"))
+            keys = {}
+            files_to_scan = []
+
+            for file_name in tagg.get_all_files(config_map):
+                key = cache.get_file_key(file_name)
+
+                if key is None:
+                    continue
+
+                path = os.path.relpath(file_name, root)
+                keys[path] = key
+
+                if stored_keys.get(path) != tuple(key):
+                    files_to_scan.append(file_name)
+
+            gone_paths = [(path,) for path in stored_keys if path not in keys]
+            self.connection.executemany("DELETE FROM files WHERE path = ?", gone_paths)
+            self.connection.executemany("DELETE FROM matches WHERE path = ?", gone_paths)
+
+            for file_name, matches in tagg.scan_files(
+                    tagg.get_file_scanner(config_map),
+                    files_to_scan,
+                    None,
+                    config_map.get("jobs", 1),
+                    config_map.get("executor", "process")):
+                path = os.path.relpath(file_name, root)
+                size, mtime_ns, inode = keys[path]
+
+                # A file modified this close to the update could be modified again without
+                # its mtime changing, so it's stored in a way which gets it rescanned next time
+                if mtime_ns >= started_at_ns - cache.RACY_WINDOW_NS:
+                    mtime_ns = None
+
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode) VALUES (?, ?, ?, ?)",
+                    (path, size, mtime_ns, inode))
+                self.connection.execute("DELETE FROM matches WHERE path = ?", (path,))
+                self.connection.executemany(
+                    "INSERT INTO matches (path, line_number, line, tag, priority) VALUES (?, ?, ?, ?, ?)",
+                    [(path, m.line_number, m.line, m.tag, m.priority) for m in dict.fromkeys(matches)])
+
+        return len(keys), len(files_to_scan)
+
+    def query(self, tags=None, min_priority=None, path_prefix=None):
+        """
+        The matches with any of tags, of at least min_priority (a priority value) and in
+        the file or directory path_prefix (relative to the root), in path and line order.
+        Each filter which is None is left out.
+        """
+        clauses = []
+        params = []
+
+        if tags:
+            clauses.append("tag IN (%s)" % ", ".join("?" * len(tags)))
+            params.extend(tag.upper() for tag in tags)
+
+        if min_priority is not None:
+            clauses.append("priority >= ?")
+            params.append(min_priority)
+
+        path_prefix = os.path.normpath(path_prefix) if path_prefix else os.curdir
+
+        if path_prefix != os.curdir:
+            # A range rather than LIKE so that the path index is used (and '_' isn't a wildcard)
+            clauses.append("(path = ? OR (path >= ? AND path < ?))")
+            params.extend([path_prefix, path_prefix + os.sep,
+                           path_prefix + chr(ord(os.sep) + 1)])
+
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        root = self.get_root()
+
+        return [tagg.Match(os.path.join(root, path), line_number, line, tag, priority)
+                for path, line_number, line, tag, priority in self.connection.execute(
+                    "SELECT path, line_number, line, tag, priority FROM matches" + where +
+                    " ORDER BY path, line_number", params)]
+
+    def get_match_key(self, match):
+        """
+        What makes two matches in different snapshots the same tag. Line numbers aren't
+        part of it since they shift whenever lines above are added or removed.
+        """
+        return (os.path.relpath(match.file_name, self.get_root()),
+                match.tag, match.priority, match.line)
+
+
+def get_snapshot_diff(old_database, new_database, **filters):
+    """
+    (added, removed): the matches in new_database which aren't in old_database and the
+    matches in old_database which aren't in new_database, both filtered as by query().
+    A tag which is in a snapshot twice only counts as the same as one of those in the other.
+    """
+    old_matches = old_database.query(**filters)
+    new_matches = new_database.query(**filters)
+
+    return (get_unmatched(new_matches, new_database, old_matches, old_database),
+            get_unmatched(old_matches, old_database, new_matches, new_database))
+
+
+def get_unmatched(matches, database, other_matches, other_database):
+    remaining = Counter(other_database.get_match_key(m) for m in other_matches)
+    unmatched = []
+
+    for match in matches:
+        key = database.get_match_key(match)
+
+        if remaining[key] > 0:
+            remaining[key] -= 1
+        else:
+            unmatched.append(match)
+
+    return unmatched
+
+
+def get_database_path(root):
+    """
+    Where the index for root (or a list of roots indexed together)
+    lives unless another path is given. The order roots are listed in doesn't matter.
+    """
+    roots = [root] if isinstance(root, str) else sorted(root)
+    return os.path.join(cache.get_cache_dir(), "index-" + cache.get_root_hash(roots) + ".db")
+
+
+DATABASE_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER,
+    inode INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS matches (
+    path TEXT NOT NULL,
+    line_number INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    priority INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS matches_by_tag ON matches (tag, priority);
+CREATE INDEX IF NOT EXISTS matches_by_priority ON matches (priority);
+CREATE INDEX IF NOT EXISTS matches_by_path ON matches (path, line_number);
+"""
@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import tagg
+import os
+import re
+import subprocess
+
+
+def get_staged_diff(root):
+    """
+    The lines of the diff of everything staged for the next commit under root,
+    with paths relative to root and without any context lines.
+    """
+    output = subprocess.run(
+        ["git", "-C", root, "-c", "core.quotePath=off", "diff", "--cached",
+         "--relative", "--no-color", "--no-ext-diff", "--unified=0"],
+        stdout=subprocess.PIPE,
+        check=True).stdout
+
+    return output.decode("utf-8", "replace").splitlines()
+
+
+def get_diff_path(header_path):
+    """
+    The file name from a '+++' header, without git's 'b/' prefix or any timestamp.
+    None for a file deleted by the diff.
+    """
+    path = header_path.split("\t", 1)[0].rstrip("\r")
+
+    if path == "/dev/null":
+        return None
+
+    if path.startswith('"') and path.endswith('"'):
+        path = get_unquoted_path(path[1:-1])
+
+    return path[2:] if path.startswith("b/") else path
+
+
+def get_unquoted_path(quoted_path):
+    """
+    A path the way it is on disk from the way git quotes one with unusual characters in
+    it: C-style backslash escapes, and an octal escape for each byte of every non-ASCII
+    character unless core.quotePath is off.
+    """
+    path_bytes = QUOTED_ESCAPE_REGEX.sub(
+        lambda escape: get_escaped_byte(escape.group(1)),
+        quoted_path.encode("utf-8", "surrogateescape"))
+
+    return path_bytes.decode("utf-8", "surrogateescape")
+
+
+def get_escaped_byte(escape):
+    if escape[:1].isdigit():
+        return bytes([int(escape, 8) & 0xff])
+
+    return QUOTED_ESCAPES.get(escape, escape)
+
+
+def get_added_lines(diff_lines):
+    """
+    Yield (path, line number in the new file, text) for every line added by a unified diff.
+    Each hunk's header says how many old and new lines it holds, which is how lines like
+    '--- x' inside a hunk are told apart from the header of the next file.
+    """
+    path = None
+    line_number = 0
+    old_remaining = 0
+    new_remaining = 0
+
+    for line in diff_lines:
+        line = line.rstrip("\n")
+
+        if old_remaining > 0 or new_remaining > 0:
+            marker = line[:1]
+
+            if marker == "+":
+                if path is not None:
+                    yield path, line_number, line[1:].rstrip("\r")
+
+                line_number += 1
+                new_remaining -= 1
+            elif marker == "-":
+                old_remaining -= 1
+            elif marker == "\\":
+                # '\ No newline at end of file'
+                pass
+            else:
+                line_number += 1
+                old_remaining -= 1
+                new_remaining -= 1
+
+            continue
+
+        if line.startswith("+++ "):
+            path = get_diff_path(line[4:])
+            continue
+
+        hunk_header = HUNK_HEADER_REGEX.match(line)
+
+        if hunk_header is not None:
+            old_remaining = int(hunk_header.group("old_count") or 1)
+            line_number = int(hunk_header.group("new_start"))
+            new_remaining = int(hunk_header.group("new_count") or 1)
+
+
+def find_diff_matches(config_map, diff_lines):
+    """
+    The matches on the lines added by a diff, with the line numbers they have in the new
+    version of each file. Files which wouldn't be searched by a normal run are skipped.
+    Only the diff is read, so this takes as long as the diff is big however big the tree is.
+    """
+    scanner = tagg.get_file_scanner(config_map)
+    path_matcher = tagg.get_path_matcher(config_map)
+    is_wanted_by_path = {}
+    matches = []
+
+    for path, line_number, line in get_added_lines(diff_lines):
+        file_name = os.path.join(config_map["root"], os.path.normpath(path))
+        is_wanted = is_wanted_by_path.get(file_name)
+
+        if is_wanted is None:
+            is_wanted = path_matcher.is_wanted_file(file_name)
+            is_wanted_by_path[file_name] = is_wanted
+
+        if is_wanted:
+            matches.extend(
+                tagg.get_line_matches(
+                    scanner.tag_regex,
+                    file_name,
+                    line_number,
+                    line,
+                    scanner.priority_value_map))
+
+    return matches
+
+
+# The single character escapes git uses in quoted paths, anything else stands for itself
+QUOTED_ESCAPES = {
+    b"a": b"\a",
+    b"b": b"\b",
+    b"t": b"\t",
+    b"n": b"\n",
+    b"v": b"\v",
+    b"f": b"\f",
+    b"r": b"\r",
+}
+QUOTED_ESCAPE_REGEX = re.compile(rb"\\([0-7]{3}|.)", re.DOTALL)
+HUNK_HEADER_REGEX = re.compile(
+    r"@@ -\d+(?:,(?P<old_count>\d+))? \+(?P<new_start>\d+)(?:,(?P<new_count>\d+))? @@")
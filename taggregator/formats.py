@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from abc import ABC
+from abc import abstractmethod
+from pathlib import Path
+import csv
+import json
+import os
+import sys
+
+
+class MatchWriter(ABC):
+    """
+    Writes matches one at a time to a stream in a machine-readable format, so that
+    they can be passed on as soon as they're found without holding on to any of them.
+    Each format only has to say how to write a match, the header and footer are optional.
+    """
+
+    def __init__(self, stream, priority_value_map, root):
+        self.stream = stream
+        self.value_priority_map = dict((value, priority)
+                                       for priority, value in priority_value_map.items())
+        self.root = root
+
+    def get_record(self, match):
+        return {
+            "file": match.file_name,
+            "line": match.line_number,
+            "tag": match.tag,
+            "priority": self.value_priority_map.get(match.priority),
+            "text": match.line,
+        }
+
+    def write_header(self):
+        pass
+
+    @abstractmethod
+    def write(self, match):
+        pass
+
+    def write_footer(self):
+        pass
+
+
+class JsonLinesWriter(MatchWriter):
+    def write(self, match):
+        self.stream.write(json.dumps(self.get_record(match)) + "\n")
+
+
+class CsvWriter(MatchWriter):
+    FIELDS = ["file", "line", "tag", "priority", "text"]
+
+    def __init__(self, stream, priority_value_map, root):
+        super().__init__(stream, priority_value_map, root)
+        self.csv_writer = csv.DictWriter(
+            stream, self.FIELDS, lineterminator="\n")
+
+    def write_header(self):
+        self.csv_writer.writeheader()
+
+    def write(self, match):
+        self.csv_writer.writerow(self.get_record(match))
+
+
+class SarifWriter(MatchWriter):
+    """
+    SARIF 2.1.0, the static analysis results format understood by code scanning
+    dashboards. The surrounding document is written around the results by hand
+    so that results can still be streamed out one by one.
+    """
+
+    def __init__(self, stream, priority_value_map, root):
+        super().__init__(stream, priority_value_map, root)
+        self.highest_priority = max(priority_value_map.values(), default=None)
+        self.result_count = 0
+
+    def write_header(self):
+        run_header = {
+            "tool": {
+                "driver": {
+                    "name": "taggregator",
+                    "informationUri": "https://github.com/jamtartley/taggregator"}},
+            "originalUriBaseIds": {
+                "ROOT": {
+                    "uri": Path(self.root).as_uri().rstrip("/") + "/"}}}
+        # Leave the run object open so results can be appended to it
+        self.stream.write('{"$schema": "%s", "version": "2.1.0", "runs": [%s, "results": [' % (
+            SARIF_SCHEMA, json.dumps(run_header)[:-1]))
+
+    def write(self, match):
+        if self.result_count > 0:
+            self.stream.write(",")
+
+        self.stream.write("\n" + json.dumps(self.get_result(match)))
+        self.result_count += 1
+
+    def write_footer(self):
+        self.stream.write("\n]}]}\n")
+
+    def get_level(self, priority):
+        if priority == self.highest_priority:
+            return "error"
+        elif priority < 0:
+            return "note"
+
+        return "warning"
+
+    def get_result(self, match):
+        return {
+            "ruleId": match.tag,
+            "level": self.get_level(match.priority),
+            "message": {"text": match.line},
+            "locations": [{
+                "physicalLocation": {
+                    "artifactLocation": {
+                        "uri": Path(os.path.relpath(match.file_name, self.root)).as_posix(),
+                        "uriBaseId": "ROOT"},
+                    "region": {"startLine": match.line_number}}}],
+        }
+
+
+def get_writer(output_format, stream, priority_value_map, root):
+    return WRITERS[output_format](stream, priority_value_map, root)
+
+
+def open_output():
+    """
+    A single large buffer over stdout, so that many small writes
+    turn into a few big ones when output is piped somewhere.
+    """
+    sys.stdout.flush()
+    return open(
+        sys.stdout.fileno(),
+        "w",
+        encoding="utf-8",
+        buffering=OUTPUT_BUFFER_SIZE,
+        newline="",
+        closefd=False)
+
+
+OUTPUT_BUFFER_SIZE = 256 * 1024
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+    "sarif": SarifWriter,
+}
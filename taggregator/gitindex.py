@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+import os
+
+
+def run_git(root, args):
+    """
+    Run a git command in root and return its output, raising OSError if git
+    isn't installed or root isn't inside a repository.
+    """
+    # Only imported when needed since it's slow to import and most runs don't use git
+    import subprocess
+
+    result = subprocess.run(
+        ["git", "-C", root] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+
+    if result.returncode != 0:
+        raise OSError("git %s exited with status %d" %
+                      (args[0], result.returncode))
+
+    return os.fsdecode(result.stdout)
+
+
+def get_index_entries(root):
+    """
+    Map the path (relative to root) of every regular file under root which is tracked
+    in the repository's index to its blob hash. Conflicted files map to None, since
+    none of their stages is what is on disk.
+    """
+    entries = {}
+
+    for record in run_git(root, ["ls-files", "-s", "-z"]).split("\0"):
+        if not record:
+            continue
+
+        info, path = record.split("\t", 1)
+        mode, blob, stage = info.split(" ")
+
+        # Symlinks and submodules have no content of their own to search
+        if mode not in REGULAR_FILE_MODES:
+            continue
+
+        entries[path] = blob if stage == "0" else None
+
+    return entries
+
+
+def get_changed_paths(root):
+    """
+    Map the path (relative to root) of every tracked file whose working copy differs
+    from the index to its status letter ('M'odified, 'D'eleted, ...).
+    """
+    fields = run_git(
+        root, ["diff-files", "--relative", "--name-status", "-z"]).split("\0")
+
+    return dict((path, status)
+                for status, path in zip(fields[0::2], fields[1::2]) if path)
+
+
+def get_blobs_by_file(root):
+    """
+    Map the absolute path of every tracked file under root which exists on disk to the
+    hash of the blob with the same content, or None where the working copy has changed
+    since it was added to the index (so it has to be scanned however it's cached).
+
+    Untracked files are left out entirely, ignored or not.
+    """
+    entries = get_index_entries(root)
+
+    for path, status in get_changed_paths(root).items():
+        if path not in entries:
+            continue
+
+        if status == "D":
+            del entries[path]
+        else:
+            entries[path] = None
+
+    return dict((os.path.join(root, os.path.normpath(path)), blob)
+                for path, blob in entries.items())
+
+
+REGULAR_FILE_MODES = {"100644", "100755"}
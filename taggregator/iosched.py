@@ -0,0 +1,192 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import parallel
+import itertools
+import os
+import threading
+
+
+class IoScheduler:
+    """
+    Sits between the walk and the scan to cut down on seeking: files are read in order
+    of (device, inode) rather than the order they were walked in, and the kernel is told
+    to start reading each one a window of files before the scan gets to it, so that its
+    pages are (ideally) already cached when it's opened.
+
+    Inode numbers are only a proxy for where a file's data is on disk, but on most local
+    filesystems files created together get nearby inodes and nearby blocks.
+
+    file_ids maps paths to their (st_dev, st_ino) as found by the walk (see walker.walk),
+    anything missing from it is stat'ed.
+    """
+
+    def __init__(self, window=None, stats=None, file_ids=None, batch_size=None):
+        self.window = READAHEAD_WINDOW if window is None else window
+        self.stats = stats
+        self.file_ids = file_ids
+        self.batch_size = batch_size or REORDER_BATCH_SIZE
+
+    def get_read_order(self, files):
+        return get_physical_order(files, self.stats, self.file_ids)
+
+    def map_files(self, scan_batch, file_names, jobs=1, executor="process", stats=None):
+        """
+        parallel.map_files, reading the files in physical order within consecutive batches
+        of batch_size files. Each batch's results are given back in the order of file_names
+        once its last file has been read, so only one batch of results is held at a time
+        and results still stream out as the scan goes.
+        """
+        batches = parallel.get_chunks(file_names, self.batch_size)
+        read_batches = [self.get_read_order(batch) for batch in batches]
+        read_order = list(itertools.chain.from_iterable(read_batches))
+        scanned = parallel.map_files(scan_batch, read_order, jobs, executor, stats)
+        results = self.track(read_order, scanned)
+
+        try:
+            for batch, read_batch in zip(batches, read_batches):
+                results_by_file = dict(zip(read_batch, itertools.islice(results, len(read_batch))))
+
+                for file_name in batch:
+                    yield results_by_file.pop(file_name)
+        finally:
+            # Stops the hints and the workers if the caller stopped early
+            results.close()
+            scanned.close()
+
+    def track(self, file_names, results):
+        """
+        Yield from results (one for each of file_names, in the same order) while a thread
+        hints that the files up to window ahead of the last result yielded will be read.
+        Hints are only hints, so they stop being given as soon as results stops.
+        """
+        if self.window <= 0 or not CAN_ADVISE:
+            yield from results
+            return
+
+        prefetcher = Prefetcher(file_names, self.window)
+        prefetcher.start()
+
+        try:
+            for result in results:
+                prefetcher.advance()
+                yield result
+        finally:
+            prefetcher.stop()
+
+            if self.stats is not None:
+                self.stats.add("files_prefetched", prefetcher.prefetched_count)
+
+
+class Prefetcher(threading.Thread):
+    """
+    Gives readahead hints for file_names in order, never getting more than window files
+    ahead of the reader (who calls advance() after each file). Runs in a thread of its own
+    because opening a file to give the hint can itself wait on the disk for the inode.
+    """
+
+    def __init__(self, file_names, window):
+        super().__init__(daemon=True)
+        self.file_names = file_names
+        self.slots = threading.Semaphore(window)
+        self.stopped = threading.Event()
+        self.prefetched_count = 0
+
+    def run(self):
+        for file_name in self.file_names:
+            self.slots.acquire()
+
+            if self.stopped.is_set():
+                return
+
+            if advise_will_need(file_name):
+                self.prefetched_count += 1
+
+    def advance(self):
+        self.slots.release()
+
+    def stop(self):
+        self.stopped.set()
+        # Wake the thread up if it's waiting for a slot
+        self.slots.release()
+        self.join()
+
+
+def get_physical_order(files, stats=None, file_ids=None):
+    """
+    files sorted by (st_dev, st_ino), taken from file_ids where it has them. Only the
+    rest are stat'ed, since on a cold cache each stat is a read of its own. Files which
+    can't be stat'ed go last, in the order they were given, so that the scan can report
+    them as it would have anyway.
+    """
+    keys = {}
+    unstatable = []
+    stat_count = 0
+
+    for file_name in files:
+        file_id = file_ids.get(file_name) if file_ids is not None else None
+
+        if file_id is None:
+            stat_count += 1
+
+            try:
+                stat_result = os.stat(file_name)
+            except OSError:
+                unstatable.append(file_name)
+                continue
+
+            file_id = (stat_result.st_dev, stat_result.st_ino)
+
+        keys[file_name] = file_id
+
+    if stats is not None:
+        stats.add("files_reordered", len(keys))
+        stats.add("stat_calls_for_order", stat_count)
+
+    return sorted(keys, key=keys.get) + unstatable
+
+
+def advise_will_need(file_name):
+    """
+    Ask the kernel to start reading the start of file_name into the page cache without
+    waiting for it. Returns False if it couldn't be asked (the file's gone, say).
+    """
+    try:
+        fd = open_noatime(file_name, os.O_RDONLY)
+    except OSError:
+        return False
+
+    try:
+        os.posix_fadvise(fd, 0, PREFETCH_SIZE, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+    return True
+
+
+def open_noatime(path, flags, mode=0o777):
+    """
+    os.open with O_NOATIME where the platform has it, so that reading doesn't write
+    the file's access time back to disk. Usable as open()'s opener.
+    """
+    if NOATIME_FLAG:
+        try:
+            return os.open(path, flags | NOATIME_FLAG, mode)
+        except PermissionError:
+            # Only allowed for files we own (or with CAP_FOWNER), so just open it normally
+            pass
+
+    return os.open(path, flags, mode)
+
+
+CAN_ADVISE = hasattr(os, "posix_fadvise")
+NOATIME_FLAG = getattr(os, "O_NOATIME", 0)
+# Number of bytes at the start of each file to ask for ahead of time. Reading the
+# rest of a bigger file sets off the kernel's own readahead anyway
+PREFETCH_SIZE = 1024 * 1024
+# Number of files ahead of the reader to give hints for
+READAHEAD_WINDOW = 64
+# Number of files put in physical order at a time, and so of results held back
+REORDER_BATCH_SIZE = 1024
@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from collections import defaultdict
+import contextlib
+import json
+import time
+
+
+class ScanStats:
+    """
+    Counters and per-stage timers for a single run, cheap enough to leave on in production.
+
+    Everything which takes stats treats None as "don't keep any", so the cost when
+    stats are off is a single comparison. Stats gathered in worker processes are
+    merged back into the parent's with merge().
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)
+
+    def add(self, name, amount=1):
+        self.counters[name] += amount
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
+
+    def merge(self, other):
+        for name, amount in other.counters.items():
+            self.counters[name] += amount
+
+        for stage, seconds in other.timings.items():
+            self.timings[stage] += seconds
+
+    def add_walk_stats(self, walk_stats):
+        self.add("dirs_walked", walk_stats.dirs_walked)
+        self.add("dirs_pruned", walk_stats.dirs_pruned)
+        self.add("files_walked", walk_stats.files_walked)
+        self.add("files_filtered", walk_stats.files_excluded +
+                 walk_stats.files_filtered + walk_stats.duplicates_skipped)
+
+    def to_dict(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "timings": dict(sorted(self.timings.items())),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+    def get_report_lines(self):
+        lines = ["%-28s%12d" % (name.replace("_", " "), amount)
+                 for name, amount in sorted(self.counters.items())]
+        # File reading and matching are summed over every worker when scanning in parallel
+        lines += ["%-28s%11.1fms" % (stage + " time", seconds * 1000)
+                  for stage, seconds in sorted(self.timings.items())]
+
+        return lines
+
+
+def timer(stats, stage):
+    """
+    stats.timer(stage) if stats are being kept, otherwise a context which does nothing.
+    """
+    return stats.timer(stage) if stats is not None else contextlib.nullcontext()
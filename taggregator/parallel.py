@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+import importlib
+import os
+
+# Executor class names in concurrent.futures, which is only imported when a scan
+# actually runs in parallel because it pulls in multiprocessing and logging
+EXECUTORS = {
+    # Threads are cheap to start and share memory, which makes them the better
+    # choice when most of the time is spent waiting on the disk (reads release the GIL)
+    "thread": "ThreadPoolExecutor",
+    # Processes sidestep the GIL for the decoding/lowercasing/regex work, at the cost
+    # of start-up time and pickling every batch of results back to the parent
+    "process": "ProcessPoolExecutor",
+}
+
+
+def get_job_count(jobs):
+    """
+    0 (or less) means use every CPU available.
+    """
+    return jobs if jobs > 0 else (os.cpu_count() or 1)
+
+
+def get_chunk_size(file_count, jobs):
+    """
+    Hand out files in batches big enough to amortise the per-task overhead
+    but small enough that every worker gets a few batches to balance the load.
+    """
+    return max(1, min(MAX_CHUNK_SIZE, file_count // (jobs * CHUNKS_PER_JOB)))
+
+
+def get_chunks(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def map_files(scan_batch, file_names, jobs=1, executor="process", stats=None):
+    """
+    Yield scan_batch's result for each of file_names, in the same order as file_names.
+
+    scan_batch must take a list of file names and return a list of results of the same
+    length, along with the ScanStats for the batch (or None) which are merged into stats.
+    With a single job everything runs in the calling thread so that the serial path pays
+    nothing for the machinery it doesn't use.
+    """
+    jobs = get_job_count(jobs)
+
+    if jobs == 1 or len(file_names) <= 1:
+        for file_name in file_names:
+            results, batch_stats = scan_batch([file_name])
+            merge_stats(stats, batch_stats)
+            yield results[0]
+        return
+
+    chunks = get_chunks(file_names, get_chunk_size(len(file_names), jobs))
+    pool = get_executor_class(executor)(max_workers=jobs)
+
+    # Executor.map hands results back in submission order however they
+    # complete, which keeps the output identical to the serial path
+    results_by_chunk = pool.map(scan_batch, chunks)
+
+    try:
+        for results, batch_stats in results_by_chunk:
+            merge_stats(stats, batch_stats)
+            yield from results
+    finally:
+        # If the caller stopped early, closing the map's iterator cancels
+        # every batch which hasn't started yet so we only wait for running ones
+        results_by_chunk.close()
+        pool.shutdown(wait=True)
+
+
+def get_executor_class(executor):
+    return getattr(importlib.import_module(
+        "concurrent.futures"), EXECUTORS[executor])
+
+
+def merge_stats(stats, batch_stats):
+    if stats is not None and batch_stats is not None:
+        stats.merge(batch_stats)
+
+
+CHUNKS_PER_JOB = 4
+MAX_CHUNK_SIZE = 256
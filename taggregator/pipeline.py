@@ -0,0 +1,235 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import metrics
+from taggregator import tagg
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import queue
+import threading
+
+
+class Pipeline:
+    """
+    Walks, reads and searches files all at the same time, instead of walking the whole
+    tree before reading the first file:
+
+        walker thread -> paths -> reader coroutines -> contents -> matcher coroutine -> results
+
+    The walker pulls file names from a (lazy) iterable in a thread of its own, readers
+    hand the reading off to a pool of threads (see FileScanner.read) and the matcher
+    searches what they read on the event loop's thread. Results come out in the order the
+    files were walked, through a thread-safe queue for whoever consumes them.
+
+    Memory stays bounded however big the tree is: the walker can only get WINDOW_SIZE
+    files ahead of the consumer, and readers wait while CONTENTS_QUEUE_SIZE files' contents
+    are waiting to be searched.
+    """
+
+    def __init__(self, scanner, files, scan_cache=None, reader_count=None):
+        self.scanner = scanner
+        self.files = files
+        self.scan_cache = scan_cache
+        self.reader_count = reader_count or READER_COUNT
+        self.stats = metrics.ScanStats() if scanner.keep_stats else None
+        self.walk_stats = metrics.ScanStats() if scanner.keep_stats else None
+        # Taken by the walker for each file, given back once the consumer has had it
+        self.window = threading.Semaphore(WINDOW_SIZE)
+        self.stopped = threading.Event()
+        self.results = queue.Queue()
+        self.paths = None
+        self.contents = None
+        # Results which came in ahead of a file walked before them, by walk order
+        self.finished = {}
+        self.next_index = 0
+
+    def walk(self, loop):
+        files = iter(self.files)
+        index = 0
+
+        while True:
+            with metrics.timer(self.walk_stats, "walk"):
+                file_name = next(files, None)
+
+            if file_name is None:
+                return
+
+            self.window.acquire()
+
+            if self.stopped.is_set():
+                return
+
+            loop.call_soon_threadsafe(
+                self.paths.put_nowait, (index, file_name))
+            index += 1
+
+    async def read(self, loop, pool):
+        while True:
+            item = await self.paths.get()
+
+            if item is None:
+                return
+
+            index, file_name = item
+
+            if self.stopped.is_set():
+                self.finish(index, file_name, [], False)
+                continue
+
+            records = self.scan_cache.get(
+                file_name) if self.scan_cache is not None else None
+
+            if records is not None:
+                if self.stats is not None:
+                    self.stats.add("files_from_cache")
+
+                self.finish(index, file_name, [tagg.Match(file_name, *record)
+                                               for record in records], False)
+                continue
+
+            try:
+                contents, read_stats = await loop.run_in_executor(pool, self.read_file, file_name)
+            except Exception as e:
+                self.fail(index, e)
+                continue
+
+            if self.stats is not None:
+                self.stats.merge(read_stats)
+
+            await self.contents.put((index, file_name, contents))
+
+    def read_file(self, file_name):
+        # Runs on a reader thread, so it keeps its own stats for the loop to merge
+        read_stats = metrics.ScanStats() if self.stats is not None else None
+        return self.scanner.read(file_name, read_stats), read_stats
+
+    async def match(self):
+        while True:
+            item = await self.contents.get()
+
+            if item is None:
+                return
+
+            index, file_name, contents = item
+
+            if self.stopped.is_set():
+                self.finish(index, file_name, [], False)
+            elif isinstance(contents, str):
+                try:
+                    matches = self.scanner.match(file_name, contents, self.stats)
+                except Exception as e:
+                    self.fail(index, e)
+                    continue
+
+                self.finish(index, file_name, matches)
+            else:
+                self.finish(index, file_name, contents or [])
+
+    def finish(self, index, file_name, matches, should_cache=True):
+        """
+        Pass on a file's matches, along with any from files walked after it which were
+        waiting on it. should_cache is False for matches which didn't come from a scan.
+        """
+        if should_cache and self.scan_cache is not None:
+            self.scan_cache.put(file_name, [[m.line_number, m.line, m.tag, m.priority]
+                                            for m in matches])
+
+        self.pass_on(index, (file_name, matches))
+
+    def fail(self, index, error):
+        """
+        Pass error on in place of a file's matches, so that the consumer gets the results
+        for every file walked before it and then raises it (which stops the pipeline).
+        """
+        self.pass_on(index, error)
+
+    def pass_on(self, index, result):
+        self.finished[index] = result
+
+        while self.next_index in self.finished:
+            self.results.put(self.finished.pop(self.next_index))
+            self.next_index += 1
+
+    async def run(self):
+        """
+        Run every stage until the walk is over and every file it found has been searched,
+        then put DONE (or the exception which stopped the pipeline) on the results queue.
+        """
+        loop = asyncio.get_event_loop()
+        self.paths = asyncio.Queue()
+        self.contents = asyncio.Queue(CONTENTS_QUEUE_SIZE)
+        # One thread for the walker and one for each reader
+        pool = ThreadPoolExecutor(max_workers=self.reader_count + 1)
+        walking = loop.run_in_executor(pool, self.walk, loop)
+        readers = [asyncio.ensure_future(self.read(loop, pool))
+                   for _ in range(self.reader_count)]
+        matcher = asyncio.ensure_future(self.match())
+
+        try:
+            await walking
+
+            for _ in readers:
+                self.paths.put_nowait(None)
+
+            await asyncio.gather(*readers)
+            await self.contents.put(None)
+            await matcher
+            self.results.put(DONE)
+        except Exception as e:
+            self.stop()
+
+            for task in readers + [matcher]:
+                task.cancel()
+
+            await asyncio.gather(walking, *readers, matcher, return_exceptions=True)
+            self.results.put(e)
+        finally:
+            pool.shutdown(wait=True)
+
+    def stop(self):
+        """
+        Stop walking. Safe to call from any thread. Files already walked are passed
+        over without being read.
+        """
+        self.stopped.set()
+        # Wake the walker if it's waiting for room in the window
+        self.window.release()
+
+
+def scan_files(scanner, files, scan_cache=None, stats=None, reader_count=None):
+    """
+    Yield (file_name, matches) for every file in files, in the same order as files, like
+    tagg.scan_files. files can be a generator (see tagg.iter_all_files), which is consumed
+    on another thread while the files it has already given are being searched, so the
+    first results arrive before the walk is over.
+    """
+    pipeline = Pipeline(scanner, files, scan_cache, reader_count)
+    thread = threading.Thread(target=asyncio.run, args=(pipeline.run(),))
+    thread.start()
+
+    try:
+        while True:
+            result = pipeline.results.get()
+
+            if result is DONE:
+                break
+
+            if isinstance(result, Exception):
+                raise result
+
+            yield result
+            pipeline.window.release()
+    finally:
+        # Only does anything if the caller stopped early or something went wrong
+        pipeline.stop()
+        thread.join()
+
+        if stats is not None and pipeline.stats is not None:
+            stats.merge(pipeline.stats)
+            stats.merge(pipeline.walk_stats)
+
+
+DONE = object()
+CONTENTS_QUEUE_SIZE = 16
+READER_COUNT = 8
+WINDOW_SIZE = 256
@@ -2,11 +2,14 @@
 #! -*- coding: utf-8 -*-
 
 from __future__ import print_function  # Fix python2 runtime error with end=x
+from collections import Counter
 from collections import defaultdict
-from os import get_terminal_size
-from taggregator.tagg import Match
+from taggregator import tagg
+import heapq
 import math
-import statistics
+import os
+import sys
+import time
 
 
 class TerminalColours:
@@ -32,7 +35,10 @@ def get_priority_to_colour_map(priority_value_map):
     Map a priority value to a colour based
     on its value relative to the median priority value.
     """
-    priority_to_colour_map = {Match.NO_PRIORITY: TerminalColours.PRIORITY_NONE}
+    # Only needed when printing, and slow enough to import to show up in start-up time
+    import statistics
+
+    priority_to_colour_map = {tagg.Match.NO_PRIORITY: TerminalColours.PRIORITY_NONE}
     median_value = statistics.median(priority_value_map.values())
 
     for p in priority_value_map.values():
@@ -54,15 +60,28 @@ def get_highlight_colour(orig_colour):
     return orig_colour.replace("0", "7")
 
 
-def log(text, tag, append_new_line=False):
+def log(text, tag, append_new_line=False, file=None):
     """
     Prints log entries which look like:
     [INFORMATION] Config file created at ~/.taggregator/config.json
+    to file if given, otherwise to the file set with set_log_file.
     """
-    print("[%s] %s" % (tag.upper(), text))
+    if file is None:
+        file = log_file
+
+    print("[%s] %s" % (tag.upper(), text), file=file)
 
     if (append_new_line):
-        print("\n")
+        print("\n", file=file)
+
+
+def set_log_file(file):
+    """
+    Send log entries to file (stdout if None) from now on, such as to stderr when
+    stdout is taken up by machine-readable output which they would corrupt.
+    """
+    global log_file
+    log_file = file
 
 
 def print_right_pad(text, pad_size, append_new_line=False):
@@ -70,8 +89,19 @@ def print_right_pad(text, pad_size, append_new_line=False):
     print(text + pad_size * " ", end=end)
 
 
+def clear_screen():
+    print("\033[2J\033[H", end="")
+
+
+def get_terminal_columns():
+    try:
+        return os.get_terminal_size()[0]
+    except OSError:
+        return 80  # Sane default
+
+
 def print_separator():
-    sep_count = int(terminal_columns * 0.75)
+    sep_count = int(get_terminal_columns() * 0.75)
     dashes = "-" * sep_count
     print(dashes)
 
@@ -105,25 +135,32 @@ def print_match_line(
     print_right_pad(to_print, pad_size, append_new_line)
 
 
-def print_matches(matches, tag_marker, priority_value_map):
-    priority_to_colour_map = get_priority_to_colour_map(priority_value_map)
-
-    # Arrange every match into a dictionary with a key the item's priority,
-    # sorted so that we display the highest priority ones at the top.
-    matches_by_priority = defaultdict(list)
-    matches.sort(key=lambda x: x.priority, reverse=True)
+def print_matches(
+        matches,
+        tag_marker,
+        priority_value_map,
+        stats=None,
+        roots=None,
+        limit=None,
+        page=None,
+        summary_first=False):
+    """
+    Print matches highest priority first. If roots is given the matches are split into a
+    section per root, each headed by its totals, instead of being printed as one list.
 
-    for match in matches:
-        matches_by_priority[match.priority].append(match)
+    With limit and/or page only one page of the list is printed (see get_page), and
+    with summary_first the totals for every tag are printed before it.
+    """
+    render_start = time.perf_counter()
+    priority_to_colour_map = get_priority_to_colour_map(priority_value_map)
+    rows = get_page(matches, limit, page)
 
     # Calculate the longest piece of each type of data so that
     # we can do some simple maths to line them up nicely.
-    size_longest_name = max([len(match.file_name)
-                             for match in matches], default=0)
-    size_longest_line_no = max([len(str(match.line_number))
-                                for match in matches], default=0)
-    size_longest_line = max([len(match.line) for match in matches], default=0)
-    section_padding = 2
+    column_sizes = (
+        max([len(match.file_name) for match in rows], default=0),
+        max([len(str(match.line_number)) for match in rows], default=0),
+        max([len(match.line) for match in rows], default=0))
 
     # Looks stupid to draw heading if there are no matches
     if len(matches) > 0:
@@ -132,6 +169,102 @@ def print_matches(matches, tag_marker, priority_value_map):
     else:
         print("No taggregator tags found - start commenting your code!")
 
+    if summary_first and len(matches) > 0:
+        print_summary(matches, priority_value_map)
+
+    if roots is None:
+        print_priority_sections(
+            rows,
+            tag_marker,
+            priority_to_colour_map,
+            column_sizes)
+    elif len(matches) > 0:
+        rows_by_root = dict(get_matches_by_root(rows, roots))
+
+        # Each root's totals still count every match, not just the ones on this page
+        for root, root_matches in get_matches_by_root(matches, roots):
+            print("%s: %s" % (root, get_totals_text(root_matches, priority_value_map)))
+            print_separator()
+            print_priority_sections(
+                rows_by_root[root],
+                tag_marker,
+                priority_to_colour_map,
+                column_sizes)
+
+        print("Total: %s in %d roots" %
+              (get_totals_text(matches, priority_value_map), len(roots)))
+
+    if len(rows) < len(matches):
+        print_page_footer(rows, matches, limit, page)
+
+    if stats is not None:
+        stats.add_time("render", time.perf_counter() - render_start)
+        stats.add("matches_printed", len(rows))
+
+
+def get_page(matches, limit=None, page=None):
+    """
+    The matches on the given page (from 1) of limit matches each (DEFAULT_PAGE_SIZE if only
+    page is given) in the order they're printed in, or every match if neither is given.
+
+    Only the matches up to the end of the page are ever put in order, by a heap
+    selection over the rest, which is much quicker than sorting every match when
+    there are tens of thousands of them.
+    """
+    if limit is None and page is None:
+        return matches
+
+    limit = limit if limit is not None else DEFAULT_PAGE_SIZE
+    page_start = limit * ((page or 1) - 1)
+
+    # Stable like the sorts in print_priority_sections, so ties keep the same order
+    return heapq.nsmallest(page_start + limit, matches,
+                           key=lambda match: (-match.priority, match.tag))[page_start:]
+
+
+def print_summary(matches, priority_value_map):
+    """
+    e.g. '5 tags (2 HIGH, 3 LOW): 3 TODO, 2 BUG', most common tag first.
+    """
+    tag_counts = sorted(Counter(match.tag for match in matches).items(),
+                        key=lambda item: (-item[1], item[0]))
+
+    print("%s: %s" % (get_totals_text(matches, priority_value_map),
+                      ", ".join("%d %s" % (count, tag) for tag, count in tag_counts)))
+    print_separator()
+
+
+def print_page_footer(rows, matches, limit, page):
+    page = page or 1
+    page_start = (limit if limit is not None else DEFAULT_PAGE_SIZE) * (page - 1)
+
+    if len(rows) == 0:
+        print("Page %d is past the last of the %d tags" % (page, len(matches)))
+        return
+
+    print("Showing tags %d-%d of %d%s" % (
+        page_start + 1,
+        page_start + len(rows),
+        len(matches),
+        ", use --page %d for more" % (page + 1) if page_start + len(rows) < len(matches) else ""))
+
+
+def print_priority_sections(
+        matches,
+        tag_marker,
+        priority_to_colour_map,
+        column_sizes):
+    size_longest_name, size_longest_line_no, size_longest_line = column_sizes
+    section_padding = 2
+
+    # Arrange every match into a dictionary with a key the item's priority,
+    # sorted so that we display the highest priority ones at the top.
+    matches_by_priority = defaultdict(list)
+    matches.sort(key=lambda x: x.priority, reverse=True)
+
+    for match in matches:
+        matches_by_priority[match.priority].append(match)
+
     for p in matches_by_priority:  # Grab each key
         # Sort each set of matches by tag in alphabetical order
         matches_by_priority[p].sort(key=lambda x: (x.tag))
@@ -140,9 +273,10 @@ def print_matches(matches, tag_marker, priority_value_map):
             highlighted_colour = get_highlight_colour(colour)
             print_right_pad(match.file_name, size_longest_name -
                             len(match.file_name) + section_padding)
+            line_number = str(match.line_number)
             print_right_pad(":" +
-                            match.line_number, size_longest_line_no -
-                            len(match.line_number) +
+                            line_number, size_longest_line_no -
+                            len(line_number) +
                             section_padding)
             print_match_line(match,
                              tag_marker,
@@ -155,9 +289,52 @@ def print_matches(matches, tag_marker, priority_value_map):
         print_separator()
 
 
-terminal_columns = 80  # Sane default
+def get_matches_by_root(matches, roots):
+    """
+    Split matches into a list for each of roots (which must not overlap), in the same
+    order as roots, including roots with no matches at all.
+    """
+    matches_by_root = dict((root, []) for root in roots)
+    root_prefixes = [(root.rstrip(os.sep) + os.sep, root) for root in roots]
+
+    for match in matches:
+        for prefix, root in root_prefixes:
+            if match.file_name.startswith(prefix):
+                matches_by_root[root].append(match)
+                break
+
+    return list(matches_by_root.items())
+
+
+def get_totals_text(matches, priority_value_map):
+    """
+    e.g. '5 tags (2 HIGH, 3 LOW)', highest priority first.
+    """
+    value_priority_map = dict((value, priority)
+                              for priority, value in priority_value_map.items())
+    counts = Counter(match.priority for match in matches)
+    count_texts = ["%d %s" % (counts[value], value_priority_map.get(value, "unprioritised"))
+                   for value in sorted(counts, reverse=True)]
+    totals_text = "%d tag%s" % (len(matches), "" if len(matches) == 1 else "s")
+
+    return totals_text + (" (%s)" % ", ".join(count_texts) if count_texts else "")
+
+
+def print_stats(stats, as_json=False):
+    """
+    Stats go to stderr so that they never get mixed up with the matches themselves.
+    """
+    if as_json:
+        print(stats.to_json(), file=sys.stderr)
+        return
+
+    print("Taggregator stats:", file=sys.stderr)
+
+    for line in stats.get_report_lines():
+        print("  " + line, file=sys.stderr)
+
 
-try:
-    terminal_columns = get_terminal_size()[0]
-except OSError:
-    pass  # Leave at 80
+# Matches per page when only --page is given
+DEFAULT_PAGE_SIZE = 50
+# Where log entries go when they aren't given a file, see set_log_file
+log_file = None
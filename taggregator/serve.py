@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import printer
+from taggregator import tagg
+from taggregator import watch
+import hashlib
+import json
+import os
+import socket
+import tempfile
+
+
+class TagServer:
+    """
+    Keeps a TagIndex of a root in memory and answers queries about it over a Unix domain
+    socket, one JSON request and one JSON reply per connection.
+
+    Before answering, any files inotify says have changed are rescanned (or, without
+    inotify, the tree is re-walked and changed files rescanned), so replies are never
+    staler than the moment the query arrived.
+    """
+
+    def __init__(self, config_map, socket_path):
+        self.config_map = config_map
+        self.socket_path = socket_path
+        self.index = watch.TagIndex(config_map)
+        self.priority_value_map = self.index.scanner.priority_value_map
+        self.watcher = None
+
+    def start(self):
+        self.index.refresh()
+        self.watcher = watch.InotifyWatcher.create()
+
+        if self.watcher is not None and not self.watcher.watch_dirs(
+                self.index.directories):
+            self.watcher.close()
+            self.watcher = None
+
+    def revalidate(self):
+        if self.watcher is None:
+            self.index.refresh()
+            return
+
+        changed_files, needs_refresh = self.watcher.wait(0)
+
+        if needs_refresh:
+            self.index.refresh()
+            self.watcher.watch_dirs(self.index.directories)
+        elif changed_files:
+            self.index.refresh_files(set(changed_files))
+
+    def answer(self, request):
+        """
+        The reply to a query, which may filter matches by "tags", by "min_priority"
+        (a priority name) and by "path_prefix" (an absolute path).
+        """
+        self.revalidate()
+
+        tags = request.get("tags")
+        tags = set(tag.upper() for tag in tags) if tags else None
+        min_priority = request.get("min_priority")
+        min_value = None
+
+        if min_priority:
+            min_value = self.priority_value_map.get(min_priority.upper())
+
+            if min_value is None:
+                return {"error": "Unknown priority '%s'" % min_priority}
+
+        path_prefix = request.get("path_prefix")
+        matches = [match for match in self.index.get_matches()
+                   if (tags is None or match.tag in tags) and
+                   (min_value is None or match.priority >= min_value) and
+                   (not path_prefix or match.file_name.startswith(path_prefix))]
+
+        return {
+            "tag_marker": self.config_map["tag_marker"],
+            "priorities": self.config_map["priorities"],
+            "matches": [[m.file_name, m.line_number, m.line, m.tag, m.priority]
+                        for m in matches],
+        }
+
+    def handle(self, connection):
+        # A client which never sends anything mustn't hang the daemon
+        connection.settimeout(REQUEST_TIMEOUT_SECONDS)
+
+        with connection:
+            try:
+                request = json.loads(receive_line(connection))
+                reply = self.answer(request)
+            except ValueError as e:
+                reply = {"error": "Bad request: " + str(e)}
+            except OSError:
+                return
+
+            try:
+                connection.sendall(json.dumps(reply).encode("utf-8") + b"\n")
+            except OSError:
+                # The client gave up waiting
+                pass
+
+    def serve_forever(self):
+        server_socket = bind_socket(self.socket_path)
+
+        try:
+            self.start()
+            printer.log("Serving " + self.config_map["root"] +
+                        " on " + self.socket_path, "information")
+
+            while True:
+                connection, _ = server_socket.accept()
+                self.handle(connection)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server_socket.close()
+
+            if self.watcher is not None:
+                self.watcher.close()
+
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+
+def get_socket_path(root):
+    """
+    One socket per root, somewhere only the current user can write to.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    root_hash = hashlib.sha1(
+        os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+
+    return os.path.join(runtime_dir, "taggregator-%d-%s.sock" %
+                        (os.getuid(), root_hash))
+
+
+def bind_socket(socket_path):
+    """
+    Listen on socket_path, replacing a socket left behind by a daemon which
+    died but raising OSError if a live daemon is already using it.
+    """
+    if is_serving(socket_path):
+        raise OSError("Another daemon is already serving " + socket_path)
+
+    try:
+        os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Don't let anyone else see the bits of our code with tags in
+    old_umask = os.umask(0o177)
+
+    try:
+        server_socket.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+
+    server_socket.listen(LISTEN_BACKLOG)
+    return server_socket
+
+
+def is_serving(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+            client_socket.connect(socket_path)
+    except OSError:
+        return False
+
+    return True
+
+
+def receive_line(connection):
+    chunks = []
+
+    while True:
+        chunk = connection.recv(RECEIVE_SIZE)
+
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+
+        if chunk.endswith(b"\n"):
+            break
+
+    return b"".join(chunks).decode("utf-8")
+
+
+def query(socket_path, request):
+    """
+    Send request to the daemon listening on socket_path and return its reply,
+    raising OSError if no daemon is listening.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.settimeout(CLIENT_TIMEOUT_SECONDS)
+        client_socket.connect(socket_path)
+        client_socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        client_socket.shutdown(socket.SHUT_WR)
+
+        return json.loads(receive_line(client_socket))
+
+
+def get_reply_matches(reply):
+    return [tagg.Match(*record) for record in reply["matches"]]
+
+
+CLIENT_TIMEOUT_SECONDS = 60
+LISTEN_BACKLOG = 16
+RECEIVE_SIZE = 64 * 1024
+REQUEST_TIMEOUT_SECONDS = 5
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import cache
+from taggregator import tagg
+import gzip
+import json
+import os
+import zlib
+
+
+def parse_shard(spec):
+    """
+    (K, N) from a 'K/N' shard spec, where shards are numbered from 1 to N.
+    Raises ValueError for anything else.
+    """
+    try:
+        shard_number, shard_count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError("Shard '%s' should look like K/N, e.g. 2/8" % spec)
+
+    if not 1 <= shard_number <= shard_count:
+        raise ValueError("Shard '%s' should have K between 1 and N" % spec)
+
+    return shard_number, shard_count
+
+
+def get_shard_number(rel_path, shard_count):
+    """
+    The shard (1 to shard_count) a file belongs to, from a hash of its path relative to the
+    root which is the same in every process and on every machine (unlike hash()).
+    """
+    key = rel_path.replace(os.sep, "/").encode("utf-8", "surrogateescape")
+    return zlib.crc32(key) % shard_count + 1
+
+
+def scan_shard(config_map, shard_number, shard_count):
+    """
+    Walk config_map's roots like tagg.run does, but only scan the files in the given shard.
+
+    Returns the partial result to write out: the settings the scan depends on, and for each
+    file scanned its position in the walk (so that merged results come out in the same order
+    as a single run's) and its match records.
+    """
+    root = config_map["root"]
+    files = tagg.get_all_files(config_map)
+    positions = {}
+
+    for position, file_name in enumerate(files):
+        rel_path = os.path.relpath(file_name, root)
+
+        if get_shard_number(rel_path, shard_count) == shard_number:
+            positions[file_name] = position
+
+    records_by_path = {}
+
+    for file_name, matches in tagg.scan_files(
+            tagg.get_file_scanner(config_map),
+            list(positions),
+            None,
+            config_map.get("jobs", 1),
+            config_map.get("executor", "process")):
+        records_by_path[os.path.relpath(file_name, root)] = [
+            positions[file_name],
+            [[m.line_number, m.line, m.tag, m.priority] for m in matches]]
+
+    return {
+        "version": PARTIAL_VERSION,
+        "fingerprint": cache.get_fingerprint(
+            config_map["tag_marker"], config_map["tags"], config_map["priorities"],
+            config_map.get("max_file_size")),
+        "shard": [shard_number, shard_count],
+        "root": root,
+        "roots": config_map.get("roots", [root]),
+        "tag_marker": config_map["tag_marker"],
+        "priorities": list(config_map["priorities"]),
+        # Only files with matches, everything else would be an empty list
+        "files": dict((path, entry) for path, entry in records_by_path.items() if entry[1]),
+    }
+
+
+def write_partial(path, partial):
+    # Gzipped because the same handful of tags and priorities repeat on every line
+    with gzip.open(path, "wt", encoding="utf-8") as partial_file:
+        json.dump(partial, partial_file, separators=(",", ":"))
+
+
+def read_partial(path):
+    """
+    Raises OSError if path can't be read and ValueError if it isn't a partial result.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as partial_file:
+        partial = json.load(partial_file)
+
+    if not isinstance(partial, dict) or partial.get("version") != PARTIAL_VERSION:
+        raise ValueError("%s isn't a partial result from this version of tagg scan" % path)
+
+    return partial
+
+
+def merge_partials(partials):
+    """
+    The matches from every shard of a scan, without duplicates and in the order a single
+    run would have found them. Raises ValueError if the partials come from scans with
+    different settings or roots, or a shard is missing.
+
+    Shards may have been scanned from checkouts at different paths (on different machines,
+    say), so the roots are compared relative to each scan's root, and every match's file
+    name is given under the first partial's root.
+    """
+    first = partials[0]
+    shard_count = first["shard"][1]
+
+    for partial in partials:
+        if partial["fingerprint"] != first["fingerprint"] or partial["shard"][1] != shard_count:
+            raise ValueError("Partial results come from scans with different tags or shard counts")
+
+        # Walk positions and root grouping only line up between scans of the same roots
+        if get_root_layout(partial) != get_root_layout(first):
+            raise ValueError("Partial results come from scans of different roots (%s and %s)" %
+                             (", ".join(first["roots"]), ", ".join(partial["roots"])))
+
+    missing_shards = sorted(set(range(1, shard_count + 1)) -
+                            set(partial["shard"][0] for partial in partials))
+
+    if missing_shards:
+        raise ValueError("Missing shards: " + ", ".join(
+            "%d/%d" % (shard_number, shard_count) for shard_number in missing_shards))
+
+    entries = []
+
+    for partial in partials:
+        for path, (position, records) in partial["files"].items():
+            file_name = os.path.join(first["root"], path)
+            entries.append((position, [tagg.Match(file_name, *record) for record in records]))
+
+    entries.sort(key=lambda entry: entry[0])
+
+    return tagg.get_unique_matches(matches for _, matches in entries)
+
+
+def get_root_layout(partial):
+    """
+    The roots a partial result was scanned from, relative to its root.
+    """
+    return [os.path.relpath(root, partial["root"]) for root in partial["roots"]]
+
+
+PARTIAL_VERSION = 1
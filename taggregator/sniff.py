@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+import codecs
+import os
+
+
+def get_rejection(head, file_size, max_file_size=None, check_utf8=True):
+    """
+    Decide from the first few KB of a file (head) whether it's worth reading the rest.
+    Returns why not (TOO_LARGE, BINARY or NOT_UTF8) or None if it should be searched.
+
+    The UTF-8 check can only reject files which the text decoder would have rejected
+    anyway, so it is skipped (check_utf8=False) when files aren't decoded as UTF-8.
+    """
+    if max_file_size is not None and file_size > max_file_size:
+        return TOO_LARGE
+
+    if head.startswith(BINARY_MAGIC_NUMBERS) or b"\0" in head:
+        return BINARY
+
+    if check_utf8 and not is_utf8_prefix(head, file_size <= len(head)):
+        return NOT_UTF8
+
+    return None
+
+
+def is_utf8_prefix(head, is_whole_file):
+    """
+    Whether head could be the start of a UTF-8 file. Unless it's the whole file,
+    a character cut in half at the end of head doesn't count against it.
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=is_whole_file)
+    except UnicodeDecodeError:
+        return False
+
+    return True
+
+
+def sniff_file(binary_file, max_file_size=None, check_utf8=True):
+    """
+    get_rejection for an open, buffered binary file, peeking at its start without
+    moving the read position. Only looks at as much of the first SNIFF_SIZE bytes as
+    fit in the file's buffer, so that nothing is read twice.
+    Returns (rejection, file size, bytes read so far).
+    """
+    file_size = os.fstat(binary_file.fileno()).st_size
+
+    if max_file_size is not None and file_size > max_file_size:
+        return TOO_LARGE, file_size, 0
+
+    head = binary_file.peek(SNIFF_SIZE)[:SNIFF_SIZE]
+
+    return get_rejection(head, file_size, None, check_utf8), file_size, len(head)
+
+
+def add_rejection_stats(stats, rejection, file_size, bytes_read):
+    if stats is not None:
+        stats.add("files_skipped_" + rejection)
+        stats.add("bytes_not_read", max(0, file_size - bytes_read))
+
+
+# Reasons for not searching a file, as used in the names of stats counters
+TOO_LARGE = "too_large"
+BINARY = "binary"
+NOT_UTF8 = "not_utf8"
+
+# Formats which might not have a NUL byte or invalid UTF-8 near their start
+BINARY_MAGIC_NUMBERS = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",  # JPEG
+    b"GIF87a",
+    b"GIF89a",
+    b"%PDF-",
+    b"PK\x03\x04",  # zip, jar, docx...
+    b"\x1f\x8b",  # gzip
+    b"\xfd7zXZ\x00",
+    b"7z\xbc\xaf\x27\x1c",
+    b"\x7fELF",
+    b"\xca\xfe\xba\xbe",  # Java class, Mach-O fat binary
+    b"\xcf\xfa\xed\xfe",  # Mach-O
+    b"SQLite format 3\x00",
+    b"\x00asm",  # WebAssembly
+)
+SNIFF_SIZE = 8 * 1024
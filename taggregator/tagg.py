@@ -1,20 +1,39 @@
 #! /usr/bin/env python3
 #! -*- coding: utf-8 -*-
 
+from taggregator import cache
+from taggregator import formats
+from taggregator import gitindex
+from taggregator import iosched
+from taggregator import metrics
+from taggregator import parallel
 from taggregator import printer
+from taggregator import sniff
+from taggregator import walker
 from pathlib import Path
+import codecs
 import itertools
+import locale
+import mmap
 import os
 import re
 import sys
+import time
 
 
 class Match:
+    """
+    A single tagged line. Slotted because a big codebase can produce a lot of these,
+    and hashable (on the same fields as equality) so duplicates can be dropped with a set.
+    """
     NO_PRIORITY = -1
 
+    __slots__ = ("file_name", "line_number", "line", "tag", "priority")
+
     def __init__(self, file_name, line_number, line, tag, priority):
-        self.file_name = file_name
-        self.line_number = str(line_number)
+        # Every match in a file shares one copy of its (interned) path
+        self.file_name = sys.intern(file_name)
+        self.line_number = int(line_number)
         self.line = line
         self.tag = tag
         self.priority = priority
@@ -23,8 +42,108 @@ class Match:
         return self.file_name
 
     def __eq__(self, other):
+        if not isinstance(other, Match):
+            return NotImplemented
+
         return self.file_name == other.file_name and self.line_number == other.line_number and self.tag == other.tag
 
+    def __hash__(self):
+        return hash((self.file_name, self.line_number, self.tag))
+
+
+class FileScanner:
+    """
+    Everything find_matches needs to scan a file, bundled up so that the scanning
+    can be handed off to a worker thread or process as a single picklable object.
+    """
+
+    def __init__(
+            self,
+            tag_regex,
+            tags,
+            priority_value_map,
+            candidate_finder=None,
+            keep_stats=False,
+            prefilter_regex=None,
+            max_file_size=None,
+            opener=None):
+        self.tag_regex = tag_regex
+        self.tags = tags
+        self.priority_value_map = priority_value_map
+        # Only set when using the mmap matcher
+        self.candidate_finder = candidate_finder
+        self.keep_stats = keep_stats
+        self.prefilter_regex = prefilter_regex
+        self.max_file_size = max_file_size
+        # Passed to open() for every file read (see iosched.open_noatime)
+        self.opener = opener
+
+    def scan(self, file_name, stats=None):
+        if self.candidate_finder is not None:
+            return list(
+                find_matches_mmap(
+                    self.tag_regex,
+                    self.tags,
+                    file_name,
+                    self.priority_value_map,
+                    self.candidate_finder,
+                    stats,
+                    self.prefilter_regex,
+                    self.max_file_size,
+                    self.opener))
+
+        return list(
+            find_matches(
+                self.tag_regex,
+                self.tags,
+                file_name,
+                self.priority_value_map,
+                stats,
+                self.prefilter_regex,
+                self.max_file_size,
+                opener=self.opener))
+
+    def read(self, file_name, stats=None):
+        """
+        The part of scan which waits on the disk, for running apart from the rest (see
+        pipeline.Pipeline). Returns contents to pass to match(), None for a file which
+        isn't searched, or the list of matches for a file which was searched as it was
+        read (memory-mapped or too big to hold in memory).
+        """
+        if self.candidate_finder is not None:
+            return self.scan(file_name, stats)
+
+        return read_file(
+            self.tag_regex,
+            file_name,
+            self.priority_value_map,
+            stats,
+            self.prefilter_regex,
+            self.max_file_size,
+            opener=self.opener)
+
+    def match(self, file_name, contents, stats=None):
+        return list(
+            get_contents_matches(
+                self.tag_regex,
+                self.tags,
+                file_name,
+                contents,
+                self.priority_value_map,
+                stats,
+                self.prefilter_regex))
+
+    def scan_batch(self, file_names):
+        """
+        Return the matches in each of file_names, along with the stats for scanning
+        them if stats are being kept (otherwise None). Stats are kept per batch so
+        that they can be sent back from worker processes and merged.
+        """
+        batch_stats = metrics.ScanStats() if self.keep_stats else None
+
+        return [self.scan(file_name, batch_stats)
+                for file_name in file_names], batch_stats
+
 
 def get_piped_list(items):
     return "|".join(items)
@@ -55,43 +174,673 @@ def get_priority_regex(priorities):
     return r"\s*(" + get_piped_list(priorities) + r")?\s*"
 
 
-def find_matches(tag_regex, tags, file_name, priority_value_map):
-    if os.path.isdir(file_name):
+def get_prefilter_regex(tag_marker, tags):
+    """
+    Regex finding every place a tag could start (tag_marker followed by any of tags) in a
+    single pass, however many tags there are. tag_regex can only match where this does.
+    """
+    return re.compile(
+        tag_marker + "(?:" + get_piped_list(tags) + ")",
+        re.IGNORECASE)
+
+
+def find_matches(
+        tag_regex,
+        tags,
+        file_name,
+        priority_value_map,
+        stats=None,
+        prefilter_regex=None,
+        max_file_size=None,
+        stream_threshold=None,
+        opener=None):
+    """
+    Files which look binary from their first few KB, or are bigger than max_file_size
+    bytes, are skipped without being read any further (see sniff.get_rejection). Files
+    bigger than stream_threshold bytes (STREAM_THRESHOLD by default) are read a chunk at
+    a time instead of all at once (see find_matches_streamed), which gives the same matches.
+
+    With prefilter_regex (see get_prefilter_regex) the file is searched once for places
+    a tag could start and tag_regex only runs on the lines holding one. Without it, the
+    file is searched for each of tags in turn and tag_regex runs on every line.
+    """
+    contents = read_file(
+        tag_regex,
+        file_name,
+        priority_value_map,
+        stats,
+        prefilter_regex,
+        max_file_size,
+        stream_threshold,
+        opener)
+
+    if contents is None or isinstance(contents, list):
+        yield from contents or []
         return
 
+    yield from get_contents_matches(
+        tag_regex, tags, file_name, contents, priority_value_map, stats, prefilter_regex)
+
+
+def read_file(
+        tag_regex,
+        file_name,
+        priority_value_map,
+        stats=None,
+        prefilter_regex=None,
+        max_file_size=None,
+        stream_threshold=None,
+        opener=None):
+    """
+    The half of find_matches which waits on the disk: the contents of file_name for
+    get_contents_matches, or None if it shouldn't be searched. A file too big to hold in
+    memory is searched as it's read instead, and the list of its matches is returned.
+    """
+    if os.path.isdir(file_name):
+        return None
+
+    if stream_threshold is None:
+        stream_threshold = STREAM_THRESHOLD
+
     # @SPEED(HIGH) File opening/reading
     # Profiling shows that this is the greatest bottleneck in the app
     # at the minute, experiments with multiprocessing only slowed it down
     # because it is IO bound work
-    with open(file_name) as f:
-        # Read whole file into one buffer and see if any of the tags
-        # match against it so we dont need to do the expensive regex
-        # findall on every line individually unless we find a whole match
+    with open(file_name, opener=opener) as f:
+        rejection, file_size, bytes_read = sniff.sniff_file(
+            f.buffer, max_file_size, IS_UTF8_LOCALE)
+
+        if rejection is not None:
+            sniff.add_rejection_stats(stats, rejection, file_size, bytes_read)
+            return None
+
+        if file_size > stream_threshold:
+            return list(find_matches_streamed(
+                f, tag_regex, file_name, priority_value_map, stats, prefilter_regex))
+
         try:
-            file_contents = f.read()
+            with metrics.timer(stats, "read"):
+                file_contents = f.read()
         except UnicodeDecodeError:
             # Ignore non utf-8 files
+            if stats is not None:
+                stats.add("files_rejected_on_decode")
+            return None
+
+        if stats is not None:
+            stats.add("bytes_read", f.buffer.tell())
+
+        return file_contents
+
+
+def get_contents_matches(
+        tag_regex,
+        tags,
+        file_name,
+        contents,
+        priority_value_map,
+        stats=None,
+        prefilter_regex=None):
+    """
+    The half of find_matches which keeps the CPU busy: the matches in a file's contents.
+    """
+    # See if any of the tags match against the whole file first
+    # so we dont need to do the expensive regex findall on every
+    # line individually unless we find a whole match
+    with metrics.timer(stats, "prefilter"):
+        if prefilter_regex is not None:
+            lines = get_candidate_lines(contents, prefilter_regex)
+            has_any_tag = len(lines) > 0
+        else:
+            lower_contents = contents.lower()
+            lower_tags = [t.lower() for t in tags]
+            has_any_tag = any(t in lower_contents for t in lower_tags)
+            lines = enumerate(contents.split('\n'), 1)
+
+    if not has_any_tag:
+        if stats is not None:
+            stats.add("files_skipped_by_prefilter")
+        return
+
+    with metrics.timer(stats, "match"):
+        # @BUG(HIGH) Throws OSError on some files if in use
+        # Can't repro on *nix but happens on Cygwin if the file is in use
+        for number, line in lines:
+            for match in get_line_matches(
+                    tag_regex, file_name, number, line, priority_value_map):
+                if stats is not None:
+                    stats.add("regex_hits")
+
+                yield match
+
+
+def find_matches_streamed(
+        text_file,
+        tag_regex,
+        file_name,
+        priority_value_map,
+        stats=None,
+        prefilter_regex=None,
+        chunk_size=None,
+        max_line_length=None):
+    """
+    find_matches for a file too big to hold in memory at once. Reads chunk_size characters
+    at a time and holds back the unfinished last line of each chunk to go in front of the
+    next one, so tags are never split. Text mode reads already turn '\r\n' split across
+    chunks into one '\n'.
+
+    A line longer than max_line_length characters (STREAM_MAX_LINE_LENGTH by default) is
+    searched a piece at a time as it's read (see LongLineSearcher) rather than held, so
+    memory use is bounded by chunk_size plus max_line_length whatever is in the file.
+
+    Matches are only given back once the whole file has been read, since find_matches
+    skips a file with a decoding error anywhere in it.
+    """
+    if chunk_size is None:
+        chunk_size = STREAM_CHUNK_SIZE
+
+    if max_line_length is None:
+        max_line_length = STREAM_MAX_LINE_LENGTH
+
+    matches = []
+    # Number of the first line in the text being searched
+    line_number = 1
+    # Pieces of the unfinished line, only joined up once its end has been read
+    carry = []
+    carry_length = 0
+    # Set while in a line too long to hold
+    long_line = None
+    has_any_candidate = False
+
+    while True:
+        try:
+            with metrics.timer(stats, "read"):
+                chunk = text_file.read(chunk_size)
+        except UnicodeDecodeError:
+            if stats is not None:
+                stats.add("files_rejected_on_decode")
             return
 
-        lower_contents = file_contents.lower()
-        lower_tags = [t.lower() for t in tags]
+        if chunk:
+            # Only the new chunk is searched, the carry is known not to hold a line break
+            last_break = chunk.rfind("\n")
+
+            if last_break == -1:
+                if long_line is not None:
+                    long_line.feed(chunk)
+                    continue
+
+                carry.append(chunk)
+                carry_length += len(chunk)
+
+                if carry_length > max_line_length:
+                    long_line = LongLineSearcher(
+                        tag_regex, file_name, line_number, priority_value_map)
+
+                    for piece in carry:
+                        long_line.feed(piece)
+
+                    carry = []
+                    carry_length = 0
+
+                    if stats is not None:
+                        stats.add("long_lines_searched_in_pieces")
+                continue
 
-        if any(t in lower_contents for t in lower_tags):
-            # @BUG(HIGH) Throws OSError on some files if in use
-            # Can't repro on *nix but happens on Cygwin if the file is in use
-            for number, line in enumerate(file_contents.split('\n'), 1):
-                # @SPEED(MEDIUM) Regex search of processed line
-                matches = tag_regex.findall(line)
+            if long_line is not None:
+                # The long line ends at the chunk's first line break
+                first_break = chunk.find("\n")
+                long_line.feed(chunk[:first_break])
+                long_line_matches = long_line.finish()
+                matches.extend(long_line_matches)
+                has_any_candidate = has_any_candidate or len(long_line_matches) > 0
+                long_line = None
+                line_number += 1
 
-                for match in matches:
-                    tag = match[0].upper()
-                    priority = match[1]
-                    priority_idx = priority_value_map.get(
-                        priority.upper(), Match.NO_PRIORITY)
-                    truncated_line = printer.get_truncated_text(
-                        line.strip(), 100)
+                if first_break == last_break:
+                    carry = [chunk[last_break + 1:]]
+                    carry_length = len(carry[0])
+                    continue
 
-                    yield Match(file_name, number, truncated_line, tag, priority_idx)
+                text = chunk[first_break + 1:last_break]
+            else:
+                carry.append(chunk[:last_break])
+                text = "".join(carry)
+
+            carry = [chunk[last_break + 1:]]
+            carry_length = len(carry[0])
+        elif long_line is not None:
+            # The file ended on the long line
+            long_line_matches = long_line.finish()
+            matches.extend(long_line_matches)
+            has_any_candidate = has_any_candidate or len(long_line_matches) > 0
+            break
+        else:
+            # Whatever follows the last line break is a line of its own, even if empty
+            text = "".join(carry)
+
+        with metrics.timer(stats, "match"):
+            if prefilter_regex is not None:
+                lines = get_candidate_lines(text, prefilter_regex)
+                has_any_candidate = has_any_candidate or len(lines) > 0
+            else:
+                lines = enumerate(text.split("\n"), 1)
+                has_any_candidate = True
+
+            for number, line in lines:
+                matches.extend(
+                    get_line_matches(
+                        tag_regex,
+                        file_name,
+                        line_number + number - 1,
+                        line,
+                        priority_value_map))
+
+        if not chunk:
+            break
+
+        line_number += text.count("\n") + 1
+
+    if stats is not None:
+        stats.add("bytes_read", text_file.buffer.tell())
+        stats.add("regex_hits", len(matches))
+
+        if not has_any_candidate:
+            stats.add("files_skipped_by_prefilter")
+
+    yield from matches
+
+
+class LongLineSearcher:
+    """
+    Finds the matches in a line too long to hold in memory, fed to it a piece at a time,
+    giving the same matches as get_line_matches would for the whole line.
+
+    Text is only searched once it's more than STREAM_TAG_LOOKAHEAD characters from the end
+    of what has been fed, since a tag any closer could still go on in the next piece (its
+    priority, say). The rest is held back to go in front of the next piece, along with
+    just enough of the line's start to give the matches their line text.
+
+    The one exception is a tag followed by a run of more than STREAM_MAX_LINE_LENGTH
+    spaces and brackets, which is taken as it is rather than held on to.
+    """
+
+    def __init__(self, tag_regex, file_name, number, priority_value_map):
+        self.tag_regex = tag_regex
+        self.file_name = file_name
+        self.number = number
+        self.priority_value_map = priority_value_map
+        self.held = ""
+        self.found_tags = []
+        # The start of the line without its leading whitespace, enough to truncate
+        self.head = ""
+        self.stripped_length = 0
+        # Offset in the line without its leading whitespace of its last visible character
+        self.last_visible = -1
+
+    def feed(self, piece):
+        visible = piece if self.stripped_length else piece.lstrip()
+
+        if visible:
+            self.head += visible[:MAX_LINE_TEXT_LENGTH + 1 - len(self.head)]
+            trimmed_length = len(visible.rstrip())
+
+            if trimmed_length:
+                self.last_visible = self.stripped_length + trimmed_length - 1
+
+            self.stripped_length += len(visible)
+
+        text = self.held + piece
+        self.held = text[self.search(text, len(text) - STREAM_TAG_LOOKAHEAD):]
+
+    def search(self, text, search_end):
+        """
+        Keep the tags found in text which end by search_end, returning the offset to carry
+        on searching from once there's more text.
+        """
+        resume_at = 0
+
+        for match in self.tag_regex.finditer(text):
+            if match.end() > search_end and len(text) - match.start() <= STREAM_MAX_LINE_LENGTH:
+                return match.start()
+
+            self.found_tags.append(match.groups(""))
+            resume_at = match.end()
+
+        return max(resume_at, search_end)
+
+    def finish(self):
+        """
+        The line's matches, once the last of it has been fed.
+        """
+        self.search(self.held, len(self.held))
+        self.held = ""
+
+        # Only the start of the line is kept, which is all the line text needs: it's
+        # truncated whenever the whole line would be
+        return list(get_found_matches(
+            self.file_name,
+            self.number,
+            self.head[:self.last_visible + 1],
+            self.found_tags,
+            self.priority_value_map))
+
+
+def get_candidate_lines(contents, prefilter_regex):
+    """
+    The (line number, line) of each line of contents where prefilter_regex matches,
+    found from the match offsets so that lines without one are never split out.
+    """
+    lines = []
+    line_number = 1
+    counted_up_to = 0
+    line_end = -1
+
+    for candidate in prefilter_regex.finditer(contents):
+        offset = candidate.start()
+
+        # Another candidate on the line we already have
+        if offset <= line_end:
+            continue
+
+        line_start = contents.rfind("\n", 0, offset) + 1
+        line_number += contents.count("\n", counted_up_to, line_start)
+        counted_up_to = line_start
+        line_end = contents.find("\n", offset)
+
+        if line_end == -1:
+            line_end = len(contents)
+
+        lines.append((line_number, contents[line_start:line_end]))
+
+    return lines
+
+
+def get_line_matches(tag_regex, file_name, number, line, priority_value_map):
+    # @SPEED(MEDIUM) Regex search of processed line
+    matches = tag_regex.findall(line)
+
+    yield from get_found_matches(
+        file_name, number, line.strip(), matches, priority_value_map)
+
+
+def get_found_matches(file_name, number, stripped_line, found_tags, priority_value_map):
+    """
+    A Match for each of the (tag, priority) groups tag_regex found in a line.
+    """
+    for match in found_tags:
+        tag = match[0].upper()
+        priority = match[1]
+        priority_idx = priority_value_map.get(
+            priority.upper(), Match.NO_PRIORITY)
+        truncated_line = printer.get_truncated_text(
+            stripped_line, MAX_LINE_TEXT_LENGTH)
+
+        yield Match(file_name, number, truncated_line, tag, priority_idx)
+
+
+class CandidateFinder:
+    """
+    Finds every place in a UTF-8 buffer where a tag could start (tag_marker + tag),
+    for use by find_matches_mmap.
+
+    Case-insensitive str regexes also match a handful of non-ASCII characters against
+    ASCII letters (e.g. the Kelvin sign against 'k') which a bytes regex can't. Buffers
+    containing any of those need to go through the str based find_matches instead, and
+    they are checked for separately because adding them to the regex alternation stops
+    the regex engine from scanning quickly for the tag marker.
+    """
+
+    def __init__(self, candidate_regex, folded_letter_bytes):
+        self.candidate_regex = candidate_regex
+        self.folded_letter_bytes = folded_letter_bytes
+
+    def find(self, buffer):
+        return list(self.candidate_regex.finditer(buffer))
+
+    def needs_fallback(self, buffer):
+        # Searching for the lead byte alone is much faster and rules out most files
+        return any(buffer.find(b[:1]) != -1 and buffer.find(b) != -1
+                   for b in self.folded_letter_bytes)
+
+
+def get_candidate_finder(tag_marker, tags):
+    """
+    Returns None if the marker or tags aren't ASCII, in which
+    case only find_matches can give exact results.
+    """
+    regex_string = tag_marker + "(?:" + get_piped_list(tags) + ")"
+
+    try:
+        regex_bytes = regex_string.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+
+    folded_letter_bytes = [b for c in sorted(set(regex_string.lower()))
+                           for b in FOLDED_LETTER_BYTES.get(c, [])]
+
+    return CandidateFinder(
+        re.compile(
+            regex_bytes,
+            re.IGNORECASE),
+        folded_letter_bytes)
+
+
+def find_matches_mmap(
+        tag_regex,
+        tags,
+        file_name,
+        priority_value_map,
+        candidate_finder,
+        stats=None,
+        prefilter_regex=None,
+        max_file_size=None,
+        opener=None):
+    """
+    Alternative to find_matches which gives identical results, but memory-maps the
+    file and searches the raw bytes in a single pass instead of decoding, lowercasing
+    and splitting the whole file. Only the lines containing a candidate are decoded and
+    passed to tag_regex, and line numbers are only worked out for those lines.
+    """
+    if candidate_finder is None or not IS_UTF8_LOCALE:
+        yield from find_matches(
+            tag_regex, tags, file_name, priority_value_map, stats, prefilter_regex, max_file_size,
+            opener=opener)
+        return
+
+    if os.path.isdir(file_name):
+        return
+
+    with open(file_name, "rb", opener=opener) as f:
+        file_size = os.fstat(f.fileno()).st_size
+
+        if max_file_size is not None and file_size > max_file_size:
+            sniff.add_rejection_stats(stats, sniff.TOO_LARGE, file_size, 0)
+            return
+
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped (and can't contain tags either)
+            return
+
+    with buffer:
+        # Only the pages holding the head are read in, so binary files
+        # are skipped before the rest of the map is touched
+        head = buffer[:sniff.SNIFF_SIZE]
+        rejection = sniff.get_rejection(head, len(buffer))
+
+        if rejection is not None:
+            sniff.add_rejection_stats(stats, rejection, len(buffer), len(head))
+            return
+
+        with metrics.timer(stats, "prefilter"):
+            needs_fallback = candidate_finder.needs_fallback(buffer)
+            candidates = [] if needs_fallback else candidate_finder.find(buffer)
+
+        if needs_fallback:
+            yield from find_matches(
+                tag_regex, tags, file_name, priority_value_map, stats, prefilter_regex, max_file_size,
+                opener=opener)
+            return
+
+        if stats is not None:
+            stats.add("bytes_read", len(buffer))
+
+        if not candidates:
+            if stats is not None:
+                stats.add("files_skipped_by_prefilter")
+            return
+
+        # find_matches throws away the whole file if it isn't valid UTF-8,
+        # so we have to check all of it before giving back anything
+        with metrics.timer(stats, "read"):
+            is_valid = is_valid_utf8(buffer)
+
+        if not is_valid:
+            if stats is not None:
+                stats.add("files_rejected_on_decode")
+            return
+
+        match_start = time.perf_counter()
+
+        matches = []
+        line_number = 1
+        line_start = 0
+        line_end = -1
+
+        for candidate in candidates:
+            offset = candidate.start()
+
+            if offset < line_end:
+                # Already matched the whole line this candidate is on
+                continue
+
+            # Universal newlines: find_matches reads in text mode where
+            # '\r\n' and a lone '\r' both end a line just like '\n' does
+            next_line_start = max(
+                buffer.rfind(b"\n", line_start, offset),
+                buffer.rfind(b"\r", line_start, offset)) + 1
+
+            if next_line_start > line_start:
+                line_number += get_line_break_count(
+                    buffer, line_start, next_line_start)
+                line_start = next_line_start
+
+            line_end = get_line_end(buffer, offset)
+            line = buffer[line_start:line_end].decode("utf-8")
+
+            matches.extend(
+                get_line_matches(
+                    tag_regex,
+                    file_name,
+                    line_number,
+                    line,
+                    priority_value_map))
+
+    if stats is not None:
+        stats.add_time("match", time.perf_counter() - match_start)
+        stats.add("regex_hits", len(matches))
+
+    yield from matches
+
+
+def get_line_break_count(buffer, start, end, chunk_size=1024 * 1024):
+    """
+    Count the lines ending between start and end, copying at most
+    chunk_size bytes out of the map at a time.
+    """
+    count = 0
+
+    while start < end:
+        chunk_end = min(start + chunk_size, end)
+
+        # Keep '\r\n' pairs inside one chunk
+        if chunk_end < end and buffer[chunk_end - 1] == ord("\r"):
+            chunk_end += 1
+
+        chunk = buffer[start:chunk_end]
+        # Each '\r\n' has been counted once as a '\n' and once as a '\r'
+        count += chunk.count(b"\n") + chunk.count(b"\r") - chunk.count(b"\r\n")
+        start = chunk_end
+
+    return count
+
+
+def get_line_end(buffer, offset):
+    ends = [end for end in (buffer.find(b"\n", offset),
+                            buffer.find(b"\r", offset)) if end != -1]
+    return min(ends) if ends else len(buffer)
+
+
+def is_valid_utf8(buffer, chunk_size=1024 * 1024):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    try:
+        for start in range(0, len(buffer), chunk_size):
+            decoder.decode(buffer[start:start + chunk_size])
+
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+
+    return True
+
+
+def scan_files(
+        scanner,
+        files,
+        scan_cache=None,
+        jobs=1,
+        executor="process",
+        stats=None,
+        io_scheduler=None):
+    """
+    Yield (file_name, matches) for every file in files, in the same order as files.
+
+    Files which are unchanged since they were stored in scan_cache are served from it,
+    the rest are scanned (in parallel if jobs != 1) and their results stored back.
+
+    With an io_scheduler the files left to scan are read in the order it picks instead,
+    and given back in the order of files a batch at a time (see iosched.IoScheduler).
+    """
+    cached_matches = {}
+    files_to_scan = files
+
+    if scan_cache is not None:
+        files_to_scan = []
+
+        for file_name in files:
+            records = scan_cache.get(file_name)
+
+            if records is None:
+                files_to_scan.append(file_name)
+            else:
+                cached_matches[file_name] = [
+                    Match(file_name, *record) for record in records]
+
+        if stats is not None:
+            stats.add("files_from_cache", len(cached_matches))
+
+    if io_scheduler is not None:
+        scanned_matches = io_scheduler.map_files(
+            scanner.scan_batch, files_to_scan, jobs, executor, stats)
+    else:
+        scanned_matches = parallel.map_files(
+            scanner.scan_batch, files_to_scan, jobs, executor, stats)
+
+    for file_name in files:
+        if file_name in cached_matches:
+            yield file_name, cached_matches[file_name]
+            continue
+
+        matches = next(scanned_matches)
+
+        if scan_cache is not None:
+            scan_cache.put(file_name, [[m.line_number, m.line, m.tag, m.priority]
+                                       for m in matches])
+
+        yield file_name, matches
 
 
 def get_priority_value_map(all_priorities):
@@ -103,44 +852,300 @@ def get_priority_value_map(all_priorities):
                 for priority_index, priority_text in enumerate(all_priorities))
 
 
-def run(config_map):
+def get_file_scanner(config_map):
+    """
+    Compile everything needed to scan a file for the tags and priorities in config_map.
+    """
     tag_marker = re.escape(config_map["tag_marker"])
-    extensions = config_map["extensions"]
-    priorities = config_map["priorities"]
     tags = config_map["tags"]
+    priorities = config_map["priorities"]
 
     priority_value_map = get_priority_value_map(priorities)
-    value_priority_map = dict(reversed(item)
-                              for item in priority_value_map.items())
     priority_regex = get_priority_regex(priorities)
     tag_regex = get_tag_regex(tag_marker, tags, priority_regex)
-    exclude = [os.path.join(os.getcwd(), d) for d in config_map["exclude"]]
-    can_search_any_extension = "*" in extensions
+    candidate_finder = get_candidate_finder(
+        tag_marker, tags) if config_map.get("matcher") == "mmap" else None
+
+    return FileScanner(
+        tag_regex,
+        tags,
+        priority_value_map,
+        candidate_finder,
+        config_map.get("stats") is not None,
+        get_prefilter_regex(tag_marker, tags),
+        config_map.get("max_file_size"),
+        iosched.open_noatime if config_map.get("io_schedule", False) else None)
+
+
+def get_path_matcher(config_map):
+    return walker.PathMatcher(
+        os.getcwd(),
+        config_map["exclude"],
+        config_map["extensions"])
+
+
+def get_files(config_map, walk_stats=None, visited_dirs=None, file_ids=None):
+    return list(
+        walker.walk(
+            config_map["root"],
+            get_path_matcher(config_map),
+            walk_stats,
+            visited_dirs,
+            file_ids))
+
+
+def get_all_files(config_map, walk_stats=None, file_ids=None):
+    """
+    The files under every one of config_map's roots, in the order the roots were given.
+    Several roots are walked at the same time, since walking mostly waits on the disk.
+    """
+    roots = config_map.get("roots", [config_map["root"]])
+
+    if len(roots) == 1:
+        return get_files(config_map, walk_stats, file_ids=file_ids)
+
+    def walk_root(root):
+        root_walk_stats = walker.WalkStats()
+        return get_files(dict(config_map, root=root),
+                         root_walk_stats, file_ids=file_ids), root_walk_stats
+
+    with parallel.get_executor_class("thread")(max_workers=min(len(roots), MAX_WALK_THREADS)) as pool:
+        results = list(pool.map(walk_root, roots))
 
     files = []
 
-    for root, dirs, files_in_dir in os.walk(config_map["root"]):
-        for file_name in files_in_dir:
-            file_path = os.path.join(root, file_name)
-            # We only want to search for tags in files which have one of the correct
-            # extensions (or user has chosen to include every extension with '*')
-            # and are not inside one of the excluded folders.
-            if can_search_any_extension or any(
-                    file_path.endswith(ext) for ext in extensions):
-                if not any(file_path.startswith(e) for e in exclude):
-                    files.append(file_path)
+    for root_files, root_walk_stats in results:
+        files.extend(root_files)
 
-    matches = []
+        if walk_stats is not None:
+            walk_stats.merge(root_walk_stats)
+
+    # The same file can still be reached from two roots through a symlink
+    return list(dict.fromkeys(files))
+
+
+def iter_all_files(config_map, walk_stats=None):
+    """
+    The same files as get_all_files, yielded as the walk finds them so that they can be
+    searched before it's over (see pipeline.scan_files). Roots are walked one at a time.
+    """
+    path_matcher = get_path_matcher(config_map)
+    seen_files = set()
+
+    for root in config_map.get("roots", [config_map["root"]]):
+        for file_name in walker.walk(root, path_matcher, walk_stats):
+            if file_name not in seen_files:
+                seen_files.add(file_name)
+                yield file_name
+
+
+def get_git_files(config_map, walk_stats=None):
+    """
+    The files to search taken from the git index instead of a directory walk, along with
+    the blob hash of each one (see gitindex.get_blobs_by_file). Returns None if any
+    root isn't inside a git repository.
+    """
+    blobs_by_file = {}
+
+    try:
+        for root in config_map.get("roots", [config_map["root"]]):
+            blobs_by_file.update(gitindex.get_blobs_by_file(root))
+    except OSError:
+        return None
+
+    if walk_stats is None:
+        walk_stats = walker.WalkStats()
+
+    path_matcher = get_path_matcher(config_map)
+    files = []
+
+    for file_name in blobs_by_file:
+        walk_stats.files_walked += 1
+
+        if path_matcher.is_wanted_file(file_name):
+            files.append(file_name)
+        else:
+            walk_stats.files_filtered += 1
+
+    return files, blobs_by_file
+
+
+def get_unique_matches(file_matches, stats=None):
+    """
+    Flatten an iterable of lists of matches, dropping duplicates.
+    """
+    # Keyed on Match's __hash__/__eq__, so this drops duplicates while keeping
+    # the first of each in the order they were found
+    unique_matches = {}
+    match_count = 0
+    dedup_seconds = 0
+
+    for matches in file_matches:
+        dedup_start = time.perf_counter()
+        unique_matches.update(dict.fromkeys(matches))
+        match_count += len(matches)
+        dedup_seconds += time.perf_counter() - dedup_start
+
+    if stats is not None:
+        stats.add("duplicates_dropped", match_count - len(unique_matches))
+        stats.add_time("dedup", dedup_seconds)
+
+    return list(unique_matches)
+
+
+def get_scan_cache(config_map, blobs_by_file=None, listed_at_ns=None):
+    """
+    listed_at_ns is when blobs_by_file was taken from git, see cache.BlobCache.
+    """
+    if not config_map.get("use_cache", False):
+        return None
+
+    if blobs_by_file is not None:
+        scan_cache = cache.BlobCache(
+            blobs_by_file,
+            config_map["tag_marker"],
+            config_map["tags"],
+            config_map["priorities"],
+            config_map.get("max_file_size"),
+            listed_at_ns)
+    else:
+        scan_cache = cache.ScanCache(
+            config_map.get("roots", config_map["root"]),
+            config_map["tag_marker"],
+            config_map["tags"],
+            config_map["priorities"],
+            config_map.get("max_file_size"))
+
+    if config_map.get("clear_cache", False):
+        scan_cache.clear()
+
+    return scan_cache
+
+
+def run(config_map):
+    tag_marker = re.escape(config_map["tag_marker"])
+    stats = config_map.get("stats")
+    scanner = get_file_scanner(config_map)
+    walk_stats = walker.WalkStats()
+    blobs_by_file = None
+    # Filled in by the walk for the I/O scheduler, so that it doesn't stat every file again
+    file_ids = {} if config_map.get("io_schedule", False) else None
+
+    with metrics.timer(stats, "walk"):
+        listed_at_ns = time.time_ns()
+        git_files = get_git_files(
+            config_map, walk_stats) if config_map.get("git", False) else None
+
+        if git_files is not None:
+            files, blobs_by_file = git_files
+        else:
+            if config_map.get("git", False):
+                printer.log(
+                    "Not inside a git repository, walking the directory instead",
+                    "warning",
+                    file=sys.stderr)
+
+            # The pipeline walks as it searches, so it takes the files as they're found
+            files = iter_all_files(config_map, walk_stats) if config_map.get(
+                "pipeline", False) else get_all_files(config_map, walk_stats, file_ids)
+
+    scan_cache = get_scan_cache(config_map, blobs_by_file, listed_at_ns)
+    output_format = config_map.get("format", "table")
+    # Keep machine-readable output parseable
+    log_file = sys.stdout if output_format == "table" else sys.stderr
+
+    if config_map.get("pipeline", False):
+        # Only imported when needed since asyncio is slow to import
+        from taggregator import pipeline
+        scanned_files = pipeline.scan_files(scanner, files, scan_cache, stats)
+    else:
+        io_scheduler = iosched.IoScheduler(
+            config_map.get("readahead"), stats, file_ids) if file_ids is not None else None
+        scanned_files = scan_files(
+            scanner,
+            files,
+            scan_cache,
+            config_map.get("jobs", 1),
+            config_map.get("executor", "process"),
+            stats,
+            io_scheduler)
+
+    file_matches = (matches for _, matches in scanned_files)
+
+    if output_format == "table":
+        matches = get_unique_matches(file_matches, stats)
+        roots = config_map.get("roots", [config_map["root"]])
+        printer.print_matches(
+            matches,
+            tag_marker,
+            scanner.priority_value_map,
+            stats,
+            None if config_map.get("merged", False) or len(roots) == 1 else roots,
+            config_map.get("limit"),
+            config_map.get("page"),
+            config_map.get("summary_first", False))
+    else:
+        with formats.open_output() as stream:
+            write_matches(
+                formats.get_writer(
+                    output_format,
+                    stream,
+                    scanner.priority_value_map,
+                    config_map["root"]),
+                file_matches,
+                stats)
+
+    if scan_cache is not None:
+        scan_cache.save()
+
+    if config_map.get("walk_report", False):
+        for line in walk_stats.get_report_lines():
+            printer.log(line, "information", file=log_file)
+
+    if stats is not None:
+        stats.add_walk_stats(walk_stats)
+        printer.print_stats(stats, config_map.get("stats_json", False))
+
+
+def write_matches(writer, file_matches, stats=None):
+    """
+    Stream matches out through writer as each file's matches arrive. Only duplicates
+    within a file are dropped (the walker never yields the same file twice), so memory
+    use doesn't grow with the number of matches.
+    """
+    with metrics.timer(stats, "render"):
+        writer.write_header()
+
+    for matches in file_matches:
+        unique_matches = dict.fromkeys(matches)
+
+        if stats is not None:
+            stats.add("duplicates_dropped", len(matches) - len(unique_matches))
+
+        with metrics.timer(stats, "render"):
+            for match in unique_matches:
+                writer.write(match)
+
+    with metrics.timer(stats, "render"):
+        writer.write_footer()
 
-    for file_name in files:
-        for match in find_matches(
-                tag_regex,
-                tags,
-                file_name,
-                priority_value_map):
-            # Equality check is handled by the overridden __eq__ in the Match
-            # class
-            if not any(match == m for m in matches):
-                matches.append(match)
 
-    printer.print_matches(matches, tag_marker, priority_value_map)
+# Non-ASCII characters which a case-insensitive str regex matches against
+# an ASCII letter, as UTF-8 (see CandidateFinder)
+FOLDED_LETTER_BYTES = {
+    "i": ["\u0130".encode("utf-8"), "\u0131".encode("utf-8")],
+    "k": ["\u212a".encode("utf-8")],
+    "s": ["\u017f".encode("utf-8")],
+}
+IS_UTF8_LOCALE = codecs.lookup(
+    locale.getpreferredencoding(False)).name == "utf-8"
+# Longest line text kept in a Match, including the truncation indicator
+MAX_LINE_TEXT_LENGTH = 100
+MAX_WALK_THREADS = 8
+# Files bigger than this many bytes are read in chunks of this many characters
+STREAM_THRESHOLD = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Lines longer than this many characters in a streamed file are searched a piece at a time
+STREAM_MAX_LINE_LENGTH = 16 * 1024 * 1024
+# Characters of a long line held back after each piece, more than any tag and priority
+STREAM_TAG_LOOKAHEAD = 4096
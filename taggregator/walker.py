@@ -0,0 +1,274 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+import fnmatch
+import os
+
+
+class WalkStats:
+    def __init__(self):
+        self.dirs_walked = 0
+        self.dirs_pruned = 0
+        self.files_walked = 0
+        self.files_excluded = 0
+        self.files_filtered = 0
+        self.duplicates_skipped = 0
+
+    def merge(self, other):
+        self.dirs_walked += other.dirs_walked
+        self.dirs_pruned += other.dirs_pruned
+        self.files_walked += other.files_walked
+        self.files_excluded += other.files_excluded
+        self.files_filtered += other.files_filtered
+        self.duplicates_skipped += other.duplicates_skipped
+
+    def get_report_lines(self):
+        return [
+            "Walked %d directories, pruned %d excluded directories without entering them" %
+            (self.dirs_walked, self.dirs_pruned),
+            "Walked %d files, skipped %d excluded, %d with other extensions and %d already seen" %
+            (self.files_walked, self.files_excluded, self.files_filtered, self.duplicates_skipped)]
+
+
+class ExcludeRule:
+    def __init__(self, index, pattern):
+        self.index = index
+        self.is_negated = pattern.startswith("!")
+        pattern = pattern[1:] if self.is_negated else pattern
+        # A trailing slash means the rule only matches directories (and so everything in them)
+        self.is_dir_only = pattern.endswith("/")
+        self.pattern = os.path.normpath(pattern.rstrip("/"))
+        self.is_glob = has_glob(self.pattern)
+        self.literal_prefix = get_literal_prefix(self.pattern)
+
+    def could_match_inside(self, rel_dir):
+        """
+        Whether anything below rel_dir could be matched by this rule, assuming the
+        rule's glob part (if any) matches anything.
+        """
+        dir_prefix = rel_dir + os.sep
+        return self.literal_prefix.startswith(
+            dir_prefix) or dir_prefix.startswith(self.literal_prefix)
+
+
+class PathMatcher:
+    """
+    The 'exclude' and 'extensions' config keys compiled into something which can decide
+    cheaply, one path at a time, whether a path should be searched.
+
+    Exclude rules are paths relative to base_dir (normally the current directory) which
+    exclude the file or directory they name and everything inside it. They may contain
+    glob characters, and a rule starting with '!' re-includes whatever it matches. When
+    several rules match a path the last one in the list wins.
+
+    Extensions are compared against every dotted suffix of a file name with a set lookup
+    (so 'gz' and 'tar.gz' both match 'a.tar.gz'), unless they contain glob characters.
+    An extension can also be a whole file name, for files like 'Makefile' which have none.
+    """
+
+    def __init__(self, base_dir, exclude, extensions):
+        self.base_dir = base_dir
+        self.rules = [ExcludeRule(i, pattern)
+                      for i, pattern in enumerate(exclude)]
+        # Map each literal rule path to the index of the last rule which names it
+        self.literal_rules = {}
+
+        for rule in self.rules:
+            if not rule.is_glob:
+                self.literal_rules[rule.pattern] = rule
+
+        self.glob_rules = [rule for rule in self.rules if rule.is_glob]
+        self.negated_rules = [rule for rule in self.rules if rule.is_negated]
+
+        self.can_search_any_extension = "*" in extensions
+        self.extensions = set(ext.lstrip(".")
+                              for ext in extensions if not has_glob(ext))
+        self.extension_globs = [ext.lstrip(".")
+                                for ext in extensions if has_glob(ext)]
+
+    def get_rel_path(self, path):
+        return os.path.relpath(path, self.base_dir)
+
+    def get_rule_index(self, rel_path, is_dir, inherited_index=-1):
+        """
+        Index of the last rule matching rel_path or any of its parents (whose
+        result is passed in as inherited_index), or -1 if none match.
+        """
+        index = inherited_index
+        rule = self.literal_rules.get(rel_path)
+
+        if rule is not None and (is_dir or not rule.is_dir_only):
+            index = max(index, rule.index)
+
+        for rule in self.glob_rules:
+            if rule.index > index and (is_dir or not rule.is_dir_only) and fnmatch.fnmatchcase(
+                    rel_path, rule.pattern):
+                index = rule.index
+
+        return index
+
+    def is_excluded_by(self, rule_index):
+        return rule_index >= 0 and not self.rules[rule_index].is_negated
+
+    def can_prune(self, rel_dir, rule_index):
+        """
+        An excluded directory can be skipped entirely unless a later
+        negated rule could re-include something inside it.
+        """
+        return self.is_excluded_by(rule_index) and not any(
+            rule.index > rule_index and rule.could_match_inside(rel_dir) for rule in self.negated_rules)
+
+    def is_wanted_file(self, path):
+        """
+        Decide whether a single file should be searched without walking to it,
+        by applying the rules to each of its parent directories in turn.
+        """
+        rel_path = self.get_rel_path(path)
+        parts = rel_path.split(os.sep)
+        index = -1
+
+        if not self.has_wanted_extension(parts[-1]):
+            return False
+
+        for i in range(1, len(parts)):
+            index = self.get_rule_index(os.sep.join(parts[:i]), True, index)
+
+        return not self.is_excluded_by(
+            self.get_rule_index(rel_path, False, index))
+
+    def has_wanted_extension(self, file_name):
+        if self.can_search_any_extension or file_name in self.extensions:
+            return True
+
+        suffixes = file_name.split(".")[1:]
+
+        for i in range(len(suffixes)):
+            suffix = ".".join(suffixes[i:])
+
+            if suffix in self.extensions or any(
+                    fnmatch.fnmatchcase(suffix, ext) for ext in self.extension_globs):
+                return True
+
+        return False
+
+
+def has_glob(pattern):
+    return any(c in pattern for c in "*?[")
+
+
+def get_literal_prefix(pattern):
+    for i, c in enumerate(pattern):
+        if c in "*?[":
+            return pattern[:i]
+
+    return pattern
+
+
+def walk(root, path_matcher, walk_stats=None, visited_dirs=None, file_ids=None):
+    """
+    Yield the path of every file under root which path_matcher says should be searched,
+    in the same order as os.walk would visit them. Every directory entered is appended
+    to visited_dirs if it is given, and file_ids (if given) maps every path yielded to
+    its (st_dev, st_ino), which the walk works out anyway (see iosched.get_physical_order).
+
+    Excluded directories are pruned before they are entered. Symlinked directories are
+    not followed (like os.walk), and a directory or file reached a second time through
+    a bind mount, hard link or symlink is skipped.
+    """
+    if walk_stats is None:
+        walk_stats = WalkStats()
+
+    root_rel = path_matcher.get_rel_path(root)
+    root_index = -1 if root_rel == os.curdir else path_matcher.get_rule_index(
+        root_rel, True)
+
+    try:
+        root_stat = os.stat(root)
+    except OSError:
+        return
+
+    seen = {(root_stat.st_dev, root_stat.st_ino)}
+    # Each entry is (directory, its rule index, its device id), the stack keeps
+    # subdirectories in reverse so that they are popped in listing order
+    stack = [(root, root_index, root_stat.st_dev)]
+
+    while stack:
+        directory, dir_index, dir_dev = stack.pop()
+        walk_stats.dirs_walked += 1
+
+        if visited_dirs is not None:
+            visited_dirs.append(directory)
+
+        subdirs = []
+
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            if is_dir:
+                if entry.is_symlink():
+                    continue
+
+                rel_path = path_matcher.get_rel_path(entry.path)
+                index = path_matcher.get_rule_index(rel_path, True, dir_index)
+
+                if path_matcher.can_prune(rel_path, index):
+                    walk_stats.dirs_pruned += 1
+                    continue
+
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if (stat.st_dev, stat.st_ino) in seen:
+                    walk_stats.duplicates_skipped += 1
+                    continue
+
+                seen.add((stat.st_dev, stat.st_ino))
+                subdirs.append((entry.path, index, stat.st_dev))
+                continue
+
+            walk_stats.files_walked += 1
+
+            if not path_matcher.has_wanted_extension(entry.name):
+                walk_stats.files_filtered += 1
+                continue
+
+            rel_path = path_matcher.get_rel_path(entry.path)
+
+            if path_matcher.is_excluded_by(
+                    path_matcher.get_rule_index(rel_path, False, dir_index)):
+                walk_stats.files_excluded += 1
+                continue
+
+            try:
+                if entry.is_symlink():
+                    stat = os.stat(entry.path)
+                    file_id = (stat.st_dev, stat.st_ino)
+                else:
+                    # Regular files share their directory's device, which
+                    # saves a stat call per file
+                    file_id = (dir_dev, entry.inode())
+            except OSError:
+                continue
+
+            if file_id in seen:
+                walk_stats.duplicates_skipped += 1
+                continue
+
+            seen.add(file_id)
+
+            if file_ids is not None:
+                file_ids[entry.path] = file_id
+
+            yield entry.path
+
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,294 @@
+#! /usr/bin/env python3
+#! -*- coding: utf-8 -*-
+
+from taggregator import cache
+from taggregator import printer
+from taggregator import tagg
+import ctypes
+import errno
+import functools
+import os
+import re
+import select
+import struct
+import time
+
+
+class TagIndex:
+    """
+    Every match under a root kept in memory, along with the (size, mtime, inode) key of
+    the file it came from so that refreshing only has to rescan files which changed.
+    Files modified shortly before they were scanned are rescanned on every refresh until
+    they settle, since they could change again without their key changing.
+
+    refresh() re-walks the whole tree, refresh_files() only looks at the given paths,
+    and both return whether the set of matches changed.
+    """
+
+    def __init__(self, config_map, scanner=None):
+        self.config_map = config_map
+        self.scanner = scanner or tagg.get_file_scanner(config_map)
+        self.path_matcher = tagg.get_path_matcher(config_map)
+        self.files = []
+        self.entries = {}
+        self.directories = []
+
+    def refresh(self):
+        directories = []
+        files = tagg.get_files(self.config_map, visited_dirs=directories)
+        is_changed = any(
+            self.entries[f][1] for f in set(
+                self.files).difference(files))
+        entries = {}
+
+        for file_name in files:
+            entry, is_file_changed = self.get_entry(file_name)
+            is_changed = is_changed or is_file_changed
+
+            if entry is not None:
+                entries[file_name] = entry
+
+        self.files = [f for f in files if f in entries]
+        self.entries = entries
+        self.directories = directories
+
+        return is_changed
+
+    def refresh_files(self, file_names):
+        is_changed = False
+
+        for file_name in file_names:
+            if not self.path_matcher.is_wanted_file(file_name):
+                continue
+
+            entry, is_file_changed = self.get_entry(file_name)
+            is_changed = is_changed or is_file_changed
+
+            if entry is None:
+                if self.entries.pop(file_name, None) is not None:
+                    self.files.remove(file_name)
+            else:
+                if file_name not in self.entries:
+                    # Until the next full refresh puts it in walk order
+                    self.files.append(file_name)
+
+                self.entries[file_name] = entry
+
+        return is_changed
+
+    def get_entry(self, file_name):
+        """
+        Return the up to date (key, matches, scanned at) entry for file_name (None if it no
+        longer exists) and whether its matches differ from the ones already in the index.
+        """
+        old_entry = self.entries.get(file_name)
+        old_matches = old_entry[1] if old_entry is not None else []
+        key = cache.get_file_key(file_name)
+
+        if key is None:
+            return None, len(old_matches) > 0
+
+        if old_entry is not None and old_entry[0] == key and key[1] < old_entry[2] - \
+                cache.RACY_WINDOW_NS:
+            return old_entry, False
+
+        scanned_at_ns = time.time_ns()
+
+        try:
+            matches = self.scanner.scan(file_name)
+        except OSError:
+            return None, len(old_matches) > 0
+
+        return (key, matches, scanned_at_ns), get_match_records(
+            matches) != get_match_records(old_matches)
+
+    def get_matches(self):
+        return tagg.get_unique_matches(
+            self.entries[f][1] for f in self.files)
+
+
+class InotifyWatcher:
+    """
+    Minimal inotify binding through ctypes, used to sleep until something under
+    the watched directories changes instead of polling.
+    """
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.watched_dirs = {}
+
+    @staticmethod
+    def create():
+        """
+        Return a watcher, or None if inotify isn't available on this platform.
+        """
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError, TypeError):
+            # No inotify_init1 in this libc, or no libc to load at all (Windows)
+            return None
+
+        return InotifyWatcher(libc, fd) if fd >= 0 else None
+
+    def watch_dirs(self, directories):
+        """
+        Add a watch for each of directories not already being watched.
+        Returns False if the kernel's watch limit was hit.
+        """
+        watched_paths = set(self.watched_dirs.values())
+
+        for directory in directories:
+            if directory in watched_paths:
+                continue
+
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), INOTIFY_MASK)
+
+            if wd < 0:
+                if ctypes.get_errno() == errno.ENOSPC:
+                    return False
+
+                continue
+
+            self.watched_dirs[wd] = directory
+
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Block until there are events (or timeout seconds pass) and return
+        (changed file paths, whether a full refresh is needed).
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return [], False
+
+        # Let a burst of events (e.g. an editor's save dance) settle into one read
+        time.sleep(EVENT_SETTLE_SECONDS)
+        changed_files = []
+        needs_refresh = False
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, name_length = struct.unpack_from(
+                    "iIII", data, offset)
+                name = data[offset + 16:offset + 16 +
+                            name_length].rstrip(b"\0")
+                offset += 16 + name_length
+
+                if mask & IN_IGNORED:
+                    self.watched_dirs.pop(wd, None)
+
+                if mask & (IN_ISDIR | IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                    needs_refresh = True
+                elif wd in self.watched_dirs and name:
+                    changed_files.append(os.path.join(
+                        self.watched_dirs[wd], os.fsdecode(name)))
+
+        return changed_files, needs_refresh
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_match_records(matches):
+    return [(m.line_number, m.line, m.tag, m.priority) for m in matches]
+
+
+def render_matches(config_map, matches):
+    printer.clear_screen()
+    printer.print_matches(
+        matches,
+        re.escape(config_map["tag_marker"]),
+        tagg.get_priority_value_map(config_map["priorities"]))
+
+
+def watch(config_map, render=None, min_interval=0.5, max_interval=10.0):
+    """
+    Scan config_map's root once, render the matches (by default by printing the usual
+    todo list), and then render them again whenever they change until interrupted.
+
+    Uses inotify where available so that nothing runs until a file changes, otherwise
+    polls with an interval which backs off from min_interval to max_interval while
+    nothing is changing.
+    """
+    if render is None:
+        render = functools.partial(render_matches, config_map)
+
+    index = TagIndex(config_map)
+    index.refresh()
+    render(index.get_matches())
+
+    watcher = InotifyWatcher.create()
+
+    if watcher is not None and not watcher.watch_dirs(index.directories):
+        watcher.close()
+        watcher = None
+
+    try:
+        if watcher is not None:
+            watch_with_inotify(index, watcher, render)
+        else:
+            watch_with_polling(index, render, min_interval, max_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def watch_with_inotify(index, watcher, render):
+    while True:
+        changed_files, needs_refresh = watcher.wait()
+
+        if needs_refresh:
+            is_changed = index.refresh()
+            watcher.watch_dirs(index.directories)
+        else:
+            is_changed = index.refresh_files(set(changed_files))
+
+        if is_changed:
+            render(index.get_matches())
+
+
+def watch_with_polling(index, render, min_interval, max_interval):
+    interval = min_interval
+
+    while True:
+        time.sleep(interval)
+
+        if index.refresh():
+            render(index.get_matches())
+            interval = min_interval
+        else:
+            interval = min(interval * POLL_BACKOFF, max_interval)
+
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_SETTLE_SECONDS = 0.05
+POLL_BACKOFF = 1.5
@@ -0,0 +1,84 @@
+import os
+import pytest
+from collections import Counter
+from taggregator import aggregate
+from taggregator import tagg
+
+priorities = ["LOW", "MEDIUM", "HIGH"]
+value_priority_map = dict(enumerate(priorities))
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "exclude": [],
+        "extensions": ["*"],
+        "tag_marker": "@",
+        "tags": {"TODO", "BUG"},
+        "priorities": priorities,
+    }
+
+
+def write_file(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+
+
+def make_tree(root):
+    write_file(root / "a.py", "# @TODO(HIGH) a\n# @BUG(LOW) a\nx = 1\n@BUG @BUG twice on one line\n")
+    write_file(root / "src" / "b.py", "# @TODO(LOW) b\n" + "pass\n" * 9)
+    write_file(root / "src" / "deep" / "c.js", "// @BUG(HIGH) c\n// @bug(medium) c")
+    write_file(root / "docs" / "readme", "no tags here\n")
+
+
+def test_counts_match_a_normal_run(tmp_path):
+    make_tree(tmp_path)
+    config_map = get_config_map(tmp_path)
+    matches = tagg.get_unique_matches(matches for _, matches in tagg.scan_files(
+        tagg.get_file_scanner(config_map), tagg.get_all_files(config_map)))
+
+    tag_aggregate = aggregate.aggregate(config_map, ["tag", "priority"])
+    rows = tag_aggregate.get_rows(value_priority_map)
+
+    assert(dict(((row["tag"], row["priority"]), row["tags"]) for row in rows) ==
+           dict(((tag, value_priority_map.get(priority)), count) for (tag, priority), count in
+                Counter((m.tag, m.priority) for m in matches).items()))
+    assert(tag_aggregate.get_totals() == {
+        "files": 4, "lines": 17, "tags": len(matches), "tags_per_1k_lines": round(6 * 1000 / 17, 3)})
+
+
+def test_file_fields_and_density(tmp_path):
+    make_tree(tmp_path)
+    config_map = get_config_map(tmp_path)
+
+    rows = aggregate.aggregate(config_map, ["directory"]).get_rows(value_priority_map)
+    assert([(row["directory"], row["tags"], row["files"], row["lines"]) for row in rows] ==
+           [(".", 3, 1, 4), ("src", 3, 2, 12)])
+    assert(rows[1]["tags_per_1k_lines"] == 250.0)
+
+    rows = aggregate.aggregate(config_map, ["depth", "extension"], min_priority=2).get_rows(value_priority_map)
+    assert([(row["depth"], row["extension"], row["tags"]) for row in rows] == [(0, "py", 1), (2, "js", 1)])
+
+    rows = aggregate.aggregate(config_map, ["directory"], directory_depth=2).get_rows(value_priority_map, top=2)
+    assert([row["directory"] for row in rows] == [".", os.path.join("src", "deep")])
+
+
+def test_parse_group_by():
+    assert(aggregate.parse_group_by("Tag, directory") == ["tag", "directory"])
+
+    for spec in ["", "tag,line"]:
+        with pytest.raises(ValueError):
+            aggregate.parse_group_by(spec)
+
+
+def test_huge_files_still_count_lines(tmp_path, monkeypatch):
+    path = tmp_path / "big.txt"
+    write_file(path, "@TODO(HIGH) first\n" + "filler\n" * 1000 + "@BUG last")
+    counter = aggregate.TagCounter(tagg.get_file_scanner(get_config_map(tmp_path)))
+    in_memory = counter.count(str(path))
+
+    # Too big to hold in memory, so it's searched as it's read
+    monkeypatch.setattr(tagg, "STREAM_THRESHOLD", 0)
+
+    assert(isinstance(counter.scanner.read(str(path)), list))
+    assert(counter.count(str(path)) == in_memory == (1002, [("TODO", 2), ("BUG", -1)]))
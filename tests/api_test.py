@@ -0,0 +1,63 @@
+import os
+import taggregator
+
+
+def write_file(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+
+
+def make_tree(root):
+    write_file(root / "a.py", "# @TODO(HIGH) a\n# @BUG b\n# @HACK(LOW) not searched for\n")
+    write_file(root / "build" / "b.py", "# @TODO(LOW) built\n")
+    write_file(root / "c.txt", "@todo(medium) c\n")
+
+
+def get_tuples(matches):
+    return [(os.path.basename(m.file_name), m.line_number, m.tag, m.priority) for m in matches]
+
+
+def test_scan(tmp_path, monkeypatch, capsys):
+    # Nothing may be read from or written to the user's home or cache directories
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "root"
+    make_tree(root)
+
+    matches = taggregator.scan(root, tags=["todo", "BUG"], priorities=["LOW", "MEDIUM", "HIGH"],
+                               exclude=["build/"])
+
+    assert(not isinstance(matches, list))
+    assert(get_tuples(matches) == [
+        ("a.py", 1, "TODO", 2),
+        ("a.py", 2, "BUG", taggregator.Match.NO_PRIORITY),
+        ("c.txt", 1, "TODO", 1)])
+    assert(get_tuples(taggregator.scan(str(root / "c.txt"), tags="TODO")) == [("c.txt", 1, "TODO", 1)])
+    assert(capsys.readouterr() == ("", ""))
+    assert(sorted(os.listdir(str(tmp_path))) == ["root"])
+
+
+def test_session_reuses_compiled_scanners(tmp_path):
+    make_tree(tmp_path)
+    session = taggregator.Session(tags=["TODO"], extensions=["py"])
+
+    first = list(session.scan(tmp_path))
+    second = list(session.scan(tmp_path))
+    list(session.scan(tmp_path, tags=["BUG"]))
+
+    assert(get_tuples(first) == get_tuples(second) == [("a.py", 1, "TODO", 2), ("b.py", 1, "TODO", 0)])
+    assert(len(session.scanners) == 2)
+
+
+def test_cancellation_token(tmp_path):
+    for i in range(10):
+        write_file(tmp_path / ("file_%d.py" % i), "# @TODO %d\n" % i)
+
+    token = taggregator.CancellationToken()
+    matches = taggregator.scan(tmp_path, tags=["TODO"], cancellation_token=token)
+    first = next(matches)
+    token.cancel()
+
+    assert(first.tag == "TODO")
+    assert(list(matches) == [])
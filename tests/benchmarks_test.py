@@ -0,0 +1,50 @@
+import os
+from benchmarks import corpus
+from benchmarks import stages
+from benchmarks import __main__ as benchmarks
+from taggregator import tagg
+
+
+def read_tree(root):
+    tree = {}
+
+    for directory, _, files in os.walk(str(root)):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, str(root))] = f.read()
+
+    return tree
+
+
+def test_corpus_is_repeatable(tmp_path):
+    spec = corpus.CorpusSpec(seed=3, file_count=30, lines_per_file=10)
+    corpus.generate(str(tmp_path / "a"), spec)
+    corpus.generate(str(tmp_path / "b"), spec)
+
+    assert(read_tree(tmp_path / "a") == read_tree(tmp_path / "b"))
+    assert(len(read_tree(tmp_path / "a")) == 30)
+
+
+def test_get_regressions():
+    base = {"stages": {"walk": 1.0, "read": 1.0, "render": 0.001}}
+    new = {"stages": {"walk": 1.05, "read": 1.5, "render": 0.002}}
+
+    regressions = benchmarks.get_regressions(base, new, 0.1, 0.002)
+
+    assert([stage for stage, _, _ in regressions] == ["read"])
+
+
+def test_stages_find_what_a_scan_finds(tmp_path, monkeypatch):
+    spec = corpus.CorpusSpec(seed=3, file_count=30, lines_per_file=50, tag_density=0.1)
+    corpus.generate(str(tmp_path), spec)
+
+    stage_times, counts = stages.run_stages(str(tmp_path), spec, 1)
+    config_map = corpus.get_config_map(str(tmp_path), spec)
+    monkeypatch.chdir(str(tmp_path))
+    matches = tagg.get_unique_matches(matches for _, matches in tagg.scan_files(
+        tagg.get_file_scanner(config_map), tagg.get_all_files(config_map)))
+
+    assert(sorted(stage_times) == ["dedup", "match", "prefilter", "read", "render", "scan", "walk"])
+    assert(counts["matches"] == len(matches) > 0)
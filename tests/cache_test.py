@@ -0,0 +1,117 @@
+import os
+import pytest
+from taggregator import cache
+from taggregator import tagg
+
+tags = ["TODO", "HACK"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+@pytest.fixture
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path
+
+
+def make_old_file(path, contents):
+    path.write_text(contents)
+    # Push the mtime well outside the racy window so the entry gets stored
+    os.utime(str(path), ns=(10**18, 10**18))
+    return str(path)
+
+
+def scan(scan_cache, file_name):
+    tag_regex = tagg.get_tag_regex(
+        "@", tags, tagg.get_priority_regex(priorities))
+    scanner = tagg.FileScanner(
+        tag_regex, tags, tagg.get_priority_value_map(priorities))
+    return next(tagg.scan_files(scanner, [file_name], scan_cache))[1]
+
+
+def test_unchanged_file_is_served_from_cache(cache_home):
+    file_name = make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n")
+
+    first_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    first = scan(first_cache, file_name)
+    first_cache.save()
+
+    second_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    assert(second_cache.get(file_name) is not None)
+
+    second = scan(second_cache, file_name)
+    assert([(m.line_number, m.line, m.tag, m.priority) for m in first] ==
+           [(m.line_number, m.line, m.tag, m.priority) for m in second])
+
+
+def test_changed_file_is_rescanned(cache_home):
+    file_name = make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n")
+
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    scan(scan_cache, file_name)
+    scan_cache.save()
+
+    make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n// @HACK b\n")
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+
+    assert(scan_cache.get(file_name) is None)
+    assert(len(scan(scan_cache, file_name)) == 2)
+
+
+def test_recently_modified_file_is_not_stored(cache_home):
+    file_name = str(cache_home / "a.txt")
+    (cache_home / "a.txt").write_text("// @TODO(HIGH) a\n")
+
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    scan(scan_cache, file_name)
+    scan_cache.save()
+
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    assert(scan_cache.get(file_name) is None)
+
+
+def test_config_change_invalidates_cache(cache_home):
+    file_name = make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n")
+
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    scan(scan_cache, file_name)
+    scan_cache.save()
+
+    assert(cache.ScanCache(str(cache_home), "#", tags, priorities).get(file_name) is None)
+    assert(cache.ScanCache(str(cache_home), "@", ["TODO"], priorities).get(file_name) is None)
+    assert(cache.ScanCache(str(cache_home), "@", tags, ["HIGH", "LOW"]).get(file_name) is None)
+    assert(cache.ScanCache(str(cache_home), "@", tags, priorities).get(file_name) is not None)
+
+
+def test_clear_removes_cache_file(cache_home):
+    file_name = make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n")
+
+    scan_cache = cache.ScanCache(str(cache_home), "@", tags, priorities)
+    scan(scan_cache, file_name)
+    scan_cache.save()
+    assert(os.path.isfile(scan_cache.path))
+
+    scan_cache.clear()
+    assert(not os.path.isfile(scan_cache.path))
+
+
+def test_max_file_size_change_invalidates_cache(cache_home):
+    file_name = make_old_file(cache_home / "a.txt", "// @TODO(HIGH) a\n")
+    config_map = {
+        "root": str(cache_home),
+        "use_cache": True,
+        "tag_marker": "@",
+        "tags": tags,
+        "priorities": priorities,
+        "max_file_size": 5,
+    }
+
+    # Too big to be searched, so it's cached as having no tags
+    scan_cache = tagg.get_scan_cache(config_map)
+    assert(list(tagg.scan_files(tagg.get_file_scanner(config_map), [file_name], scan_cache)) ==
+           [(file_name, [])])
+    scan_cache.save()
+
+    config_map["max_file_size"] = None
+    scan_cache = tagg.get_scan_cache(config_map)
+    assert(scan_cache.get(file_name) is None)
+    assert(len(scan(scan_cache, file_name)) == 1)
@@ -0,0 +1,50 @@
+import pytest
+from taggregator import check
+
+priority_value_map = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "tag_marker": "@",
+        "tags": ["BUG", "HACK"],
+        "priorities": ["LOW", "MEDIUM", "HIGH"],
+        "extensions": ["*"],
+        "exclude": [],
+    }
+
+
+def test_get_fail_rule():
+    rule = check.get_fail_rule("bug:high", priority_value_map)
+
+    assert(rule.tag == "BUG")
+    assert(rule.min_priority == 2)
+    assert(check.get_fail_rule("HACK", priority_value_map).min_priority is None)
+
+    with pytest.raises(ValueError):
+        check.get_fail_rule("BUG:URGENT", priority_value_map)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_check_stops_after_max_failing_matches(tmp_path, jobs):
+    for i in range(10):
+        (tmp_path / ("file_%d.txt" % i)).write_text("// @BUG(HIGH) a\n// @BUG(LOW) b\n")
+
+    config_map = get_config_map(tmp_path)
+    config_map["jobs"] = jobs
+    fail_rules = [check.get_fail_rule("BUG:MEDIUM", priority_value_map)]
+
+    assert(len(check.check(config_map, fail_rules, max_count=0)) == 1)
+    assert(len(check.check(config_map, fail_rules, max_count=3)) == 4)
+    assert(len(check.check(config_map, fail_rules, max_count=100)) == 10)
+
+
+def test_check_passes_without_failing_matches(tmp_path):
+    (tmp_path / "a.txt").write_text("// @BUG(LOW) a\n// @HACK(HIGH) b\n")
+
+    fail_rules = [check.get_fail_rule("BUG:HIGH", priority_value_map)]
+
+    assert(check.check(get_config_map(tmp_path), fail_rules) == [])
+    # No rules means any tag fails
+    assert(len(check.check(get_config_map(tmp_path), [], max_count=5)) == 2)
@@ -0,0 +1,117 @@
+import os
+from taggregator import database
+
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_config_map(root, tags=("TODO", "BUG")):
+    return {
+        "root": str(root),
+        "exclude": [],
+        "extensions": ["txt"],
+        "tag_marker": "@",
+        "tags": set(tags),
+        "priorities": priorities,
+    }
+
+
+def write_old_file(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+    # Push the mtime well outside the racy window so the file isn't rescanned every time
+    os.utime(str(path), ns=(10**18, 10**18))
+
+
+def make_tree(root):
+    write_old_file(root / "billing" / "a.txt", "// @BUG(HIGH) a\n// @TODO(LOW) a\n")
+    write_old_file(root / "billing_v2" / "b.txt", "// @BUG(HIGH) b\n")
+    write_old_file(root / "c.txt", "// @TODO(MEDIUM) c\n")
+
+
+def get_lines(matches):
+    return [match.line for match in matches]
+
+
+def test_update_only_rescans_changed_files(tmp_path):
+    root = tmp_path / "root"
+    make_tree(root)
+
+    with database.TagDatabase(str(tmp_path / "index.db")) as tag_database:
+        assert(tag_database.update(get_config_map(root)) == (3, 3))
+        assert(tag_database.update(get_config_map(root)) == (3, 0))
+
+        write_old_file(root / "c.txt", "// @TODO(MEDIUM) c changed\n")
+        os.remove(str(root / "billing_v2" / "b.txt"))
+
+        assert(tag_database.update(get_config_map(root)) == (2, 1))
+        assert(get_lines(tag_database.query()) ==
+               ["// @BUG(HIGH) a", "// @TODO(LOW) a", "// @TODO(MEDIUM) c changed"])
+
+        # Different tags make every stored match suspect
+        assert(tag_database.update(get_config_map(root, ["TODO"])) == (2, 2))
+        assert(get_lines(tag_database.query()) == ["// @TODO(LOW) a", "// @TODO(MEDIUM) c changed"])
+
+
+def test_query_filters(tmp_path):
+    root = tmp_path / "root"
+    make_tree(root)
+
+    with database.TagDatabase(str(tmp_path / "index.db")) as tag_database:
+        tag_database.update(get_config_map(root))
+
+        assert(get_lines(tag_database.query(tags=["bug"])) == ["// @BUG(HIGH) a", "// @BUG(HIGH) b"])
+        assert(get_lines(tag_database.query(min_priority=1)) ==
+               ["// @BUG(HIGH) a", "// @BUG(HIGH) b", "// @TODO(MEDIUM) c"])
+        # billing_v2 isn't inside billing
+        assert(get_lines(tag_database.query(path_prefix="billing")) ==
+               ["// @BUG(HIGH) a", "// @TODO(LOW) a"])
+        assert(get_lines(tag_database.query(path_prefix="c.txt")) == ["// @TODO(MEDIUM) c"])
+        assert(get_lines(tag_database.query(tags=["TODO"], min_priority=1, path_prefix="billing")) == [])
+        assert(tag_database.query()[0].file_name == str(root / "billing" / "a.txt"))
+
+
+def test_snapshot_diff(tmp_path):
+    old_root = tmp_path / "old"
+    new_root = tmp_path / "new"
+    make_tree(old_root)
+    make_tree(new_root)
+    # Moving a tag down a line doesn't make it a different tag
+    write_old_file(new_root / "billing" / "a.txt", "\n// @BUG(HIGH) a\n// @TODO(HIGH) a\n")
+
+    with database.TagDatabase(str(tmp_path / "old.db")) as old_database, \
+            database.TagDatabase(str(tmp_path / "new.db")) as new_database:
+        old_database.update(get_config_map(old_root))
+        new_database.update(get_config_map(new_root))
+
+        added, removed = database.get_snapshot_diff(old_database, new_database)
+
+        assert(get_lines(added) == ["// @TODO(HIGH) a"])
+        assert(added[0].line_number == 3)
+        assert(get_lines(removed) == ["// @TODO(LOW) a"])
+
+        added, removed = database.get_snapshot_diff(
+            old_database, new_database, path_prefix="billing_v2")
+
+        assert(added == [] and removed == [])
+
+
+def test_max_file_size_change_rebuilds_index(tmp_path):
+    root = tmp_path / "root"
+    make_tree(root)
+    config_map = dict(get_config_map(root), max_file_size=5)
+
+    with database.TagDatabase(str(tmp_path / "index.db")) as tag_database:
+        tag_database.update(config_map)
+        assert(tag_database.query() == [])
+
+        config_map["max_file_size"] = None
+        assert(tag_database.update(config_map) == (3, 3))
+        assert(len(tag_database.query()) == 4)
+
+
+def test_database_path_is_the_same_for_roots_in_any_order(tmp_path):
+    roots = [str(tmp_path / "a"), str(tmp_path / "b")]
+
+    assert(database.get_database_path(roots) == database.get_database_path(roots[::-1]))
+    assert(database.get_database_path(roots[:1]) == database.get_database_path(roots[0]))
+    assert(database.get_database_path(roots) != database.get_database_path(roots[0]))
@@ -0,0 +1,132 @@
+import os
+import pytest
+import shutil
+import subprocess
+from taggregator import diff
+
+tags = ["TODO", "HACK"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+example_diff = """diff --git a/a.txt b/a.txt
+index 1111111..2222222 100644
+--- a/a.txt
++++ b/a.txt
+@@ -1,3 +1,4 @@
+ first
+--- @TODO(LOW) removed, looks like a file header
++// @TODO(HIGH) added
++// @HACK added too
+ last
+@@ -10 +11 @@ context
+-old
++// @HACK(LOW) replaced
+\\ No newline at end of file
+diff --git a/gone.txt b/gone.txt
+deleted file mode 100644
+--- a/gone.txt
++++ /dev/null
+@@ -1 +0,0 @@
+-// @TODO deleted
+diff --git a/new.txt b/new.txt
+new file mode 100644
+--- /dev/null
++++ b/new.txt
+@@ -0,0 +1,2 @@
++plain
++// @TODO new file
+"""
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "tag_marker": "@",
+        "tags": tags,
+        "priorities": priorities,
+        "exclude": [],
+        "extensions": ["txt"],
+    }
+
+
+def test_added_lines_have_new_line_numbers():
+    added_lines = list(diff.get_added_lines(example_diff.splitlines()))
+
+    assert(added_lines == [
+        ("a.txt", 2, "// @TODO(HIGH) added"),
+        ("a.txt", 3, "// @HACK added too"),
+        ("a.txt", 11, "// @HACK(LOW) replaced"),
+        ("new.txt", 1, "plain"),
+        ("new.txt", 2, "// @TODO new file"),
+    ])
+
+
+def test_diff_matches(tmp_path):
+    matches = diff.find_diff_matches(
+        get_config_map(tmp_path), example_diff.splitlines(True))
+
+    assert([(os.path.basename(m.file_name), m.line_number, m.tag) for m in matches] == [
+        ("a.txt", 2, "TODO"),
+        ("a.txt", 3, "HACK"),
+        ("a.txt", 11, "HACK"),
+        ("new.txt", 2, "TODO"),
+    ])
+
+
+def test_unwanted_files_are_skipped(tmp_path):
+    config_map = get_config_map(tmp_path)
+    config_map["exclude"] = ["new.txt"]
+    config_map["root"] = os.getcwd()
+
+    matches = diff.find_diff_matches(config_map, example_diff.splitlines())
+
+    assert(all(os.path.basename(m.file_name) == "a.txt" for m in matches))
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_staged_diff(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-C", str(tmp_path)] + list(args), check=True)
+
+    git("init", "-q")
+    git("config", "user.email", "tagg@example.com")
+    git("config", "user.name", "tagg")
+    (tmp_path / "a.txt").write_text("one\n// @TODO(LOW) old\nthree\n")
+    git("add", "a.txt")
+    git("commit", "-q", "-m", "Initial commit")
+
+    (tmp_path / "a.txt").write_text("one\n// @TODO(LOW) old\n// @HACK(HIGH) new\nthree\n")
+    git("add", "a.txt")
+    # Unstaged changes aren't part of the commit
+    (tmp_path / "a.txt").write_text("// @TODO unstaged\none\n// @TODO(LOW) old\n// @HACK(HIGH) new\nthree\n")
+
+    matches = diff.find_diff_matches(
+        get_config_map(tmp_path), diff.get_staged_diff(str(tmp_path)))
+
+    assert([(m.line_number, m.tag, m.priority) for m in matches] == [(3, "HACK", 2)])
+
+
+def test_quoted_paths_are_unescaped():
+    assert(diff.get_diff_path('"b/caf\\303\\251 \\"menu\\".txt"') == 'café "menu".txt')
+    assert(diff.get_diff_path('"b/tab\\there\\\\back.txt"') == "tab\there\\back.txt")
+    assert(diff.get_diff_path('"b/café\\n.txt"') == "café\n.txt")
+    assert(diff.get_diff_path("b/with space.txt\t") == "with space.txt")
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_staged_diff_of_unusual_file_names(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-C", str(tmp_path)] + list(args), check=True)
+
+    git("init", "-q")
+    names = ["with space.txt", "café.txt", 'quote"d.txt', "back\\slash.txt"]
+
+    for name in names:
+        (tmp_path / name).write_text("// @TODO(HIGH) %s\n" % name)
+
+    git("add", "--", *names)
+
+    matches = diff.find_diff_matches(
+        get_config_map(tmp_path), diff.get_staged_diff(str(tmp_path)))
+
+    assert(sorted(os.path.basename(m.file_name) for m in matches) == sorted(names))
+    assert(all(os.path.isfile(m.file_name) for m in matches))
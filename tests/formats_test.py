@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import os
+import pytest
+from taggregator import formats
+from taggregator import tagg
+
+priority_value_map = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+root = os.path.abspath("project")
+
+
+def get_matches():
+    return [
+        tagg.Match(os.path.join(root, "a.py"), 3, "# @BUG(HIGH) a", "BUG", 2),
+        tagg.Match(os.path.join(root, "b", "c.py"), 10, "# @HACK, \"quoted\"", "HACK", tagg.Match.NO_PRIORITY),
+    ]
+
+
+def write(output_format, file_matches):
+    stream = io.StringIO()
+    writer = formats.get_writer(output_format, stream, priority_value_map, root)
+    tagg.write_matches(writer, file_matches)
+
+    return stream.getvalue()
+
+
+def test_jsonl_writes_one_record_per_line():
+    lines = write("jsonl", [get_matches()]).splitlines()
+
+    assert(len(lines) == 2)
+    assert(json.loads(lines[0])["priority"] == "HIGH")
+    assert(json.loads(lines[1])["priority"] is None)
+    assert(json.loads(lines[1])["line"] == 10)
+
+
+def test_csv_round_trips():
+    rows = list(csv.DictReader(io.StringIO(write("csv", [get_matches()]))))
+
+    assert(len(rows) == 2)
+    assert(rows[1]["text"] == "# @HACK, \"quoted\"")
+
+
+@pytest.mark.parametrize("file_matches", [[], [[]], [get_matches()]])
+def test_sarif_is_valid_json(file_matches):
+    document = json.loads(write("sarif", file_matches))
+    results = document["runs"][0]["results"]
+
+    assert(document["version"] == "2.1.0")
+    assert(len(results) == sum(len(m) for m in file_matches))
+
+
+def test_sarif_result_location_is_relative_to_root():
+    result = json.loads(write("sarif", [get_matches()]))["runs"][0]["results"][1]
+    location = result["locations"][0]["physicalLocation"]
+
+    assert(location["artifactLocation"]["uri"] == "b/c.py")
+    assert(location["region"]["startLine"] == 10)
+    assert(result["level"] == "note")
+
+
+def test_duplicates_within_a_file_are_dropped():
+    match = get_matches()[0]
+
+    assert(len(write("jsonl", [[match, match]]).splitlines()) == 1)
+
+def test_a_writer_has_to_write_matches():
+    class HeaderOnlyWriter(formats.MatchWriter):
+        pass
+
+    with pytest.raises(TypeError):
+        HeaderOnlyWriter(io.StringIO(), priority_value_map, "/")
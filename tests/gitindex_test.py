@@ -0,0 +1,121 @@
+import os
+import pytest
+import shutil
+import subprocess
+from taggregator import cache
+from taggregator import gitindex
+from taggregator import tagg
+
+tags = ["TODO", "HACK"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("git") is None, reason="git is not installed")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "repo"
+    root.mkdir()
+    git(root, "init", "-q")
+    git(root, "config", "user.email", "tagg@example.com")
+    git(root, "config", "user.name", "tagg")
+
+    (root / "a.txt").write_text("// @TODO(HIGH) a\n")
+    (root / "b.txt").write_text("// @HACK(LOW) b\n")
+    (root / "gone.txt").write_text("// @TODO gone\n")
+    (root / "build").mkdir()
+    (root / "build" / "c.txt").write_text("// @TODO built\n")
+
+    # Push the mtimes well outside the racy window so that blobs get cached
+    for path in ["a.txt", "b.txt", "gone.txt", "build/c.txt"]:
+        os.utime(str(root / path), ns=(10**18, 10**18))
+
+    git(root, "add", "a.txt", "b.txt", "gone.txt", "build/c.txt")
+    git(root, "commit", "-q", "-m", "Initial commit")
+
+    return root
+
+
+def git(root, *args):
+    subprocess.run(["git", "-C", str(root)] + list(args), check=True)
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "tag_marker": "@",
+        "tags": tags,
+        "priorities": priorities,
+        "exclude": ["build/"],
+        "extensions": ["txt"],
+        "use_cache": True,
+    }
+
+
+def get_scanner():
+    tag_regex = tagg.get_tag_regex(
+        "@", tags, tagg.get_priority_regex(priorities))
+    return tagg.FileScanner(
+        tag_regex, tags, tagg.get_priority_value_map(priorities))
+
+
+def test_files_come_from_index(repo):
+    os.remove(str(repo / "gone.txt"))
+    (repo / "untracked.txt").write_text("// @TODO untracked\n")
+    (repo / "a.txt").write_text("// @TODO(HIGH) a\n// @HACK more\n")
+
+    blobs_by_file = gitindex.get_blobs_by_file(str(repo))
+
+    assert(sorted(os.path.basename(f) for f in blobs_by_file) == ["a.txt", "b.txt", "c.txt"])
+    # Changed since it was added, so there's no blob with its content
+    assert(blobs_by_file[str(repo / "a.txt")] is None)
+    assert(blobs_by_file[str(repo / "b.txt")] is not None)
+
+
+def test_exclude_rules_apply_to_index(repo, monkeypatch):
+    monkeypatch.chdir(str(repo))
+    files, _ = tagg.get_git_files(get_config_map(repo))
+
+    assert(sorted(os.path.basename(f) for f in files) == ["a.txt", "b.txt", "gone.txt"])
+
+
+def test_not_a_repository(tmp_path):
+    assert(tagg.get_git_files(get_config_map(tmp_path)) is None)
+
+
+def test_blob_cache_survives_rename(repo):
+    blobs_by_file = gitindex.get_blobs_by_file(str(repo))
+    file_name = str(repo / "b.txt")
+    blob_cache = cache.BlobCache(blobs_by_file, "@", tags, priorities)
+    first = next(tagg.scan_files(get_scanner(), [file_name], blob_cache))[1]
+    blob_cache.save()
+
+    git(repo, "mv", "b.txt", "renamed.txt")
+    blobs_by_file = gitindex.get_blobs_by_file(str(repo))
+    blob_cache = cache.BlobCache(blobs_by_file, "@", tags, priorities)
+
+    assert(blob_cache.get(str(repo / "renamed.txt")) ==
+           [[m.line_number, m.line, m.tag, m.priority] for m in first])
+
+
+def test_changed_file_is_not_cached(repo):
+    (repo / "a.txt").write_text("// @HACK(LOW) changed\n")
+    blobs_by_file = gitindex.get_blobs_by_file(str(repo))
+    blob_cache = cache.BlobCache(blobs_by_file, "@", tags, priorities)
+    matches = next(tagg.scan_files(get_scanner(), [str(repo / "a.txt")], blob_cache))[1]
+
+    assert([m.tag for m in matches] == ["HACK"])
+    assert(not blob_cache.entries)
+
+
+def test_file_edited_after_listing_is_not_cached(repo):
+    blobs_by_file = gitindex.get_blobs_by_file(str(repo))
+    file_name = str(repo / "b.txt")
+    (repo / "b.txt").write_text("// @TODO(HIGH) edited\n")
+    blob_cache = cache.BlobCache(blobs_by_file, "@", tags, priorities)
+    matches = next(tagg.scan_files(get_scanner(), [file_name], blob_cache))[1]
+
+    assert([m.tag for m in matches] == ["TODO"])
+    assert(not blob_cache.entries)
@@ -0,0 +1,113 @@
+import os
+from taggregator import iosched
+from taggregator import metrics
+from taggregator import tagg
+
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "exclude": [],
+        "extensions": ["txt"],
+        "tag_marker": "@",
+        "tags": {"TODO", "BUG"},
+        "priorities": priorities,
+        "io_schedule": True,
+    }
+
+
+def make_tree(root, count):
+    for i in range(count):
+        path = root / ("dir_%d" % (i % 5)) / ("file_%d.txt" % i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("// @TODO(%s) %d\n// @BUG %d\n" % (priorities[i % 3], i, i))
+
+
+def test_physical_order_is_by_inode_with_missing_files_last(tmp_path):
+    make_tree(tmp_path, 30)
+    files = tagg.get_all_files(get_config_map(tmp_path))
+    missing = str(tmp_path / "missing.txt")
+    ordered = iosched.get_physical_order([missing] + files)
+
+    assert(sorted(ordered) == sorted(files + [missing]))
+    assert(ordered[-1] == missing)
+    assert([os.stat(f).st_ino for f in ordered[:-1]] ==
+           sorted(os.stat(f).st_ino for f in files))
+
+
+def test_inodes_come_from_the_walk(tmp_path):
+    make_tree(tmp_path, 30)
+    file_ids = {}
+    files = tagg.get_all_files(get_config_map(tmp_path), file_ids=file_ids)
+    stats = metrics.ScanStats()
+
+    assert(file_ids == dict((f, (os.stat(f).st_dev, os.stat(f).st_ino)) for f in files))
+    assert(iosched.get_physical_order(files, stats, file_ids) == iosched.get_physical_order(files))
+    assert(stats.counters["stat_calls_for_order"] == 0)
+
+
+def test_scheduled_scan_gives_the_same_results_in_walk_order(tmp_path):
+    make_tree(tmp_path, 40)
+    config_map = get_config_map(tmp_path)
+    files = tagg.get_all_files(config_map)
+    scanner = tagg.get_file_scanner(config_map)
+    stats = metrics.ScanStats()
+
+    assert(scanner.opener is iosched.open_noatime)
+
+    for jobs in [1, 3]:
+        scanned = list(tagg.scan_files(
+            scanner, files, jobs=jobs, executor="thread",
+            io_scheduler=iosched.IoScheduler(4, stats, batch_size=7)))
+        assert(scanned == list(tagg.scan_files(scanner, files)))
+
+
+def test_results_stream_a_batch_at_a_time(tmp_path):
+    make_tree(tmp_path, 40)
+    config_map = get_config_map(tmp_path)
+    files = tagg.get_all_files(config_map)
+    scanner = tagg.get_file_scanner(config_map)
+    scanned = []
+
+    def scan_batch(file_names):
+        scanned.extend(file_names)
+        return scanner.scan_batch(file_names)
+
+    results = iosched.IoScheduler(4, batch_size=8).map_files(scan_batch, files)
+    first = next(results)
+
+    assert(first == scanner.scan(files[0]))
+    assert(sorted(scanned) == sorted(files[:8]))
+    results.close()
+
+
+def test_prefetcher_stays_within_its_window(monkeypatch):
+    advised = []
+    monkeypatch.setattr(iosched, "CAN_ADVISE", True)
+    monkeypatch.setattr(iosched, "advise_will_need", lambda f: advised.append(f) or True)
+    file_names = ["file_%d" % i for i in range(100)]
+    results = iosched.IoScheduler(5).track(file_names, iter(file_names))
+
+    for i, _ in enumerate(results):
+        assert(len(advised) <= i + 1 + 5)
+        assert(advised == file_names[:len(advised)])
+
+
+def test_noatime_falls_back_for_files_we_dont_own(tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_text("@TODO")
+    real_open = os.open
+    noatime_flag = 0x40000
+
+    def fake_open(path, flags, mode=0o777):
+        if flags & noatime_flag:
+            raise PermissionError(1, "Operation not permitted")
+        return real_open(path, flags, mode)
+
+    monkeypatch.setattr(iosched, "NOATIME_FLAG", noatime_flag)
+    monkeypatch.setattr(os, "open", fake_open)
+
+    with open(str(path), opener=iosched.open_noatime) as f:
+        assert(f.read() == "@TODO")
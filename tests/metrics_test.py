@@ -0,0 +1,96 @@
+import json
+from taggregator import metrics
+from taggregator import parallel
+from taggregator import tagg
+from taggregator import walker
+
+tags = ["TODO", "HACK"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_scanner(candidate_finder=None):
+    tag_regex = tagg.get_tag_regex(
+        "@", tags, tagg.get_priority_regex(priorities))
+    return tagg.FileScanner(
+        tag_regex,
+        tags,
+        tagg.get_priority_value_map(priorities),
+        candidate_finder,
+        keep_stats=True)
+
+
+def get_files(tmp_path):
+    tagged = tmp_path / "tagged.txt"
+    tagged.write_text("// @TODO(HIGH) one\n// nothing\n// @HACK(LOW) two\n")
+    untagged = tmp_path / "untagged.txt"
+    untagged.write_text("nothing to see here\n")
+    binary = tmp_path / "binary.txt"
+    binary.write_bytes(b"@TODO \xff\xfe\n")
+
+    return [str(tagged), str(untagged), str(binary)]
+
+
+def test_scan_counters(tmp_path):
+    for candidate_finder in [None, tagg.get_candidate_finder("@", tags)]:
+        stats = metrics.ScanStats()
+        files = get_files(tmp_path)
+        list(tagg.scan_files(get_scanner(candidate_finder), files, stats=stats))
+
+        assert(stats.counters["regex_hits"] == 2)
+        assert(stats.counters["files_skipped_by_prefilter"] == 1)
+        assert(stats.counters["files_skipped_not_utf8"] == 1)
+        assert(stats.counters["bytes_read"] > 0)
+        assert("match" in stats.timings)
+
+
+def test_parallel_stats_are_merged(tmp_path):
+    files = get_files(tmp_path)
+    serial_stats = metrics.ScanStats()
+    thread_stats = metrics.ScanStats()
+    scanner = get_scanner()
+
+    list(parallel.map_files(scanner.scan_batch, files, stats=serial_stats))
+    list(parallel.map_files(scanner.scan_batch, files, 2, "thread", thread_stats))
+
+    assert(serial_stats.counters == thread_stats.counters)
+
+
+def test_no_stats_kept_by_default(tmp_path):
+    scanner = tagg.FileScanner(
+        tagg.get_tag_regex("@", tags, tagg.get_priority_regex(priorities)),
+        tags,
+        tagg.get_priority_value_map(priorities))
+    results, batch_stats = scanner.scan_batch(get_files(tmp_path))
+
+    assert(batch_stats is None)
+    assert(len(results[0]) == 2)
+
+
+def test_duplicates_dropped():
+    stats = metrics.ScanStats()
+    match = tagg.Match("a.txt", 1, "@TODO", "TODO", 0)
+    unique_matches = tagg.get_unique_matches([[match], [match]], stats)
+
+    assert(unique_matches == [match])
+    assert(stats.counters["duplicates_dropped"] == 1)
+
+
+def test_report_and_json():
+    stats = metrics.ScanStats()
+    walk_stats = walker.WalkStats()
+    walk_stats.files_walked = 3
+    walk_stats.files_excluded = 1
+    stats.add_walk_stats(walk_stats)
+
+    with metrics.timer(stats, "walk"):
+        pass
+
+    with metrics.timer(None, "walk"):
+        pass
+
+    data = json.loads(stats.to_json())
+
+    assert(data["counters"]["files_walked"] == 3)
+    assert(data["counters"]["files_filtered"] == 1)
+    assert("walk" in data["timings"])
+    assert(any(line.startswith("walk time") for line in stats.get_report_lines()))
@@ -0,0 +1,55 @@
+import os
+import pytest
+from taggregator import parallel
+from taggregator import tagg
+
+tags = ["TODO", "HACK", "ROBUSTNESS", "SPEED"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_scanner():
+    tag_regex = tagg.get_tag_regex(
+        "@", tags, tagg.get_priority_regex(priorities))
+    return tagg.FileScanner(
+        tag_regex, tags, tagg.get_priority_value_map(priorities))
+
+
+def get_files(tmp_path, count):
+    files = []
+
+    for i in range(count):
+        path = tmp_path / ("file_%d.txt" % i)
+        path.write_text("// @TODO(HIGH) %d\n// nothing\n// @HACK(LOW) %d\n" % (i, i))
+        files.append(str(path))
+
+    return files
+
+
+def flatten(results):
+    return [(file_name, m.line_number, m.line, m.tag, m.priority)
+            for file_name, matches in results for m in matches]
+
+
+@pytest.mark.parametrize("executor", sorted(parallel.EXECUTORS))
+def test_parallel_scan_matches_serial_scan(tmp_path, executor):
+    files = get_files(tmp_path, 50)
+    scanner = get_scanner()
+
+    serial = flatten(tagg.scan_files(scanner, files))
+    parallel_results = flatten(tagg.scan_files(
+        scanner, files, jobs=4, executor=executor))
+
+    assert(len(serial) == 100)
+    assert(serial == parallel_results)
+
+
+def test_get_chunks_covers_every_item():
+    items = list(range(10))
+    chunks = parallel.get_chunks(items, 3)
+
+    assert(chunks == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+
+def test_get_job_count():
+    assert(parallel.get_job_count(3) == 3)
+    assert(parallel.get_job_count(0) == (os.cpu_count() or 1))
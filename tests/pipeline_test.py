@@ -0,0 +1,179 @@
+import os
+import pytest
+import threading
+from taggregator import cache
+from taggregator import metrics
+from taggregator import pipeline
+from taggregator import tagg
+
+tags = ["TODO", "HACK", "ROBUSTNESS", "SPEED"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_scanner(keep_stats=False):
+    tag_marker = "@"
+    tag_regex = tagg.get_tag_regex(
+        tag_marker, tags, tagg.get_priority_regex(priorities))
+    return tagg.FileScanner(
+        tag_regex,
+        tags,
+        tagg.get_priority_value_map(priorities),
+        keep_stats=keep_stats,
+        prefilter_regex=tagg.get_prefilter_regex(tag_marker, tags))
+
+
+def get_files(tmp_path, count):
+    files = []
+
+    for i in range(count):
+        path = tmp_path / ("file_%d.txt" % i)
+        path.write_text("// @TODO(HIGH) %d\n// nothing\n// @HACK(LOW) %d\n" % (i, i))
+        files.append(str(path))
+
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n@TODO(HIGH)")
+    (tmp_path / "latin1.txt").write_bytes(b"@TODO(HIGH) caf\xe9\n")
+    files[count // 2:count // 2] = [str(tmp_path / "image.png"), str(tmp_path / "latin1.txt")]
+
+    return files
+
+
+def flatten(results):
+    return [(file_name, m.line_number, m.line, m.tag, m.priority)
+            for file_name, matches in results for m in matches]
+
+
+def test_pipeline_matches_serial_scan(tmp_path):
+    files = get_files(tmp_path, 100)
+    serial_stats = metrics.ScanStats()
+    pipeline_stats = metrics.ScanStats()
+
+    serial = flatten(tagg.scan_files(get_scanner(True), files, stats=serial_stats))
+    # A generator, like the walk
+    pipelined = flatten(pipeline.scan_files(
+        get_scanner(True), (f for f in files), stats=pipeline_stats, reader_count=3))
+
+    assert(pipelined == serial)
+
+    for name in ["bytes_read", "files_skipped_binary", "files_rejected_on_decode", "regex_hits"]:
+        assert(pipeline_stats.counters[name] == serial_stats.counters[name])
+
+
+def test_pipeline_uses_scan_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    files = get_files(tmp_path, 10)
+
+    # Push the mtimes well outside the racy window so the entries get stored
+    for file_name in files:
+        os.utime(file_name, ns=(10**18, 10**18))
+
+    scan_cache = cache.ScanCache(str(tmp_path), "@", tags, priorities)
+    first = flatten(pipeline.scan_files(get_scanner(), files, scan_cache))
+    scan_cache.save()
+
+    stats = metrics.ScanStats()
+    scan_cache = cache.ScanCache(str(tmp_path), "@", tags, priorities)
+    second = flatten(pipeline.scan_files(get_scanner(True), files, scan_cache, stats))
+
+    assert(first == second)
+    assert(stats.counters["files_from_cache"] == len(files))
+
+
+def test_first_results_arrive_before_walk_ends(tmp_path):
+    files = get_files(tmp_path, 3)
+    first_result_seen = threading.Event()
+    was_seen_during_walk = []
+
+    def walk():
+        yield files[0]
+        # A slow walk, which is still going until the first result has been handed out
+        was_seen_during_walk.append(first_result_seen.wait(10))
+        yield from files[1:]
+
+    results = []
+
+    for result in pipeline.scan_files(get_scanner(), walk()):
+        first_result_seen.set()
+        results.append(result)
+
+    assert(was_seen_during_walk == [True])
+    assert(flatten(results) == flatten(tagg.scan_files(get_scanner(), files)))
+
+
+def test_walk_is_held_back_by_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "WINDOW_SIZE", 4)
+    files = get_files(tmp_path, 50)
+    walked = []
+
+    def walk():
+        for file_name in files:
+            walked.append(file_name)
+            yield file_name
+
+    results = pipeline.scan_files(get_scanner(), walk())
+    next(results)
+    # Give the walker every chance to run ahead
+    threading.Event().wait(0.2)
+
+    # The file being handed out plus the rest of the window, and one more waiting for room
+    assert(len(walked) <= 4 + 1)
+
+    results.close()
+
+
+def test_stopping_early_stops_the_walk(tmp_path):
+    files = get_files(tmp_path, 1000)
+    walked = []
+
+    def walk():
+        for file_name in files:
+            walked.append(file_name)
+            yield file_name
+
+    for _ in pipeline.scan_files(get_scanner(), walk()):
+        break
+
+    assert(len(walked) < len(files))
+
+
+def test_walk_errors_are_raised(tmp_path):
+    files = get_files(tmp_path, 3)
+
+    def walk():
+        yield files[0]
+        raise OSError("Walk failed")
+
+    with pytest.raises(OSError):
+        list(pipeline.scan_files(get_scanner(), walk()))
+
+
+def test_read_errors_are_raised_without_hanging(tmp_path):
+    # More files than fit in the window, so a lost result would block the walk for good
+    files = get_files(tmp_path, pipeline.WINDOW_SIZE * 2)
+    unreadable = files[10]
+
+    class FailingScanner(tagg.FileScanner):
+        def read(self, file_name, stats=None):
+            if file_name == unreadable:
+                raise PermissionError(13, "Permission denied", file_name)
+            return super().read(file_name, stats)
+
+    scanner = get_scanner()
+    scanner.__class__ = FailingScanner
+    errors = []
+    results = []
+
+    def scan():
+        try:
+            for result in pipeline.scan_files(scanner, (f for f in files)):
+                results.append(result)
+        except PermissionError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=scan, daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert(not thread.is_alive())
+    assert(len(errors) == 1)
+    # Everything walked before the unreadable file still came out
+    assert([file_name for file_name, _ in results] == files[:10])
@@ -26,3 +26,38 @@ def test_get_priority_to_colour_map():
     actual_colour_map = printer.get_priority_to_colour_map(priority_value_map)
 
     assert(expected_colour_map == actual_colour_map)
+
+def get_random_matches(count):
+    import random
+    from taggregator import tagg
+
+    rng = random.Random(1)
+    return [tagg.Match("file_%d.py" % i, i, "@%s line %d" % (tag, i), tag, priority)
+            for i, (tag, priority) in enumerate(
+                (rng.choice(["TODO", "BUG", "HACK"]), rng.randint(-1, 2)) for _ in range(count))]
+
+@pytest.mark.parametrize("limit,page", [(None, None), (10, None), (10, 3), (None, 2), (7, 15), (1000, 1)])
+def test_get_page_matches_full_sort(limit, page):
+    matches = get_random_matches(100)
+    # How print_priority_sections orders every match
+    full_order = sorted(matches, key=lambda m: (-m.priority, m.tag))
+    page_size = limit or printer.DEFAULT_PAGE_SIZE
+    start = page_size * ((page or 1) - 1)
+    expected = full_order[start:start + page_size] if limit or page else matches
+
+    assert(printer.get_page(matches, limit, page) == expected)
+
+def test_print_matches_page(capsys):
+    matches = get_random_matches(100)
+    matches.append(printer.tagg.Match("a_very_long_file_name_indeed.py", 1, "@TODO low", "TODO", -1))
+    priority_value_map = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+    printer.print_matches(list(matches), "@", priority_value_map, limit=5, summary_first=True)
+    lines = capsys.readouterr().out.splitlines()
+    rows = [line for line in lines if line.startswith("file_")]
+
+    assert(len(rows) == 5)
+    # Columns are only as wide as the rows shown need
+    assert(max(len(row.split(":")[0]) for row in rows) <= len("file_100.py") + 2)
+    assert(lines[2].startswith("101 tags ("))
+    assert(lines[-1] == "Showing tags 1-5 of 101, use --page 2 for more")
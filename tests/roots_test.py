@@ -0,0 +1,71 @@
+import argparse
+import os
+from taggregator import config
+from taggregator import printer
+from taggregator import tagg
+from taggregator import walker
+
+priority_value_map = tagg.get_priority_value_map(["LOW", "MEDIUM", "HIGH"])
+
+
+def make_tree(tmp_path):
+    for name in ["a", "b", os.path.join("b", "inner")]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "file.txt").write_text("// @TODO(HIGH) %s\n" % name)
+
+
+def test_nested_and_repeated_roots_are_dropped(tmp_path):
+    make_tree(tmp_path)
+    a = str(tmp_path / "a")
+    b = str(tmp_path / "b")
+    inner = str(tmp_path / "b" / "inner")
+
+    assert(config.get_outermost_roots([inner, a, b, a + os.sep]) == [a, b])
+
+
+def test_roots_file(tmp_path):
+    make_tree(tmp_path)
+    roots_file = tmp_path / "roots.txt"
+    roots_file.write_text("# services\n%s\n\n%s\n" % (tmp_path / "b", tmp_path / "b" / "inner"))
+    raw_args = argparse.Namespace(root=[str(tmp_path / "a")], roots_file=str(roots_file))
+
+    assert(config.get_roots(raw_args) == [str(tmp_path / "a"), str(tmp_path / "b")])
+
+
+def test_all_roots_are_walked(tmp_path):
+    make_tree(tmp_path)
+    roots = [str(tmp_path / "b"), str(tmp_path / "a")]
+    config_map = {
+        "root": str(tmp_path),
+        "roots": roots,
+        "exclude": [],
+        "extensions": ["txt"],
+    }
+    walk_stats = walker.WalkStats()
+    files = tagg.get_all_files(config_map, walk_stats)
+
+    assert(files == [
+        os.path.join(roots[0], "file.txt"),
+        os.path.join(roots[0], "inner", "file.txt"),
+        os.path.join(roots[1], "file.txt")])
+    assert(walk_stats.dirs_walked == 3)
+
+
+def test_matches_grouped_by_root(capsys):
+    roots = [os.path.join(os.sep, "a"), os.path.join(os.sep, "b")]
+    matches = [
+        tagg.Match(os.path.join(roots[1], "x.txt"), 1, "@TODO(HIGH) x", "TODO", 2),
+        tagg.Match(os.path.join(roots[1], "y.txt"), 1, "@TODO y", "TODO", tagg.Match.NO_PRIORITY),
+        tagg.Match(os.path.join(roots[0], "z.txt"), 1, "@TODO(LOW) z", "TODO", 0),
+    ]
+
+    assert([(root, len(root_matches)) for root, root_matches in
+            printer.get_matches_by_root(matches, roots)] == [(roots[0], 1), (roots[1], 2)])
+    assert(printer.get_totals_text(matches[:2], priority_value_map) ==
+           "2 tags (1 HIGH, 1 unprioritised)")
+
+    printer.print_matches(matches, "@", priority_value_map, roots=roots)
+    output = capsys.readouterr().out
+
+    assert(output.index(roots[0] + ": 1 tag (1 LOW)") < output.index(roots[1] + ": 2 tags"))
+    assert("Total: 3 tags (1 HIGH, 1 LOW, 1 unprioritised) in 2 roots" in output)
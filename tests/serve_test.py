@@ -0,0 +1,82 @@
+import os
+import pytest
+import socket
+import tempfile
+import threading
+from taggregator import serve
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix domain sockets aren't available")
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "tag_marker": "@",
+        "tags": ["TODO", "HACK"],
+        "priorities": ["LOW", "MEDIUM", "HIGH"],
+        "extensions": ["txt"],
+        "exclude": [],
+    }
+
+
+def write(path, contents, mtime_ns):
+    path.write_text(contents)
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_queries_are_filtered(tmp_path):
+    (tmp_path / "sub").mkdir()
+    write(tmp_path / "a.txt", "// @TODO(HIGH) a\n// @HACK(LOW) a\n", 10**18)
+    write(tmp_path / "sub" / "b.txt", "// @TODO(MEDIUM) b\n", 10**18)
+    server = serve.TagServer(get_config_map(tmp_path), None)
+    server.start()
+
+    def get_lines(request):
+        return sorted(m[2] for m in server.answer(request)["matches"])
+
+    assert(len(get_lines({})) == 3)
+    assert(get_lines({"tags": ["hack"]}) == ["// @HACK(LOW) a"])
+    assert(get_lines({"min_priority": "medium"}) == ["// @TODO(HIGH) a", "// @TODO(MEDIUM) b"])
+    assert(get_lines({"path_prefix": str(tmp_path / "sub")}) == ["// @TODO(MEDIUM) b"])
+    assert("error" in server.answer({"min_priority": "URGENT"}))
+
+
+def test_changes_are_seen_before_answering(tmp_path):
+    write(tmp_path / "a.txt", "// @TODO(HIGH) a\n", 10**18)
+    server = serve.TagServer(get_config_map(tmp_path), None)
+    server.start()
+    assert(len(server.answer({})["matches"]) == 1)
+
+    (tmp_path / "b.txt").write_text("// @HACK new\n")
+    write(tmp_path / "a.txt", "// @HACK(LOW) a\n", 10**18)
+
+    assert(sorted(m[3] for m in server.answer({})["matches"]) == ["HACK", "HACK"])
+
+
+def test_query_over_socket(tmp_path):
+    write(tmp_path / "a.txt", "// @TODO(HIGH) a\n", 10**18)
+    socket_path = os.path.join(tempfile.mkdtemp(), "tagg.sock")
+    server = serve.TagServer(get_config_map(tmp_path), socket_path)
+    server.start()
+    server_socket = serve.bind_socket(socket_path)
+
+    def handle_one():
+        connection, _ = server_socket.accept()
+        server.handle(connection)
+
+    thread = threading.Thread(target=handle_one)
+    thread.start()
+
+    try:
+        reply = serve.query(socket_path, {"tags": ["TODO"]})
+    finally:
+        thread.join()
+        server_socket.close()
+
+    matches = serve.get_reply_matches(reply)
+    assert([(m.file_name, m.line_number, m.tag, m.priority) for m in matches] ==
+           [(str(tmp_path / "a.txt"), 1, "TODO", 2)])
+
+    with pytest.raises(OSError):
+        serve.query(socket_path, {})
@@ -0,0 +1,115 @@
+import os
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from taggregator import printer
+from taggregator import shard
+from taggregator import tagg
+
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+def get_config_map(root, tags=("TODO", "BUG")):
+    return {
+        "root": str(root),
+        "exclude": [],
+        "extensions": ["txt"],
+        "tag_marker": "@",
+        "tags": set(tags),
+        "priorities": priorities,
+    }
+
+
+def make_tree(root, count):
+    for i in range(count):
+        path = root / ("dir_%d" % (i % 3)) / ("file_%d.txt" % i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("// @TODO(%s) %d\n// @BUG %d\n" % (priorities[i % 3], i, i))
+
+
+def scan_shard_to_file(config_map, shard_number, shard_count, path):
+    # Runs in a worker process standing in for a machine of its own
+    shard.write_partial(path, shard.scan_shard(config_map, shard_number, shard_count))
+    return path
+
+
+def test_parse_shard():
+    assert(shard.parse_shard("2/8") == (2, 8))
+
+    for spec in ["0/8", "9/8", "2", "a/b", "1/2/3"]:
+        with pytest.raises(ValueError):
+            shard.parse_shard(spec)
+
+
+def test_every_file_is_in_exactly_one_shard():
+    paths = [os.path.join("dir_%d" % (i % 7), "file_%d.txt" % i) for i in range(1000)]
+    shard_numbers = [shard.get_shard_number(path, 4) for path in paths]
+
+    assert(set(shard_numbers) == {1, 2, 3, 4})
+    # The same path always lands in the same shard
+    assert(shard_numbers == [shard.get_shard_number(path, 4) for path in paths])
+
+
+def test_merged_shards_print_the_same_as_a_single_run(tmp_path, capsys):
+    root = tmp_path / "root"
+    make_tree(root, 60)
+    config_map = get_config_map(root)
+    priority_value_map = tagg.get_priority_value_map(priorities)
+
+    single_matches = tagg.get_unique_matches(matches for _, matches in tagg.scan_files(
+        tagg.get_file_scanner(config_map), tagg.get_all_files(config_map)))
+    printer.print_matches(single_matches, "@", priority_value_map)
+    single_output = capsys.readouterr().out
+
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        paths = list(pool.map(
+            scan_shard_to_file,
+            [config_map] * 3,
+            [1, 2, 3],
+            [3] * 3,
+            [str(tmp_path / ("shard_%d.json.gz" % k)) for k in [1, 2, 3]]))
+
+    # Shards can be given in any order, and repeating one doesn't duplicate its matches
+    partials = [shard.read_partial(path) for path in reversed(paths + paths[:1])]
+    merged_matches = shard.merge_partials(partials)
+    printer.print_matches(merged_matches, "@", priority_value_map)
+
+    assert(len(merged_matches) == 120)
+    assert(capsys.readouterr().out == single_output)
+
+
+def test_merge_rejects_incomplete_or_mismatched_shards(tmp_path):
+    root = tmp_path / "root"
+    make_tree(root, 10)
+
+    first = shard.scan_shard(get_config_map(root), 1, 2)
+    second = shard.scan_shard(get_config_map(root), 2, 2)
+    other_tags = shard.scan_shard(get_config_map(root, ["TODO"]), 2, 2)
+
+    with pytest.raises(ValueError):
+        shard.merge_partials([first])
+
+    with pytest.raises(ValueError):
+        shard.merge_partials([first, other_tags])
+
+    two_roots_config_map = get_config_map(root)
+    two_roots_config_map["roots"] = [str(root / "dir_0"), str(root / "dir_1")]
+
+    with pytest.raises(ValueError):
+        shard.merge_partials([first, shard.scan_shard(two_roots_config_map, 2, 2)])
+
+    assert(len(shard.merge_partials([first, second])) == 20)
+
+
+def test_shards_can_be_scanned_from_checkouts_at_different_paths(tmp_path):
+    root = tmp_path / "machine_1" / "checkout"
+    other_root = tmp_path / "machine_2" / "src"
+    make_tree(root, 10)
+    make_tree(other_root, 10)
+
+    merged_matches = shard.merge_partials([
+        shard.scan_shard(get_config_map(root), 1, 2),
+        shard.scan_shard(get_config_map(other_root), 2, 2)])
+    single_matches = tagg.get_unique_matches(matches for _, matches in tagg.scan_files(
+        tagg.get_file_scanner(get_config_map(root)), tagg.get_all_files(get_config_map(root))))
+
+    assert(merged_matches == single_matches)
@@ -0,0 +1,55 @@
+import pytest
+from taggregator import sniff
+from taggregator import tagg
+
+tags = ["TODO", "HACK"]
+priorities = ["LOW", "MEDIUM", "HIGH"]
+
+
+@pytest.mark.parametrize("head, file_size, expected", [
+    (b"// @TODO(HIGH) plain text\n", 26, None),
+    (b"\x89PNG\r\n\x1a\n@TODO in a png", 100, sniff.BINARY),
+    (b"PK\x03\x04@TODO in a jar", 100, sniff.BINARY),
+    (b"@TODO before a NUL\x00", 100, sniff.BINARY),
+    (b"@TODO \xff\xfe not utf-8", 100, sniff.NOT_UTF8),
+    # A character cut in half by the end of the head is fine, unless that's the end of the file
+    ("@TODO é".encode("utf-8")[:-1], 100, None),
+    ("@TODO é".encode("utf-8")[:-1], 7, sniff.NOT_UTF8),
+])
+def test_get_rejection(head, file_size, expected):
+    assert(sniff.get_rejection(head, file_size) == expected)
+
+
+def test_not_utf8_check_can_be_turned_off():
+    assert(sniff.get_rejection(b"\xff\xfe", 2, check_utf8=False) is None)
+
+
+def test_max_file_size():
+    assert(sniff.get_rejection(b"@TODO", 5, max_file_size=4) == sniff.TOO_LARGE)
+    assert(sniff.get_rejection(b"@TODO", 5, max_file_size=5) is None)
+
+
+@pytest.mark.parametrize("candidate_finder", [None, tagg.get_candidate_finder("@", tags)])
+def test_rejected_files_are_not_read(tmp_path, candidate_finder):
+    tag_regex = tagg.get_tag_regex("@", tags, tagg.get_priority_regex(priorities))
+    scanner = tagg.FileScanner(
+        tag_regex,
+        tags,
+        tagg.get_priority_value_map(priorities),
+        candidate_finder,
+        keep_stats=True,
+        max_file_size=100 * 1024)
+    binary = tmp_path / "image.png"
+    binary.write_bytes(b"\x89PNG\r\n\x1a\n" + b"@TODO(HIGH) " * 5000)
+    large = tmp_path / "large.txt"
+    large.write_bytes(b"// @TODO(HIGH) too big to search\n" * 5000)
+    small = tmp_path / "small.txt"
+    small.write_bytes(b"// @TODO(HIGH) small\n")
+
+    results, stats = scanner.scan_batch([str(binary), str(large), str(small)])
+
+    assert([len(matches) for matches in results] == [0, 0, 1])
+    assert(stats.counters["files_skipped_binary"] == 1)
+    assert(stats.counters["files_skipped_too_large"] == 1)
+    assert(stats.counters["bytes_not_read"] >= large.stat().st_size +
+           binary.stat().st_size - sniff.SNIFF_SIZE)
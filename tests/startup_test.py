@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+from taggregator import config
+from taggregator import printer
+
+# Import time of taggregator.__main__ and everything it imports, in microseconds.
+# Generous so that slow CI machines pass, but far below the ~250ms taken when
+# pkg_resources and concurrent.futures were imported up front.
+STARTUP_BUDGET_US = 150000
+# Only some commands need these, so importing them up front slows down every other one
+LAZY_MODULES = [
+    "asyncio",
+    "cProfile",
+    "concurrent.futures",
+    "ctypes",
+    "multiprocessing",
+    "pkg_resources",
+    "socket",
+    "sqlite3",
+    "statistics",
+    "subprocess",
+]
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True,
+        universal_newlines=True)
+
+
+def get_import_time_us():
+    stderr = run_python("-X", "importtime", "-c", "import taggregator.__main__").stderr
+
+    for line in stderr.splitlines():
+        fields = line.split("|")
+
+        if len(fields) == 3 and fields[2].strip() == "taggregator.__main__":
+            return int(fields[1])
+
+    raise AssertionError("No import time reported for taggregator.__main__")
+
+
+def test_import_time_is_within_budget():
+    # Best of a few runs, since the first may be paying to fill the disk cache
+    assert(min(get_import_time_us() for _ in range(3)) < STARTUP_BUDGET_US)
+
+
+def test_heavy_modules_are_imported_lazily():
+    imported_modules = json.loads(run_python(
+        "-c", "import json, sys, taggregator.__main__; print(json.dumps(sorted(sys.modules)))").stdout)
+
+    assert([m for m in LAZY_MODULES if m in imported_modules] == [])
+
+
+def test_config_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.chdir(str(tmp_path))
+    config_path = tmp_path / config.CONFIG_FILE_NAME
+    config_path.write_text(json.dumps({"tag_marker": "#", "tags": ["TODO"]}))
+    # Old enough that the cache entry is trusted
+    os.utime(str(config_path), ns=(10**18, 10**18))
+
+    config_map = config.get_config_map()
+    assert(config_map["tag_marker"] == "#")
+    # Missing keys were filled in and written back in one go
+    assert(sorted(json.loads(config_path.read_text())) ==
+           sorted(config.get_default_config_json()))
+
+    os.utime(str(config_path), ns=(10**18, 10**18))
+    config.get_config_map()
+    cache_path = config.get_config_cache_path(str(config_path))
+    assert(os.path.isfile(cache_path))
+    assert(config.read_config_cache(cache_path, config.get_config_key(str(config_path))) ==
+           config_map)
+
+    # Editing the file invalidates the cache
+    config_map["tag_marker"] = "@"
+    config_path.write_text(json.dumps(config_map))
+    os.utime(str(config_path), ns=(2 * 10**18, 2 * 10**18))
+    assert(config.get_config_map()["tag_marker"] == "@")
+
+
+def test_config_warnings_can_go_to_stderr(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.chdir(str(tmp_path))
+    monkeypatch.setattr(printer, "log_file", None)
+    config_path = tmp_path / config.CONFIG_FILE_NAME
+    config_path.write_text(json.dumps({"tag_marker": "@", "tags": ["TODO"]}))
+
+    printer.set_log_file(sys.stderr)
+    config.get_config_map()
+    captured = capsys.readouterr()
+
+    assert(captured.out == "")
+    assert("Found unset config property: 'max_file_size'" in captured.err)
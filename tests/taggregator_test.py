@@ -1,6 +1,7 @@
 import os
 import pytest
 import re
+from taggregator import metrics
 from taggregator import tagg
 
 tags = ["TODO", "HACK", "ROBUSTNESS", "SPEED"]
@@ -90,3 +91,221 @@ def test_multi_tags_line_with_not_all_priorities_match():
     assert(matches[0][1] == "")
     assert(matches[1][0] == "HACK")
     assert(matches[1][1] == "LOW")
+
+def test_match_is_hashable_on_equality_fields():
+    a = tagg.Match("a.txt", 3, "// @TODO one", "TODO", 2)
+    b = tagg.Match("a.txt", "3", "// @TODO two", "TODO", 0)
+    c = tagg.Match("a.txt", 4, "// @TODO one", "TODO", 2)
+
+    assert(a == b)
+    assert(a != c)
+    assert(len({a, b, c}) == 2)
+    assert(a.line_number == 3)
+
+def test_match_has_no_instance_dict():
+    match = tagg.Match("a.txt", 1, "// @TODO", "TODO", 0)
+
+    assert(not hasattr(match, "__dict__"))
+
+def get_match_tuples(matches):
+    return [(m.file_name, m.line_number, m.line, m.tag, m.priority) for m in matches]
+
+def find_matches_both_ways(file_name):
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+    text_matches = tagg.find_matches(tag_regex, tags, file_name, priority_value_map)
+    mmap_matches = tagg.find_matches_mmap(tag_regex, tags, file_name, priority_value_map, tagg.get_candidate_finder("@", tags))
+
+    return get_match_tuples(text_matches), get_match_tuples(mmap_matches)
+
+def test_find_matches_mmap_matches_find_matches():
+    text_matches, mmap_matches = find_matches_both_ways(os.path.join(os.getcwd(), "taggregator/example_files/test.txt"))
+
+    assert(len(text_matches) == 14)
+    assert(text_matches == mmap_matches)
+
+edge_case_contents = [
+    b"",
+    b"no tags at all\n",
+    b"a\r\nb @TODO(HIGH) crlf\r\nc @HACK lone cr\rd @speed(low)\n",
+    b"@TODO(HIGH) first line\n\n\n   @todo   (  medium ) @HACK(LOW) last line no newline",
+    b"@TODO(HIGH) tag in a file which isn't utf-8 \xff\xfe\n",
+    "@TODO(HIGH) éè non-ascii line\n @HACK (LOW)\n".encode("utf-8"),
+    "@HACK(HIGH) kelvin sign folds to k\n@TODO(LOW)\n".encode("utf-8"),
+    "@ſPEED(HIGH) long s folds to s\n".encode("utf-8"),
+    b"\xef\xbb\xbf@TODO(HIGH) after a byte order mark\n",
+]
+
+@pytest.mark.parametrize("contents", edge_case_contents)
+def test_find_matches_mmap_edge_cases(tmp_path, contents):
+    path = tmp_path / "file.txt"
+    path.write_bytes(contents)
+
+    text_matches, mmap_matches = find_matches_both_ways(str(path))
+
+    assert(text_matches == mmap_matches)
+
+def test_get_line_break_count_keeps_crlf_pairs_across_chunks():
+    buffer = b"a\r\nb\rc\nd\r\n\r\ne"
+
+    for chunk_size in range(1, len(buffer) + 1):
+        assert(tagg.get_line_break_count(buffer, 0, len(buffer), chunk_size) == 5)
+
+@pytest.mark.parametrize("contents", edge_case_contents + [
+    b"@HACK @TODO two candidates on one line\n@TODO\nno tag\n\n@SPEED",
+    b"@@TODO marker twice\n@NOTATAG\n@ todo\n",
+])
+def test_prefilter_matches_full_scan(tmp_path, contents):
+    path = tmp_path / "file.txt"
+    path.write_bytes(contents)
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+
+    # tag_regex run on every line, which the prefilter must never change the result of
+    try:
+        with open(str(path)) as f:
+            lines = f.read().split("\n")
+    except UnicodeDecodeError:
+        lines = []
+
+    full_scan_matches = [m for number, line in enumerate(lines, 1) for m in tagg.get_line_matches(
+        tag_regex, str(path), number, line, priority_value_map)]
+    prefiltered_matches = tagg.find_matches(tag_regex, tags, str(path), priority_value_map,
+                                            prefilter_regex=tagg.get_prefilter_regex("@", tags))
+
+    assert(get_match_tuples(full_scan_matches) == get_match_tuples(prefiltered_matches))
+
+def test_get_candidate_lines():
+    prefilter_regex = tagg.get_prefilter_regex("@", tags)
+    contents = "one\n@todo two @HACK\nthree\n\n@speed five"
+
+    assert(tagg.get_candidate_lines(contents, prefilter_regex) ==
+           [(2, "@todo two @HACK"), (5, "@speed five")])
+    assert(tagg.get_candidate_lines("HACK TODO without the marker", prefilter_regex) == [])
+
+@pytest.mark.parametrize("contents", edge_case_contents + [
+    b"@TODO(HIGH) ends with a line break\n",
+    b"\n\n@HACK(LOW) after blank lines\r\n\r\n@TODO last",
+    b"@TODO(HIGH) fine at the start but not utf-8 at the end " + b"x" * 50 + b"\xff",
+])
+@pytest.mark.parametrize("use_prefilter", [False, True])
+def test_find_matches_streamed_matches_find_matches(tmp_path, contents, use_prefilter):
+    path = tmp_path / "file.txt"
+    path.write_bytes(contents)
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+    prefilter_regex = tagg.get_prefilter_regex("@", tags)
+    # The whole-file path with the prefilter finds every match, unlike its lower()
+    # fallback, so it's what the streamed path should agree with either way
+    whole_file_matches = get_match_tuples(tagg.find_matches(
+        tag_regex, tags, str(path), priority_value_map, prefilter_regex=prefilter_regex))
+
+    if not use_prefilter:
+        prefilter_regex = None
+
+    # Every chunk size, so that tags and '\r\n' pairs are split at every possible place
+    for chunk_size in range(1, len(contents) + 2):
+        with open(str(path)) as f:
+            streamed_matches = get_match_tuples(tagg.find_matches_streamed(
+                f, tag_regex, str(path), priority_value_map, None, prefilter_regex, chunk_size))
+
+        assert(streamed_matches == whole_file_matches)
+
+def test_large_files_are_streamed_in_bounded_memory(tmp_path, monkeypatch):
+    import tracemalloc
+
+    monkeypatch.setattr(tagg, "STREAM_CHUNK_SIZE", 64 * 1024)
+
+    path = tmp_path / "dump.sql"
+    line = "INSERT INTO t VALUES (1, 'nothing to see here');\n"
+
+    with open(str(path), "w") as f:
+        for i in range(40000):
+            f.write("-- @TODO(HIGH) row %d\n" % i if i % 10000 == 0 else line)
+
+    file_size = path.stat().st_size
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+    prefilter_regex = tagg.get_prefilter_regex("@", tags)
+
+    tracemalloc.start()
+
+    try:
+        matches = list(tagg.find_matches(tag_regex, tags, str(path), priority_value_map,
+                                         prefilter_regex=prefilter_regex, stream_threshold=64 * 1024))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert([m.line_number for m in matches] == [1, 10001, 20001, 30001])
+    assert(peak < file_size / 4)
+
+def test_streamed_lines_longer_than_a_chunk(tmp_path):
+    path = tmp_path / "minified.js"
+    path.write_text("@TODO(HIGH) before\n" + "x" * 100000 + " @HACK(LOW) in the long line\n@TODO after")
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+    prefilter_regex = tagg.get_prefilter_regex("@", tags)
+    whole_file_matches = get_match_tuples(tagg.find_matches(
+        tag_regex, tags, str(path), priority_value_map, prefilter_regex=prefilter_regex))
+
+    with open(str(path)) as f:
+        assert(get_match_tuples(tagg.find_matches_streamed(
+            f, tag_regex, str(path), priority_value_map, None, prefilter_regex, 1000)) ==
+            whole_file_matches)
+
+    # Too long to hold, so it's searched a piece at a time, with the same matches
+    stats = metrics.ScanStats()
+
+    with open(str(path)) as f:
+        assert(get_match_tuples(tagg.find_matches_streamed(
+            f, tag_regex, str(path), priority_value_map, stats, prefilter_regex, 1000, 10000)) ==
+            whole_file_matches)
+
+    assert(stats.counters["long_lines_searched_in_pieces"] == 1)
+
+@pytest.mark.parametrize("contents", [
+    "@TODO(HIGH) at the start" + " x" * 40 + " @HACK ( medium ) @todo(LOW)@TODO",
+    "   \t  leading whitespace" + "x" * 60 + "@HACK(LOW)" + " " * 50 + "\n@TODO after",
+    "@TODO" + " " * 80 + "(" + " " * 30 + "MEDIUM) @HACK" + " " * 40,
+    "short @TODO(HIGH) text" + " " * 120 + "\n" + "@hack(low)" * 20,
+])
+def test_long_lines_searched_in_pieces_match_find_matches(tmp_path, monkeypatch, contents):
+    # Small enough that tags are split and held back at every possible place
+    monkeypatch.setattr(tagg, "STREAM_TAG_LOOKAHEAD", 16)
+    path = tmp_path / "file.txt"
+    path.write_text(contents)
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+    prefilter_regex = tagg.get_prefilter_regex("@", tags)
+    whole_file_matches = get_match_tuples(tagg.find_matches(
+        tag_regex, tags, str(path), priority_value_map, prefilter_regex=prefilter_regex))
+
+    for chunk_size in range(1, 40):
+        for max_line_length in [1, 20, 64]:
+            with open(str(path)) as f:
+                assert(get_match_tuples(tagg.find_matches_streamed(
+                    f, tag_regex, str(path), priority_value_map, None, prefilter_regex,
+                    chunk_size, max_line_length)) == whole_file_matches)
+
+def test_streamed_long_line_memory_is_bounded(tmp_path):
+    import tracemalloc
+
+    path = tmp_path / "one_line.txt"
+    path.write_text("y" * (4 * 1024 * 1024) + "\n@TODO(HIGH) end")
+    tag_regex = get_compiled_regex()
+    priority_value_map = tagg.get_priority_value_map(priorities)
+
+    tracemalloc.start()
+
+    try:
+        with open(str(path)) as f:
+            matches = list(tagg.find_matches_streamed(
+                f, tag_regex, str(path), priority_value_map, None,
+                tagg.get_prefilter_regex("@", tags), 64 * 1024, 256 * 1024))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert([m.line_number for m in matches] == [2])
+    assert(peak < 1024 * 1024)
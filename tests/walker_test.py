@@ -0,0 +1,80 @@
+import os
+import pytest
+from taggregator import walker
+
+
+def make_tree(tmp_path, paths):
+    for path in paths:
+        full_path = tmp_path / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text("// @TODO\n")
+
+
+def walk(tmp_path, exclude, extensions=["*"]):
+    path_matcher = walker.PathMatcher(str(tmp_path), exclude, extensions)
+    walk_stats = walker.WalkStats()
+    files = [os.path.relpath(f, str(tmp_path))
+             for f in walker.walk(str(tmp_path), path_matcher, walk_stats)]
+
+    return sorted(files), walk_stats
+
+
+def test_walk_prunes_excluded_directories(tmp_path):
+    make_tree(tmp_path, ["a.py", "venv/lib/b.py", "venv/lib/c.py", "src/d.py"])
+
+    files, walk_stats = walk(tmp_path, ["venv/"])
+
+    assert(files == ["a.py", os.path.join("src", "d.py")])
+    assert(walk_stats.dirs_pruned == 1)
+    # venv's contents are never even listed
+    assert(walk_stats.files_walked == 2)
+
+
+def test_walk_order_matches_os_walk(tmp_path):
+    make_tree(tmp_path, ["a.py", "x/b.py", "x/y/c.py", "z/d.py", "e.py"])
+
+    path_matcher = walker.PathMatcher(str(tmp_path), [], ["*"])
+    expected = [os.path.join(root, f)
+                for root, dirs, files in os.walk(str(tmp_path)) for f in files]
+
+    assert(list(walker.walk(str(tmp_path), path_matcher)) == expected)
+
+
+def test_glob_exclude_and_negation(tmp_path):
+    make_tree(tmp_path, ["a.py", "a.min.py", "build/gen.py",
+                         "build/keep/k.py", "build/other/o.py"])
+
+    files, walk_stats = walk(tmp_path, ["*.min.py", "build/", "!build/keep/"])
+
+    assert(files == ["a.py", os.path.join("build", "keep", "k.py")])
+    assert(walk_stats.dirs_pruned == 1)
+    assert(walk_stats.files_excluded == 2)
+
+
+def test_extensions_use_dotted_suffixes(tmp_path):
+    make_tree(tmp_path, ["a.py", "happy", "b.tar.gz", "c.txt", "d.jsx"])
+
+    files, walk_stats = walk(tmp_path, [], ["py", "gz", ".j?x"])
+
+    assert(files == ["a.py", "b.tar.gz", "d.jsx"])
+    assert(walk_stats.files_filtered == 2)
+
+
+def test_extensions_can_be_whole_file_names(tmp_path):
+    make_tree(tmp_path, ["Makefile", "Dockerfile", "a.py", "OldMakefile", "Makefile.bak"])
+
+    files, _ = walk(tmp_path, [], ["Makefile", "Dockerfile"])
+
+    assert(sorted(files) == ["Dockerfile", "Makefile"])
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_walk_skips_files_seen_twice(tmp_path):
+    make_tree(tmp_path, ["a.py"])
+    os.symlink(str(tmp_path / "a.py"), str(tmp_path / "link.py"))
+    os.symlink(str(tmp_path), str(tmp_path / "loop"))
+
+    files, walk_stats = walk(tmp_path, [])
+
+    assert(len(files) == 1)
+    assert(walk_stats.duplicates_skipped == 1)
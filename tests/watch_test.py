@@ -0,0 +1,69 @@
+import os
+import pytest
+from taggregator import watch
+
+
+def get_config_map(root):
+    return {
+        "root": str(root),
+        "tag_marker": "@",
+        "tags": ["TODO", "HACK"],
+        "priorities": ["LOW", "MEDIUM", "HIGH"],
+        "extensions": ["txt"],
+        "exclude": [],
+    }
+
+
+def write(path, contents, mtime_ns):
+    path.write_text(contents)
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_refresh_only_reports_real_changes(tmp_path):
+    write(tmp_path / "a.txt", "// @TODO(HIGH) a\n", 10**18)
+    write(tmp_path / "b.txt", "// nothing\n", 10**18)
+    index = watch.TagIndex(get_config_map(tmp_path))
+
+    assert(index.refresh())
+    assert(len(index.get_matches()) == 1)
+    assert(not index.refresh())
+
+    # Changed on disk but with the same matches
+    write(tmp_path / "b.txt", "// still nothing\n", 2 * 10**18)
+    assert(not index.refresh())
+
+    write(tmp_path / "b.txt", "// @HACK now\n", 3 * 10**18)
+    assert(index.refresh())
+    assert(len(index.get_matches()) == 2)
+
+    os.remove(str(tmp_path / "a.txt"))
+    assert(index.refresh())
+    assert([m.tag for m in index.get_matches()] == ["HACK"])
+
+
+def test_refresh_files_ignores_unwanted_files(tmp_path):
+    write(tmp_path / "a.txt", "// @TODO(HIGH) a\n", 10**18)
+    index = watch.TagIndex(get_config_map(tmp_path))
+    index.refresh()
+
+    write(tmp_path / "a.swp", "// @TODO(HIGH) a\n", 10**18)
+    write(tmp_path / "c.txt", "// @HACK c\n", 10**18)
+
+    assert(index.refresh_files([str(tmp_path / "a.swp"), str(tmp_path / "c.txt")]))
+    assert(len(index.get_matches()) == 2)
+
+
+@pytest.mark.skipif(watch.InotifyWatcher.create() is None, reason="needs inotify")
+def test_inotify_watcher_reports_changed_files(tmp_path):
+    watcher = watch.InotifyWatcher.create()
+
+    try:
+        assert(watcher.watch_dirs([str(tmp_path)]))
+        (tmp_path / "a.txt").write_text("// @TODO\n")
+
+        changed_files, needs_refresh = watcher.wait(timeout=5)
+
+        assert(str(tmp_path / "a.txt") in changed_files)
+        assert(not needs_refresh)
+    finally:
+        watcher.close()